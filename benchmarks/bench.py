@@ -0,0 +1,249 @@
+#!/usr/bin/env python
+"""
+Benchmarks for the fetch -> parse -> render pipeline, fully offline.
+
+Fetches are answered from the recorded fixtures (see fixtures.py) through
+the real openmeteo client, so decoding is timed too. Each result is the best
+per-call time in seconds, compared against benchmarks/baseline.json; a
+result more than --tolerance times its baseline fails the run.
+
+    python benchmarks/bench.py            # compare against the baseline
+    python benchmarks/bench.py --save     # record a new baseline
+    python benchmarks/bench.py -k parse   # only benchmarks matching parse
+
+Baselines are only comparable on the same machine, re-save after moving.
+"""
+import argparse
+import asyncio
+import datetime as dt
+import json
+import platform
+import sys
+import tempfile
+import time
+import timeit
+from collections.abc import Iterator
+from pathlib import Path
+
+import fixtures
+import numpy as np
+
+from clw.iconset import AtlasIconSet, CachedIconSet, LocalIconSet
+from clw.weather import (
+    ElevationTiles,
+    GridCells,
+    SnapshotStore,
+    SunRecord,
+    WeatherProvider,
+    WeatherSession,
+)
+
+BASELINE = Path(__file__).parent / "baseline.json"
+TOLERANCE = 1.5
+REPEAT = 5
+GALLERY_RUNS = 5
+ICON_SIZE = (140, 140)
+ICONS = [(0, "day"), (3, "night"), (61, "day"), (95, "night")]
+GALLERY = ("Gallery render 12h", "Gallery refresh unchanged", "Gallery scroll 1h")
+SCROLLS = 24
+
+
+class _Response:
+    status_code = 200
+
+    def __init__(self, content: bytes):
+        self.content = content
+
+
+    def raise_for_status(self) -> None:
+        pass
+
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class _FixtureHttp:
+    """stands in for the http session, answering every request with a recorded body"""
+    def __init__(self, content: bytes):
+        self.content = content
+
+
+    def get(self, url, params=None, **kwargs):
+        return _Response(self.content)
+
+
+class FixtureSession(WeatherSession):
+    """a WeatherSession serving a recorded flatbuffers or json fixture, the flatbuffers optionally moved to start today"""
+    def __init__(self, days: int, count: int, today: bool = False, encoding: str = "flatbuffers"):
+        if encoding == "json":
+            content = json.dumps(fixtures.load_json(days, count)).encode("utf-8")
+        else:
+            content = fixtures.load_flatbuffers(days, count)
+        super().__init__(session=_FixtureHttp(content))
+        self.shift = np.timedelta64((dt.date.today() - fixtures.FIXTURE_DATE).days, "D") if today else None
+
+
+    def location(self):
+        return fixtures.LOCATION
+
+
+    def fetch_batch(self, batch, batch_params, **kwargs):
+        forecasts = super().fetch_batch(batch, batch_params, **kwargs)
+        if self.shift:
+            for forecast in {id(forecast): forecast for _, forecast in forecasts}.values(): # shared per cell
+                forecast.times = forecast.times + self.shift
+        return forecasts
+
+
+def bench(fn, repeat: int = REPEAT) -> float:
+    """best seconds per call"""
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat, number)) / number
+
+
+def parse_benchmarks():
+    """json and flatbuffers fetch and parse for each fixture size"""
+    for days, count in fixtures.SIZES:
+        hourly = ",".join(fixtures.variables(count))
+        data = fixtures.load_json(days, count)
+        session = FixtureSession(days, count)
+        provider = WeatherProvider(session, fixtures.LOCATION)
+        yield f"parse_weather json {days}d {count}v", lambda provider=provider, data=data: provider.parse_weather(data)
+        json_session = FixtureSession(days, count, encoding="json")
+        yield (f"fetch+parse json {days}d {count}v",
+               lambda provider=provider, session=json_session, hourly=hourly:
+                   provider.parse_weather(session.get_json(fixtures.LOCATION, hourly=hourly)))
+        yield (f"fetch+parse flatbuffers {days}d {count}v",
+               lambda provider=provider, session=session, hourly=hourly:
+                   provider.parse_forecast(session.get(fixtures.LOCATION, hourly=hourly)))
+
+
+def sun_benchmarks():
+    """sun events for 16 days, computed and from the cache"""
+    days = [fixtures.FIXTURE_DATE + dt.timedelta(days=i) for i in range(16)]
+
+    def cold():
+        SunRecord.cache.clear()
+        SunRecord.for_days(fixtures.LOCATION, days)
+
+    yield "SunRecord.for_days 16d cold", cold
+    yield "SunRecord.for_days 16d cached", lambda: SunRecord.for_days(fixtures.LOCATION, days)
+
+
+def icon_benchmarks(tmp: Path):
+    """decoding and scaling icons, from png, the atlas and the image cache"""
+    local = LocalIconSet("resources/png")
+    atlas = AtlasIconSet(local, path=tmp / "icons.atlas")
+    atlas.get_image(*ICONS[0]) # build the atlas outside the timing
+    cached = CachedIconSet(atlas)
+
+    def get_all(icons):
+        return lambda: [icons.get_image(code, tod, size=ICON_SIZE) for code, tod in ICONS]
+
+    yield f"LocalIconSet.get_image x{len(ICONS)}", get_all(local)
+    yield f"AtlasIconSet.get_image x{len(ICONS)}", get_all(atlas)
+    yield f"CachedIconSet.get_image x{len(ICONS)} cached", get_all(cached)
+
+    codes = np.resize(np.array(fixtures.WEATHER_CODES, dtype=np.float32), 16 * 24)
+    night = np.resize(np.arange(24) % 24 < 6, 16 * 24)
+    yield "CodeTable.indices 16d", lambda: local.table.indices(codes, night)
+    yield f"IconSet.get_description x{len(ICONS)}", lambda: [local.get_description(code, tod) for code, tod in ICONS]
+
+
+async def _gallery_run(refreshes: int) -> tuple[float, float, float]:
+    """seconds to a filled gallery, per no-change refresh, and per hour scrolled"""
+    from clw.app import Gallery, WeatherApp
+
+    start = time.perf_counter()
+    app = WeatherApp()
+    async with app.run_test(size=(200, 50)) as pilot:
+        await app.workers.wait_for_complete()
+        await pilot.pause()
+        filled = time.perf_counter() - start
+
+        gallery = app.query_one(Gallery)
+        start = time.perf_counter()
+        for _ in range(refreshes):
+            gallery.refresh_weather()
+            await app.workers.wait_for_complete()
+            await pilot.pause()
+        refresh = (time.perf_counter() - start) / refreshes
+
+        start = time.perf_counter()
+        for _ in range(SCROLLS):
+            gallery.scroll_hours(1)
+            await app.workers.wait_for_complete()
+            await pilot.pause()
+        scroll = (time.perf_counter() - start) / SCROLLS
+    return filled, refresh, scroll
+
+
+def gallery_benchmarks(tmp: Path):
+    """a headless Gallery render, 16 days of 4 variables as the app asks for"""
+    from clw.app import Gallery
+
+    WeatherProvider.snapshots = SnapshotStore(tmp / "snapshots")
+    Gallery.provider = WeatherProvider(FixtureSession(16, 4, today=True), fixtures.LOCATION)
+    Gallery.icons = CachedIconSet(AtlasIconSet(LocalIconSet("resources/png"), path=tmp / "icons.atlas"))
+    asyncio.run(_gallery_run(1)) # warm up imports, the atlas and the icon cache
+
+    runs = [asyncio.run(_gallery_run(10)) for _ in range(GALLERY_RUNS)]
+    for name, results in zip(GALLERY, zip(*runs)):
+        yield name, min(results)
+
+
+def run(pattern: str | None) -> Iterator[tuple[str, float]]:
+    """yield (name, seconds) for the benchmarks matching pattern, as each finishes"""
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        WeatherSession.cells = GridCells(tmp / "grid-cells.json") # leave the user's alone
+        WeatherSession.elevations = ElevationTiles(tmp / "elevation.json")
+        for benchmarks in (parse_benchmarks(), sun_benchmarks(), icon_benchmarks(tmp)):
+            for name, fn in benchmarks: # fn is timed before the generator moves on
+                if not pattern or pattern in name:
+                    yield name, bench(fn)
+        if not pattern or any(pattern in name for name in GALLERY):
+            for name, seconds in gallery_benchmarks(tmp):
+                if not pattern or pattern in name:
+                    yield name, seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--save", action="store_true", help="save the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="slowdown over baseline that fails")
+    parser.add_argument("-k", dest="pattern", help="only run benchmarks containing this")
+    args = parser.parse_args()
+
+    baseline = json.loads(BASELINE.read_text(encoding="utf-8"))["results"] if BASELINE.exists() else {}
+    results = {}
+    regressions = []
+    for name, seconds in run(args.pattern):
+        results[name] = seconds
+        line = f"{name:<40} {seconds * 1000:10.3f}ms"
+        if name in baseline:
+            ratio = seconds / baseline[name]
+            line += f" {ratio:6.2f}x"
+            if ratio > args.tolerance:
+                regressions.append(name)
+                line += "  REGRESSION"
+        print(line, flush=True)
+
+    if args.save:
+        if args.pattern: # keep the rest of the baseline
+            results = {**baseline, **results}
+        BASELINE.write_text(json.dumps({
+            "machine": platform.platform(),
+            "python": platform.python_version(),
+            "results": results,
+        }, indent=2) + "\n", encoding="utf-8")
+        print(f"saved {BASELINE}")
+    elif regressions:
+        print(f"FAIL: {len(regressions)} slower than {args.tolerance}x baseline", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""
+Open-Meteo fixtures for the benchmarks: a JSON and a FlatBuffers response
+for each size in SIZES, stored gzipped in benchmarks/fixtures.
+
+The committed fixtures are synthesized, seeded and dated FIXTURE_DATE, so
+they never change under the benchmarks. With network access, --record
+replaces them with live responses for the same sizes.
+
+    python benchmarks/fixtures.py [--record]
+"""
+import argparse
+import datetime as dt
+import gzip
+import json
+from pathlib import Path
+
+import flatbuffers
+import numpy as np
+from astral import LocationInfo
+from openmeteo_sdk.Unit import Unit
+
+FIXTURES = Path(__file__).parent / "fixtures"
+DAYS = (1, 7, 16)
+VARIABLE_COUNTS = (4, 20, 40)
+SIZES = [(days, count) for days in DAYS for count in VARIABLE_COUNTS]
+FIXTURE_DATE = dt.date(2025, 6, 1)
+LOCATION = LocationInfo("Seattle", "WA", "America/Los_Angeles", 47.6062, -122.3321)
+WEATHER_CODES = (0, 1, 2, 3, 45, 48, 51, 53, 61, 63, 65, 71, 80, 95)
+
+# hourly variable -> flatbuffers unit, as requested with temperature_unit=fahrenheit.
+# the first four are WeatherProvider.HOURLY, what the app asks for.
+VARIABLES = {
+    "temperature_2m": "fahrenheit",
+    "relative_humidity_2m": "percentage",
+    "apparent_temperature": "fahrenheit",
+    "weather_code": "wmo_code",
+    "dew_point_2m": "fahrenheit",
+    "precipitation_probability": "percentage",
+    "precipitation": "millimetre",
+    "rain": "millimetre",
+    "showers": "millimetre",
+    "snowfall": "centimetre",
+    "snow_depth": "metre",
+    "pressure_msl": "hectopascal",
+    "surface_pressure": "hectopascal",
+    "cloud_cover": "percentage",
+    "cloud_cover_low": "percentage",
+    "cloud_cover_mid": "percentage",
+    "cloud_cover_high": "percentage",
+    "visibility": "metre",
+    "evapotranspiration": "millimetre",
+    "et0_fao_evapotranspiration": "millimetre",
+    "vapour_pressure_deficit": "kilopascal",
+    "wind_speed_10m": "kilometres_per_hour",
+    "wind_speed_80m": "kilometres_per_hour",
+    "wind_speed_120m": "kilometres_per_hour",
+    "wind_speed_180m": "kilometres_per_hour",
+    "wind_direction_10m": "degree_direction",
+    "wind_direction_80m": "degree_direction",
+    "wind_direction_120m": "degree_direction",
+    "wind_direction_180m": "degree_direction",
+    "wind_gusts_10m": "kilometres_per_hour",
+    "temperature_80m": "fahrenheit",
+    "temperature_120m": "fahrenheit",
+    "temperature_180m": "fahrenheit",
+    "soil_temperature_0cm": "fahrenheit",
+    "soil_temperature_6cm": "fahrenheit",
+    "soil_temperature_18cm": "fahrenheit",
+    "soil_temperature_54cm": "fahrenheit",
+    "soil_moisture_0_to_1cm": "cubic_metre_per_cubic_metre",
+    "soil_moisture_1_to_3cm": "cubic_metre_per_cubic_metre",
+    "uv_index": "dimensionless",
+}
+
+# json "hourly_units" spelling of the units not in clw.weather.UNITS
+JSON_UNITS = {
+    "kilopascal": "kPa",
+    "cubic_metre_per_cubic_metre": "m³/m³",
+}
+
+
+def variables(count: int) -> list[str]:
+    """the first count hourly variables"""
+    return list(VARIABLES)[:count]
+
+
+def path(days: int, count: int, fmt: str) -> Path:
+    """fixture file for a size, fmt is json or fb"""
+    return FIXTURES / f"forecast-{days}d-{count}v.{fmt}.gz"
+
+
+def load_json(days: int, count: int) -> dict:
+    with gzip.open(path(days, count, "json"), "rt", encoding="utf-8") as file:
+        return json.load(file)
+
+
+def load_flatbuffers(days: int, count: int) -> bytes:
+    """the raw response body, size-prefixed messages as the api sends them"""
+    with gzip.open(path(days, count, "fb"), "rb") as file:
+        return file.read()
+
+
+def synthesize(days: int, count: int) -> tuple[dict, bytes]:
+    """seeded json and flatbuffers responses for days of count variables"""
+    from clw.weather import UNITS
+
+    names = variables(count)
+    rng = np.random.default_rng(days * 100 + count)
+    hours = 24 * days
+    start = dt.datetime.combine(FIXTURE_DATE, dt.time(), LOCATION.tzinfo)
+    offset = int(start.utcoffset().total_seconds())
+
+    columns = {}
+    for name in names:
+        if name == "weather_code":
+            columns[name] = rng.choice(WEATHER_CODES, hours).astype(np.float32)
+        else:
+            # a daily cycle plus noise, rounded like the api
+            cycle = 10 * np.sin(np.arange(hours) * 2 * np.pi / 24)
+            columns[name] = np.round(50 + cycle + rng.normal(0, 3, hours), 1).astype(np.float32)
+
+    units = {name: UNITS.get(VARIABLES[name]) or JSON_UNITS.get(VARIABLES[name], "") for name in names}
+    data = {
+        "latitude": LOCATION.latitude,
+        "longitude": LOCATION.longitude,
+        "generationtime_ms": 0.5,
+        "utc_offset_seconds": offset,
+        "timezone": LOCATION.timezone,
+        "timezone_abbreviation": start.tzname(),
+        "elevation": 56.0,
+        "hourly_units": {"time": "iso8601", **units},
+        "hourly": {
+            "time": [(start + dt.timedelta(hours=h)).strftime("%Y-%m-%dT%H:%M") for h in range(hours)],
+            **{name: [float(f"{value:g}") for value in column.tolist()] for name, column in columns.items()},
+        },
+    }
+    return data, _encode(int(start.timestamp()), offset, hours, columns)
+
+
+def record(days: int, count: int) -> tuple[dict, bytes]:
+    """live json and flatbuffers responses, needs network access"""
+    import requests
+
+    from clw.weather import WeatherSession
+
+    params = {
+        "latitude": LOCATION.latitude,
+        "longitude": LOCATION.longitude,
+        "timezone": LOCATION.timezone,
+        "temperature_unit": "fahrenheit",
+        "hourly": ",".join(variables(count)),
+        "forecast_days": days,
+    }
+    data = requests.get(WeatherSession.URL, params, timeout=30)
+    data.raise_for_status()
+    body = requests.get(WeatherSession.URL, dict(params, format="flatbuffers"), timeout=30)
+    body.raise_for_status()
+    return data.json(), body.content
+
+
+def _encode(start: int, offset: int, hours: int, columns: dict[str, np.ndarray]) -> bytes:
+    """a size-prefixed WeatherApiResponse with an hourly section"""
+    builder = flatbuffers.Builder(1024 + hours * len(columns) * 4)
+    variable_offsets = []
+    for name, values in columns.items():
+        vector = builder.CreateNumpyVector(values)
+        builder.StartObject(10) # VariableWithValues
+        builder.PrependUint8Slot(1, getattr(Unit, VARIABLES[name]), 0)
+        builder.PrependUOffsetTRelativeSlot(3, vector, 0)
+        variable_offsets.append(builder.EndObject())
+
+    builder.StartVector(4, len(variable_offsets), 4)
+    for variable in reversed(variable_offsets):
+        builder.PrependUOffsetTRelative(variable)
+    variables_vector = builder.EndVector()
+
+    builder.StartObject(4) # VariablesWithTime
+    builder.PrependInt64Slot(0, start, 0)
+    builder.PrependInt64Slot(1, start + hours * 3600, 0)
+    builder.PrependInt32Slot(2, 3600, 0)
+    builder.PrependUOffsetTRelativeSlot(3, variables_vector, 0)
+    hourly = builder.EndObject()
+
+    builder.StartObject(20) # WeatherApiResponse
+    builder.PrependFloat32Slot(0, LOCATION.latitude, 0)
+    builder.PrependFloat32Slot(1, LOCATION.longitude, 0)
+    builder.PrependInt32Slot(6, offset, 0)
+    builder.PrependUOffsetTRelativeSlot(11, hourly, 0)
+    builder.Finish(builder.EndObject())
+    message = bytes(builder.Output())
+    return len(message).to_bytes(4, "little") + message
+
+
+def _write(file_path: Path, content: bytes) -> None:
+    # no name or mtime in the header keeps regenerated fixtures byte-identical
+    with open(file_path, "wb") as raw, gzip.GzipFile("", "wb", fileobj=raw, mtime=0) as file:
+        file.write(content)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--record", action="store_true", help="fetch live responses instead")
+    args = parser.parse_args()
+
+    FIXTURES.mkdir(exist_ok=True)
+    for days, count in SIZES:
+        data, body = (record if args.record else synthesize)(days, count)
+        _write(path(days, count, "json"), json.dumps(data, separators=(",", ":")).encode("utf-8"))
+        _write(path(days, count, "fb"), body)
+        print(path(days, count, "json"), path(days, count, "fb"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,27 @@
+#!/usr/bin/env python
+"""
+Pack the bundled weather icons into a single decoded RGBA atlas.
+
+clw builds the atlas into the user cache dir on first use; run this to
+build it ahead of time, or to a different path.
+"""
+import argparse
+from pathlib import Path
+
+from clw.iconset import ATLAS_ICON_SIZE, AtlasIconSet, LocalIconSet, build_atlas
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size", type=int, default=ATLAS_ICON_SIZE, help="icon size in pixels")
+    parser.add_argument("path", nargs="?", type=Path, help="atlas file, defaults to the cache dir")
+    args = parser.parse_args()
+
+    source = LocalIconSet("resources/png")
+    path = args.path or AtlasIconSet(source, size=args.size).path
+    build_atlas(source, path, args.size)
+    print(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+"""
+Import-time budget: fail when clw modules get slower to import.
+
+Uses `python -X importtime`, taking the fastest of a few fresh interpreters.
+That heavy modules only load on the code path needing them is tested, in
+tests/test_imports.py.
+"""
+import argparse
+import subprocess
+import sys
+
+# module: budget in ms
+BUDGETS = {
+    "clw.app": 600,
+    "clw.weather": 250,
+    "clw.cli": 50,
+    "clw.iconset": 50,
+}
+
+
+def import_times(module: str) -> dict[str, int]:
+    """cumulative import time in microseconds of every module loaded by importing module"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, check=True)
+
+    times = {}
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def check(module: str, budget_ms: int, repeat: int) -> list[str]:
+    """problems found importing a module"""
+    best_ms = min(import_times(module)[module] for _ in range(repeat)) / 1000
+
+    problems = []
+    if best_ms > budget_ms:
+        problems.append(f"{module} took {best_ms:.0f}ms to import, budget is {budget_ms}ms")
+
+    print(f"{module:<16} {best_ms:6.0f}ms / {budget_ms}ms")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=5, help="fresh interpreters per module")
+    args = parser.parse_args()
+
+    problems = []
+    for module, budget_ms in BUDGETS.items():
+        problems.extend(check(module, budget_ms, args.repeat))
+
+    for problem in problems:
+        print(f"FAIL: {problem}", file=sys.stderr)
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
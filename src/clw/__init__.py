@@ -2,6 +2,8 @@
 """
 Experiments with dawn, sunset and weather
 """
+import os
+from pathlib import Path
 
 # CONSTANTS
 TIMEOUT = 2 #seconds
@@ -15,3 +17,9 @@ EMOJI = {
     "sunset": "🌇",
     "dusk": "🌃",
 }
+
+
+def cache_dir() -> Path:
+    """per-user cache directory, $XDG_CACHE_HOME/clw"""
+    root = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(root, "clw")
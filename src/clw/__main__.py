@@ -3,7 +3,7 @@
 Experiments with dawn, sunset and weather
 """
 
-from clw.app import main
+from clw.cli import main
 
 if __name__ == "__main__":
     main()
@@ -2,24 +2,90 @@
 """Fancy Weather App"""
 
 import datetime as dt
+import itertools
 import logging
+from typing import ClassVar, NamedTuple
 
+from textual import work
 from textual.app import App, ComposeResult
 from textual.containers import Container
 from textual.reactive import reactive
 from textual.widgets import Static
+from textual.worker import get_current_worker
+from textual_image.widget import get_cell_size
 
-from textual_image.widget import Image as AutoImage
-
-from .weather import WeatherProvider, TIME_FORMAT
-from .iconset import IconSet, CachedIconSet, LocalIconSet
-#from .widgets import LogHandlerWidget
+from . import DATETIME_FORMAT, TIME_FORMAT, timing
+from .iconset import AtlasIconSet, CachedIconSet, IconSet, LocalIconSet
+from .widgets import IconImage, LogHandlerWidget, TimingOverlay
 
 log = logging.getLogger(__name__)
 
 
+class Hour(NamedTuple):
+    """what an HourColumn shows, compared between refreshes to find what changed"""
+    title: str
+    display: str
+    icon: tuple[int, str] | None # (weather code, time of day), None for a code without an icon
+    description: str
+    conditions: tuple[str, ...]
+
+
+class HourColumn(Container):
+    """a single hour of weather, painted as a placeholder until the forecast arrives"""
+
+    PLACEHOLDER = "--:--"
+
+    hour: Hour | None = None # being shown
+
+    @property
+    def icon(self) -> tuple[int, str] | None:
+        """(weather code, time of day) being shown"""
+        return self.hour.icon if self.hour else None
+
+
+    def compose(self) -> ComposeResult:
+        """Yields placeholder child widgets."""
+        with timing.span("app.compose.hour"):
+            yield Static("...", classes="display")
+            yield IconImage(None, classes="width-auto height-auto")
+            yield Static("", classes="description")
+            yield Static("", classes="conditions")
+
+
+    def on_mount(self) -> None:
+        """show the placeholder title"""
+        self.border_title = self.PLACEHOLDER
+
+
+    @timing.timed("app.update_hour")
+    def update_hour(self, hour: Hour, image, icon: tuple | None = None) -> None:
+        """show an hour, touching only the widgets that changed. image is the hour's icon, if that changed"""
+        old = self.hour
+        self.hour = hour
+        if old is None or hour.title != old.title:
+            self.border_title = hour.title
+        if old is None or hour.display != old.display:
+            self.query_one(".display", Static).update(hour.display)
+        if old is None or hour.icon != old.icon:
+            self.set_image(image, icon)
+        if old is None or hour.description != old.description:
+            self.query_one(".description", Static).update(hour.description)
+        if old is None or hour.conditions != old.conditions:
+            self.query_one(".conditions", Static).update("\n".join(hour.conditions))
+
+
+    def set_image(self, image, icon: tuple | None = None) -> None:
+        """show a (pre-scaled) icon image, icon is its (image name, size) for the payload cache"""
+        self.query_one(IconImage).show(image, icon)
+
+
 class Gallery(Container):
-    """Weather gallery, paints 12 hours for the current weather"""
+    """Weather gallery, a window of 12 hours scrolling over the whole forecast
+
+    Only the window has widgets. Columns follow their hour as it moves
+    along the window and those that leave it are refilled with the hours
+    coming in, so a scroll step patches just those, however long the
+    forecast is."""
 
     DEFAULT_CSS = """
     Gallery {
@@ -44,60 +110,333 @@ class Gallery(Container):
         .width-100pct {
             width: 100%;
         }
+        .status {
+            dock: bottom;
+            height: 1;
+            padding: 0 1;
+            color: $warning;
+            display: none;
+        }
     }
     """
 
+    HOURS = 12
+    REFRESH_INTERVAL = 60 # seconds, to follow the clock, the forecast is only re-fetched when a new model is out
+
     image_type: reactive[str | None] = reactive(None, recompose=True)
-    icons: IconSet = CachedIconSet(LocalIconSet("resources/png"))
+    icons: IconSet = CachedIconSet(AtlasIconSet(LocalIconSet("resources/png")))
+
+    provider = None # WeatherProvider, kept across refreshes and recomposes
+    days: dict | None = None # date -> DailyRecord being shown
+    expires: dt.datetime | None = None # when a newer forecast is expected
+    start: dt.datetime | None = None # first hour shown when scrolled, None to follow the clock
+    status_text = ""
+
+    def __init__(self, offline: bool = False, location=None, **kwargs):
+        """offline: show the saved forecast, without fetching
+        location: the LocationInfo to show, None to look up my location"""
+        super().__init__(**kwargs)
+        self.offline = offline
+        self.location = location
+
 
     def compose(self) -> ComposeResult:
-        """Yields child widgets."""
+        """Yields placeholder columns, filled in by a background worker."""
         if not self.image_type:
             return
 
-        provider = WeatherProvider.for_my_location()
-        weather_week = provider.get_daily()
-        day_idx = 0
-        weather = weather_week[day_idx]
-        sun = weather.sun.hours()
-        offset = dt.datetime.now().hour
-
-        for i in range(12):
-            with Container() as c:
-                hour = offset + i
-
-                if hour >= 24:
-                    offset = -i # zero current index
-                    hour = 0
-                    day_idx += 1 # rollover to next day
-                    weather = weather_week[day_idx]
-                    sun = weather.sun.hours()
-
-                title = f"{hour}:00"
-                display = weather.location.name
-                if hour in sun:
-                    # INTENTION
-                    # for a given matching hour (0-23),
-                    # check if something happens, what it is and what time it happens
-                    # so the lookup, based on hour, should return (name,timestamp) tuple
-                    name, timestamp = sun[hour]
-                    title = timestamp.strftime(TIME_FORMAT)
-                    display = name
-                    log.info(f"{name} - {title} - {timestamp}")
-                c.border_title = title
-                yield Static(display)
-
-                code = weather.conditions[hour]['weather_code']
-                tod = weather.sun.time_of_day(hour)
-                image = self.icons.get_image(code, tod)
-                log.info(f"{hour} {code} {tod} -> {image} {self.icons.get_description(code, tod)}")
-                yield AutoImage(image, classes="width-auto height-auto")
-
-                desc = self.icons.get_description(code, tod)
-                yield Static(desc)
-
-                for item in weather.conditions[hour].values():
-                    yield Static(item)
+        with timing.span("app.compose.gallery"):
+            columns = [HourColumn() for _ in range(self.HOURS)]
+            yield from columns
+            yield Static("", classes="status")
+            self.status_text = ""
+        self.call_after_refresh(self.load_weather, columns)
+
+
+    def on_mount(self) -> None:
+        """refresh on a timer, patching what changed in place"""
+        self.set_interval(self.REFRESH_INTERVAL, self.refresh_weather)
+
+
+    def refresh_weather(self) -> None:
+        """update the columns shown for the current time and forecast"""
+        columns = list(self.query(HourColumn))
+        if columns:
+            self.load_weather(columns)
+
+
+    def current_hour(self) -> dt.datetime:
+        """the hour it is where the forecast is for, naive like the forecast's dates and hours"""
+        location = self.provider.location if self.provider else self.location
+        now = dt.datetime.now(location.tzinfo) if location else dt.datetime.now()
+        return now.replace(minute=0, second=0, microsecond=0, tzinfo=None)
+
+
+    def first_hour(self) -> dt.datetime:
+        """the first hour shown, the forecast's local time"""
+        now = self.current_hour()
+        return max(self.start, now) if self.start else now
+
+
+    def last_start(self) -> dt.datetime | None:
+        """the latest first hour that still fills the window, None without a forecast"""
+        if not self.days:
+            return None
+        last = self.days[max(self.days)]
+        hours = last.present.nonzero()[0]
+        end = dt.datetime.combine(last.date, dt.time(int(hours[-1]) if len(hours) else 0))
+        return end - dt.timedelta(hours=self.HOURS - 1)
+
+
+    def scroll_hours(self, hours: int) -> None:
+        """scroll the timeline by hours, clamped to the forecast"""
+        last = self.last_start()
+        if last is None:
+            return
+        now = self.current_hour()
+        first = self.first_hour()
+        target = max(now, min(first + dt.timedelta(hours=hours), last))
+        if target != first:
+            self.start = None if target == now else target
+            self.refresh_weather()
+
+
+    def on_mouse_scroll_down(self) -> None:
+        self.scroll_hours(1)
+
+
+    def on_mouse_scroll_up(self) -> None:
+        self.scroll_hours(-1)
+
+
+    def icon_size(self) -> tuple[int, int] | None:
+        """pixel size of an icon filling a column, None before layout"""
+        cells = self.size.width // self.HOURS - 2 # column border
+        if cells <= 0:
+            return None
+        cell = get_cell_size()
+        return (cells * cell.width, cells * cell.width)
+
+
+    def on_resize(self) -> None:
+        """re-scale icons to the new column size"""
+        icons = [(column, column.icon) for column in self.query(HourColumn) if column.icon]
+        if icons:
+            self.rescale_icons(icons, self.icon_size())
+
+
+    @work(thread=True, exclusive=True, group="icons")
+    def rescale_icons(self, icons: list[tuple[HourColumn, tuple]], size: tuple[int, int] | None) -> None:
+        """swap in icons scaled to size, from the cache after the first time"""
+        for column, icon in icons:
+            image = self.icons.get_image(*icon, size=size)
+            self.app.call_from_thread(column.set_image, image, (self.icons.image_name(*icon), size))
+
+
+    def my_provider(self):
+        """the WeatherProvider for my location, created on first use"""
+        # the weather stack (numpy, http and cache clients) loads here, off the first frame
+        from .weather import WeatherProvider
+
+        if self.provider is None:
+            provider = None if self.offline else self.attach_daemon()
+            self.provider = provider or WeatherProvider.for_my_location(self.offline, self.location)
+        return self.provider
+
+
+    def attach_daemon(self):
+        """a provider following a running `clw daemon`, None when there isn't one or it's somewhere else"""
+        from .daemon import DaemonClient, DaemonProvider
+
+        client = DaemonClient.connect()
+        if client is None:
+            return None
+        try:
+            provider = DaemonProvider(client)
+        except OSError as ex:
+            log.warning("the daemon sent no forecast, fetching directly: %s", ex)
+            client.close()
+            return None
+        there, here = provider.location, self.location
+        if here and (here.latitude, here.longitude) != (there.latitude, there.longitude):
+            log.info("the daemon is for %s, fetching %s directly", there.name, here.name)
+            client.close()
+            return None
+        log.info("attached to the daemon for %s", provider.location.name)
+        self.app.call_from_thread(self.follow_daemon, provider)
+        return provider
+
+
+    @work(thread=True, exclusive=True, group="daemon")
+    def follow_daemon(self, provider) -> None:
+        """refresh as soon as the daemon has a new forecast, and fetch directly if it goes away"""
+        worker = get_current_worker()
+        while not worker.is_cancelled:
+            try:
+                notice = provider.client.receive(timeout=1.0)
+            except (OSError, ValueError) as ex:
+                log.warning("lost the daemon, fetching directly: %s", ex)
+                provider.client.close()
+                self.provider = None
+                self.expires = dt.datetime.now(dt.UTC)
+                return
+            if notice:
+                provider.update(notice)
+                self.expires = dt.datetime.now(dt.UTC)
+                self.app.call_from_thread(self.refresh_weather)
+        provider.client.close()
+
+
+    @timing.timed("app.forecast")
+    def forecast(self) -> dict:
+        """date -> DailyRecord, re-fetched only once a newer forecast model should be out"""
+        from .weather import is_expired, next_model_update
+
+        now = dt.datetime.now(dt.UTC)
+        if self.days is None or now >= self.expires:
+            provider = self.my_provider()
+            self.days = {record.date: record for record in provider.get_daily().values()}
+            if provider.from_snapshot and not self.offline:
+                self.expires = now # the fetch failed, try again next refresh
+            elif not self.offline and is_expired(provider.fetched, now):
+                self.expires = now # served expired while a newer one downloads, read it next refresh
+            else:
+                self.expires = next_model_update(now)
+            log.info("forecast refreshed, next after %s", self.expires)
+        return self.days
+
+
+    def saved_forecast(self) -> dict | None:
+        """date -> DailyRecord from the saved snapshot, None without one"""
+        days = self.my_provider().get_snapshot()
+        return {record.date: record for record in days.values()} if days else None
+
+
+    def status(self) -> str:
+        """how stale the forecast shown is, empty when it's fresh"""
+        provider = self.provider
+        if provider is None or not provider.from_snapshot:
+            return ""
+        age = dt.datetime.now(dt.UTC) - provider.fetched
+        minutes = int(age.total_seconds() // 60)
+        age_text = f"{minutes} min" if minutes < 120 else f"{minutes // 60} hours"
+        source = "offline, saved" if self.offline else "saved"
+        return f"{source} forecast from {provider.fetched.astimezone().strftime(DATETIME_FORMAT)}, {age_text} old"
+
+
+    def set_status(self, text: str) -> None:
+        """show the status line, hidden when empty"""
+        if text == self.status_text:
+            return
+        self.status_text = text
+        status = self.query_one(".status", Static)
+        status.update(text)
+        status.display = bool(text)
+
+
+    @timing.timed("app.hours")
+    def hours(self, days: dict, start: dt.datetime) -> list[Hour]:
+        """the hours to show, from start, skipping those the forecast doesn't have (ie the DST change)"""
+        hours = []
+        timestamp = start - dt.timedelta(hours=1)
+        while len(hours) < self.HOURS:
+            timestamp += dt.timedelta(hours=1)
+            hour = timestamp.hour
+            weather = days.get(timestamp.date())
+            if weather is None: # past the end of the forecast
+                break
+            if not weather.present[hour]:
+                continue
+            sun = weather.sun.hours()
+
+            title = f"{timestamp:%a} 0:00" if hour == 0 else f"{hour}:00"
+            display = weather.location.name
+            if hour in sun:
+                # INTENTION
+                # for a given matching hour (0-23),
+                # check if something happens, what it is and what time it happens
+                # so the lookup, based on hour, should return (name,timestamp) tuple
+                name, event = sun[hour]
+                title = event.strftime(TIME_FORMAT)
+                display = name
+
+            # a missing (nan) or unknown code shows no icon rather than failing the refresh
+            code, tod = weather.value(hour, "weather_code"), weather.sun.time_of_day(hour)
+            image, _ = self.icons.table.indices(code, tod == "night")
+            icon = (int(code), tod) if image >= 0 else None
+            description = self.icons.get_description(*icon) if icon else "-"
+            hours.append(Hour(title, display, icon, description, tuple(weather.conditions[hour].values())))
+        return hours
+
+
+    @work(thread=True, exclusive=True, group="weather")
+    @timing.timed("app.load_weather")
+    def load_weather(self, columns: list[HourColumn]) -> None:
+        """work out the hours to show off the event loop, then patch the columns that changed.
+
+        The first time, the saved forecast is shown while the fresh one downloads."""
+        worker = get_current_worker()
+        try:
+            if self.days is None and not self.offline:
+                saved = self.saved_forecast()
+                if saved:
+                    self.show(columns, saved, worker)
+            days = self.forecast()
+        except Exception as ex: # noqa: BLE001
+            # no network and nothing saved, say so rather than fail the worker
+            log.error("no forecast: %s", ex)
+            if self.days is None:
+                self.app.call_from_thread(self.set_status, f"no forecast available: {ex}")
+            return
+        try:
+            self.show(columns, days, worker)
+        except Exception:
+            # keep the worker, and the app, for the next refresh
+            log.exception("failed to show the forecast")
+
+
+    def show(self, columns: list[HourColumn], days: dict, worker) -> None:
+        """patch the columns that changed, and the status line, from a worker"""
+        status = self.status()
+        if status != self.status_text:
+            self.app.call_from_thread(self.set_status, status)
+        hours = self.hours(days, self.first_hour())
+
+        # columns still showing an hour in view move with it, the rest are refilled
+        showing = {column.hour: column for column in columns if column.hour in hours}
+        spare = [column for column in columns if column.hour not in showing]
+        order = [showing.get(hour) or spare.pop(0) for hour in hours] + spare
+        changed = [(column, hour) for column, hour in zip(order, hours) if column.hour != hour]
+        if not changed and order == columns:
+            return
+
+        # one round of (possibly parallel) icon loads for every new icon
+        new_icons = [hour.icon for column, hour in changed if hour.icon and column.icon != hour.icon]
+        self.icons.prefetch(new_icons)
+
+        size = self.icon_size()
+        updates = []
+        for column, hour in changed:
+            if worker.is_cancelled:
+                return
+            image = icon = None
+            if hour.icon and column.icon != hour.icon:
+                image = self.icons.get_image(*hour.icon, size=size)
+                icon = (self.icons.image_name(*hour.icon), size)
+            log.info("%s %s -> %s %s", hour.title, hour.icon, image, hour.description)
+            updates.append((column, hour, image, icon))
+        if not worker.is_cancelled:
+            self.app.call_from_thread(self.update_columns, order, updates)
+
+
+    def update_columns(self, order: list[HourColumn], updates: list[tuple]) -> None:
+        """put the columns in order and patch them with (column, hour, image, icon), for one layout and repaint"""
+        with self.app.batch_update():
+            if list(self.query(HourColumn)) != order:
+                for before, column in itertools.pairwise(order):
+                    self.move_child(column, after=before)
+            for column, hour, image, icon in updates:
+                column.update_hour(hour, image, icon)
 
 
 # top level location, date
@@ -124,16 +463,44 @@ class WeatherApp(App[None]):
     image_type: reactive[str | None] = reactive(None, recompose=True)
     #location: LocationInfo
 
-    def __init__(self, **kwargs):
+    # key -> hours to scroll the gallery, home and end go as far as the forecast does
+    SCROLL_KEYS: ClassVar[dict[str, int]] = {
+        "left": -1,
+        "right": 1,
+        "pageup": -Gallery.HOURS,
+        "pagedown": Gallery.HOURS,
+        "home": -24 * 16,
+        "end": 24 * 16,
+    }
+
+    def __init__(self, log_level: int | None = None, offline: bool = False, location=None, **kwargs):
+        """log_level: show a log panel of clw logging at this level
+        offline: show the saved forecast, without fetching
+        location: the LocationInfo to show, None to look up my location"""
         super().__init__(**kwargs)
         self.image_type = "auto"
+        self.log_level = log_level
+        self.offline = offline
+        self.location = location
 
 
     def compose(self) -> ComposeResult:
         """Yields child widgets."""
-        yield Gallery().data_bind(WeatherApp.image_type)
-        # FIXME get debug flag from CLI somehow. set on app?
-        #yield LogHandlerWidget(self, logging.DEBUG, max_lines=1000, highlight=True)
+        yield Gallery(self.offline, self.location).data_bind(WeatherApp.image_type)
+        yield TimingOverlay(self.cache_stats)
+        if self.log_level is not None:
+            yield LogHandlerWidget(self.log_level, max_lines=1000, highlight=True)
+
+
+    def cache_stats(self) -> dict[str, tuple[int, int]]:
+        """(hits, misses) of the icon, payload and sun caches, for the timing overlay"""
+        from .weather import SunRecord
+
+        caches = {"sun": (SunRecord.cache.hits, SunRecord.cache.misses)}
+        if isinstance(Gallery.icons, CachedIconSet):
+            caches["icons"] = (Gallery.icons.hits, Gallery.icons.misses)
+        caches["payloads"] = (IconImage.payloads.hits, IconImage.payloads.misses)
+        return caches
 
 
     def on_click(self) -> None:
@@ -150,11 +517,15 @@ class WeatherApp(App[None]):
         if key.key == 'q':
             #log_widget.write_line("exiting in 3... 2... 1...")
             self.exit()
+        elif key.key == 't':
+            self.query_one(TimingOverlay).toggle()
+        elif key.key in self.SCROLL_KEYS:
+            self.query_one(Gallery).scroll_hours(self.SCROLL_KEYS[key.key])
 
 
-def main() -> None:
+def main(log_level: int | None = None, offline: bool = False, location=None) -> None:
     """run the weather app"""
-    WeatherApp().run()
+    WeatherApp(log_level, offline, location).run()
 
 
 if __name__ == "__main__":
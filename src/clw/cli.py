@@ -0,0 +1,266 @@
+#!/usr/bin/env python
+"""
+clw command line: the weather app by default, a headless report, or a
+daemon sharing one forecast between every app on the host (daemon.py).
+
+`clw report` never imports Textual or PIL, it streams one row per
+location and hour to stdout as each forecast arrives, for cron jobs and
+pipelines. A locations file is fetched concurrently (see fleet.py):
+
+    clw report --format ndjson --locations cities.csv | jq ...
+
+A locations file has one `name,region,timezone,latitude,longitude` line
+per location (the LocationInfo argument order), `-` reads stdin.
+
+Without one, the forecast is for my location: `--location` (or
+$CLW_LOCATION) names it, from a city name or latitude,longitude looked up
+offline (places.py), otherwise it is looked up from my ip address.
+"""
+import argparse
+import csv
+import datetime as dt
+import json
+import logging
+import math
+import os
+import sys
+from abc import ABC, abstractmethod
+from collections.abc import Iterable, Iterator
+
+from astral import LocationInfo
+
+from . import DATE_FORMAT, TIME_FORMAT, timing
+
+log = logging.getLogger(__name__)
+
+FORMATS = ("text", "ndjson", "csv")
+
+
+def read_locations(lines: Iterable[str]) -> Iterator[LocationInfo]:
+    """parse name,region,timezone,latitude,longitude lines, skipping blanks and # comments"""
+    for lineno, row in enumerate(csv.reader(lines), start=1):
+        if not row or not "".join(row).strip() or row[0].lstrip().startswith("#"):
+            continue
+        try:
+            name, region, timezone, latitude, longitude = (field.strip() for field in row)
+            yield LocationInfo(name, region, timezone, float(latitude), float(longitude))
+        except ValueError as ex:
+            raise ValueError(f"line {lineno}: expected name,region,timezone,latitude,longitude: {ex}") from ex
+
+
+def _number(value: float) -> float | None:
+    """a float32 value as a plain float without the float32 noise, None for nan"""
+    if math.isnan(value): # missing
+        return None
+    return float(f"{value:g}")
+
+
+def hour_rows(location: LocationInfo, days: dict):
+    """(hour timestamp, record, hour) for every hour present in a location's daily records"""
+    tzinfo = location.tzinfo
+    for record in days.values():
+        for hour in map(int, record.present.nonzero()[0]):
+            yield dt.datetime.combine(record.date, dt.time(hour), tzinfo), record, hour
+
+
+class ReportWriter(ABC):
+    """write one location's daily records at a time"""
+    def __init__(self, out):
+        self.out = out
+
+
+    @abstractmethod
+    def write(self, location: LocationInfo, days: dict) -> None:
+        """write a location's records to out"""
+
+
+class NdjsonWriter(ReportWriter):
+    """one json object per location and hour, raw values, null when missing"""
+    def write(self, location: LocationInfo, days: dict) -> None:
+        for timestamp, record, hour in hour_rows(location, days):
+            row = {"location": location.name, "time": timestamp.isoformat()}
+            row.update((name, _number(record.data[hour, column])) for name, column in record.columns.items())
+            self.out.write(json.dumps(row))
+            self.out.write("\n")
+
+
+class CsvWriter(ReportWriter):
+    """csv rows with raw values, a header from the first forecast's variables"""
+    def __init__(self, out):
+        super().__init__(out)
+        self.writer = csv.writer(out)
+        self.header = None
+
+
+    def write(self, location: LocationInfo, days: dict) -> None:
+        for timestamp, record, hour in hour_rows(location, days):
+            if self.header is None:
+                self.header = list(record.columns)
+                self.writer.writerow(["location", "time"] + self.header)
+            values = (_number(record.data[hour, record.columns[name]]) for name in self.header)
+            self.writer.writerow([location.name, timestamp.isoformat()]
+                                 + ["" if value is None else value for value in values])
+
+
+class TextWriter(ReportWriter):
+    """human readable, a heading per location and day, conditions formatted with units"""
+    def write(self, location: LocationInfo, days: dict) -> None:
+        date = None
+        for timestamp, record, hour in hour_rows(location, days):
+            if record.date != date:
+                date = record.date
+                self.out.write(f"{location.name} {record.date.strftime(DATE_FORMAT)}\n")
+            conditions = " ".join(record.format(hour, name) for name in record.columns)
+            self.out.write(f"  {timestamp.strftime(TIME_FORMAT)} {conditions}\n")
+
+
+WRITERS = {
+    "text": TextWriter,
+    "ndjson": NdjsonWriter,
+    "csv": CsvWriter,
+}
+
+
+def report(locations: list[LocationInfo] | None, fmt: str = "text", out=None,
+           concurrency: int | None = None, offline: bool = False, location: LocationInfo = None) -> tuple[int, int]:
+    """Stream the forecast for each location, or my location, looked up unless given.
+
+    A list of locations is fetched concurrently and written in the order
+    batches complete. Offline, saved forecasts are written instead.
+    Returns the count of locations written and failed."""
+    from .weather import WeatherProvider
+    try:
+        if offline:
+            provider = WeatherProvider(None, locations[0] if locations else location, offline=True)
+        elif not locations:
+            provider = WeatherProvider.for_my_location(location=location)
+    except LookupError as ex: # no location given or found, and no saved forecast to take one from
+        log.error("no forecast: %s", ex)
+        return 0, 1
+
+    if offline:
+        results = ((location, provider.get_snapshot(location) or LookupError("no saved forecast"))
+                   for location in locations or [provider.location])
+    elif locations:
+        from .fleet import FleetFetcher
+        kwargs = {"concurrency": concurrency} if concurrency else {}
+        results = FleetFetcher.for_locations(locations, **kwargs).fetch(locations)
+    else:
+        try:
+            days = provider.get_daily()
+        except Exception as ex: # noqa: BLE001 - failed, as a location in a locations file does
+            days = ex
+        results = [(provider.location, days)]
+
+    out = out or sys.stdout
+    writer = WRITERS[fmt](out)
+    written = failed = 0
+    for place, days in results:
+        if isinstance(days, Exception):
+            log.error("no forecast for %s: %s", place.name, days)
+            failed += 1
+            continue
+        writer.write(place, days)
+        out.flush() # a location at a time, as each batch arrives
+        written += 1
+    return written, failed
+
+
+def _report(args) -> None:
+    locations = None
+    if args.locations:
+        try:
+            if args.locations == "-":
+                locations = list(read_locations(sys.stdin))
+            else:
+                with open(args.locations, encoding="utf-8", newline="") as file:
+                    locations = list(read_locations(file))
+        except (OSError, ValueError) as ex:
+            sys.exit(f"can't read locations from {args.locations}: {ex}")
+        if not locations:
+            sys.exit(f"no locations in {args.locations}")
+
+    try:
+        written, failed = report(locations, args.format, concurrency=args.concurrency, offline=args.offline,
+                                 location=args.location)
+        log.info("reported %d locations, %d failed", written, failed)
+    except BrokenPipeError:
+        # reader went away (| head), don't complain flushing stdout on the way out
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        sys.exit(1)
+    if failed:
+        sys.exit(f"{failed} of {written + failed} locations failed")
+
+
+def _daemon(args) -> None:
+    from .daemon import serve
+    try:
+        serve(location=args.location)
+    except RuntimeError as ex: # already running
+        sys.exit(str(ex))
+
+
+def _app(args) -> None:
+    from .app import main
+    main(args.log_level, args.offline, args.location)
+
+
+def main(argv: list[str] | None = None) -> None:
+    """run the weather app, or a subcommand"""
+    # no abbreviations: --location would otherwise be taken for report's --locations
+    parser = argparse.ArgumentParser(prog="clw", description="Command Line Weather", allow_abbrev=False)
+    parser.add_argument("-v", "--verbose", action="count", default=0, help="log to stderr, or a panel in the app, -vv for debug")
+    parser.add_argument("--profile", action="store_true", help="time the hot paths, print a summary to stderr")
+    parser.add_argument("--trace", metavar="FILE", help="time the hot paths, write a Chrome trace to FILE")
+    parser.add_argument("--offline", action="store_true", help="use saved forecasts, without the network")
+    parser.add_argument("--location", metavar="PLACE", default=os.environ.get("CLW_LOCATION"),
+                        help="a city, or latitude,longitude[,timezone], instead of looking up my location "
+                             "(default $CLW_LOCATION)")
+    parser.set_defaults(func=_app)
+    commands = parser.add_subparsers(title="commands")
+
+    report_parser = commands.add_parser("report", help="headless forecast report to stdout", allow_abbrev=False)
+    report_parser.add_argument("-f", "--format", choices=FORMATS, default="text", help="output format")
+    report_parser.add_argument("-l", "--locations", metavar="FILE",
+                               help="name,region,timezone,latitude,longitude per line, - for stdin, "
+                                    "defaults to my location")
+    report_parser.add_argument("-j", "--concurrency", type=int, metavar="N",
+                               help="requests in flight for a locations file, default 8")
+    report_parser.set_defaults(func=_report)
+
+    daemon_parser = commands.add_parser("daemon", help="fetch the forecast once for every clw on this host",
+                                        allow_abbrev=False)
+    daemon_parser.set_defaults(func=_daemon)
+
+    # also after the command, `clw report --location Seattle`, without overriding one before it
+    for command in (report_parser, daemon_parser):
+        command.add_argument("--location", metavar="PLACE", default=argparse.SUPPRESS,
+                             help="as clw --location")
+
+    args = parser.parse_args(argv)
+    if args.location:
+        from .places import resolve
+        try:
+            args.location = resolve(args.location)
+        except LookupError as ex:
+            parser.error(str(ex))
+    args.log_level = (logging.DEBUG if args.verbose > 1 else logging.INFO) if args.verbose else None
+    if args.log_level and args.func is not _app: # the app shows its own log panel
+        logging.basicConfig(level=args.log_level, stream=sys.stderr)
+    if not (args.profile or args.trace):
+        args.func(args)
+        return
+
+    timing.enable()
+    try:
+        args.func(args)
+    finally:
+        if args.profile:
+            print(timing.summary(), file=sys.stderr)
+        if args.trace:
+            timing.write_chrome_trace(args.trace)
+            print(f"trace written to {args.trace}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
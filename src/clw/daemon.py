@@ -0,0 +1,243 @@
+"""
+One forecast for every clw on the host: `clw daemon`.
+
+The daemon owns the WeatherSession, so there's one location lookup, one
+http cache and one fetch per forecast model update, however many terminals
+are showing the weather. Each forecast is saved as a columnar snapshot
+(see weather.SnapshotStore) and attached clients are pushed a one-line
+json notice over a Unix socket saying where it is:
+
+    {"location": [...], "snapshot": "/path/47.61,-122.33.npz", "fetched": "...", "stale": false}
+
+Clients load the snapshot themselves, the arrays are shared through the
+page cache rather than copied down the socket, as the icon atlas is.
+A new client gets the current notice as soon as it connects.
+
+WeatherApp attaches when a daemon is running (DaemonProvider) and fetches
+directly when there isn't one, or when it goes away.
+"""
+from __future__ import annotations
+
+import datetime as dt
+import json
+import logging
+import os
+import signal
+import socket
+import threading
+from pathlib import Path
+
+from astral import LocationInfo
+
+from . import cache_dir
+from .weather import SnapshotStore, WeatherProvider, is_expired, next_model_update
+
+log = logging.getLogger(__name__)
+
+SOCKET_NAME = "clw.sock"
+RETRY = 60.0 # seconds between fetches while they fail
+REVALIDATE = 5.0 # seconds before reading again a forecast served expired from the http cache
+SEND_TIMEOUT = 1.0 # seconds, a client that won't read is dropped
+ATTACH_TIMEOUT = 10.0 # seconds a new client waits for the first forecast
+
+
+def socket_path() -> Path:
+    """the daemon's socket, in $XDG_RUNTIME_DIR when there is one"""
+    runtime = os.environ.get("XDG_RUNTIME_DIR")
+    return Path(runtime, SOCKET_NAME) if runtime else cache_dir() / SOCKET_NAME
+
+
+class ForecastDaemon:
+    """fetch my forecast on the model schedule and tell attached clients where it is"""
+    def __init__(self, provider: WeatherProvider, path: Path | None = None):
+        self.provider = provider
+        self.path = Path(path) if path else socket_path()
+        self.notice = None # bytes, the current notice line
+        self.clients: list[socket.socket] = []
+        self.stopping = threading.Event()
+        self._lock = threading.Lock()
+        self._server = None
+
+
+    def refresh(self) -> dt.datetime:
+        """fetch and save the forecast, notify the clients, and return when to refresh next"""
+        provider = self.provider
+        now = dt.datetime.now(dt.UTC)
+        try:
+            forecast = provider.session.get(provider.location, hourly=provider.HOURLY,
+                                            forecast_days=provider.FORECAST_DAYS)
+            fetched = forecast.fetched or now
+            path = provider.snapshots.save(provider.location, forecast, fetched)
+            if is_expired(fetched, now):
+                # served expired while a newer one downloads, read it again shortly
+                stale, expires = True, now + dt.timedelta(seconds=REVALIDATE)
+            else:
+                stale, expires = False, next_model_update(now)
+        except Exception as ex: # noqa: BLE001
+            log.warning("forecast fetch failed, retrying in %ds: %s", RETRY, ex)
+            expires = now + dt.timedelta(seconds=RETRY)
+            snapshot = provider.snapshots.load(provider.location)
+            if snapshot is None:
+                return expires
+            path, fetched, stale = provider.snapshots.file(provider.location), snapshot.fetched, True
+
+        location = provider.location
+        self.broadcast({
+            "location": [location.name, location.region, location.timezone, location.latitude, location.longitude],
+            "snapshot": str(path),
+            "fetched": fetched.isoformat(),
+            "stale": stale,
+        })
+        return expires
+
+
+    def broadcast(self, notice: dict) -> None:
+        """send a notice to every client, dropping the ones that are gone or stuck"""
+        line = (json.dumps(notice) + "\n").encode("utf-8")
+        with self._lock: # while sending too, a client attaching now gets the last notice whole, then this one
+            self.notice = line
+            self.clients = [client for client in self.clients if self._send(client, line)]
+            sent = len(self.clients)
+        log.info("forecast from %s sent to %d clients", notice["fetched"], sent)
+
+
+    def _send(self, client: socket.socket, line: bytes) -> bool:
+        try:
+            client.sendall(line)
+            return True
+        except OSError as ex:
+            log.debug("dropping client: %s", ex)
+            client.close()
+            return False
+
+
+    def listen(self) -> None:
+        """bind the socket, replacing a stale one, and accept clients on a thread"""
+        if self.path.exists():
+            running = DaemonClient.connect(self.path)
+            if running is not None:
+                running.close()
+                raise RuntimeError(f"a daemon is already running on {self.path}")
+            self.path.unlink() # left by a daemon that didn't exit cleanly
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(str(self.path))
+        os.chmod(self.path, 0o600) # forecasts for this user only
+        server.listen()
+        self._server = server
+        threading.Thread(target=self._accept, name="clw-daemon", daemon=True).start()
+        log.info("listening on %s", self.path)
+
+
+    def _accept(self) -> None:
+        while not self.stopping.is_set():
+            try:
+                client, _ = self._server.accept()
+            except OSError: # closed
+                return
+            client.settimeout(SEND_TIMEOUT)
+            with self._lock: # not between a broadcast's notice and the clients it goes to
+                if self.notice is None or self._send(client, self.notice):
+                    self.clients.append(client)
+
+
+    def serve(self) -> None:
+        """refresh on schedule until stopped"""
+        self.listen()
+        while not self.stopping.is_set():
+            expires = self.refresh()
+            wait = (expires - dt.datetime.now(dt.UTC)).total_seconds()
+            log.info("next forecast after %s", expires)
+            self.stopping.wait(max(1.0, wait))
+
+
+    def close(self) -> None:
+        """stop serving, disconnect the clients and remove the socket"""
+        self.stopping.set()
+        if self._server is not None:
+            self._server.close()
+            self.path.unlink(missing_ok=True)
+        with self._lock:
+            for client in self.clients:
+                client.close()
+            self.clients = []
+
+
+class DaemonClient:
+    """a connection to a running daemon, reading its notices"""
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+        self._buffer = b""
+
+
+    @classmethod
+    def connect(cls, path: Path | None = None) -> DaemonClient | None:
+        """attach to the daemon, None when there isn't one running"""
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(str(path or socket_path()))
+        except OSError:
+            sock.close()
+            return None
+        return cls(sock)
+
+
+    def receive(self, timeout: float | None = None) -> dict | None:
+        """the next notice, None after timeout seconds without one.
+
+        Raises ConnectionError when the daemon goes away."""
+        self.sock.settimeout(timeout)
+        while b"\n" not in self._buffer:
+            try:
+                data = self.sock.recv(4096)
+            except TimeoutError:
+                return None
+            if not data:
+                raise ConnectionError("the daemon closed the connection")
+            self._buffer += data
+        line, self._buffer = self._buffer.split(b"\n", 1)
+        return json.loads(line)
+
+
+    def close(self) -> None:
+        self.sock.close()
+
+
+class DaemonProvider(WeatherProvider):
+    """forecasts from the snapshots a daemon writes, never fetching itself"""
+    def __init__(self, client: DaemonClient, timeout: float = ATTACH_TIMEOUT):
+        """waits up to timeout seconds for the daemon's current forecast, raising TimeoutError"""
+        notice = client.receive(timeout)
+        if notice is None:
+            raise TimeoutError("no forecast from the daemon")
+        self.client = client
+        super().__init__(None, LocationInfo(*notice["location"]), offline=True)
+        self.update(notice)
+
+
+    def update(self, notice: dict) -> None:
+        """follow a new notice from the daemon"""
+        self.snapshots = SnapshotStore(Path(notice["snapshot"]).parent)
+        self.stale = notice["stale"]
+
+
+    def get_daily(self) -> dict:
+        """the daemon's latest forecast, from_snapshot when the daemon's last fetch failed"""
+        days = self.get_snapshot()
+        if days is None:
+            raise LookupError(f"no forecast from the daemon for {self.location.name}")
+        self.from_snapshot = self.stale
+        return days
+
+
+def serve(path: Path | None = None, location: LocationInfo = None) -> None:
+    """run a daemon for my location, or the location given, until interrupted"""
+    daemon = ForecastDaemon(WeatherProvider.for_my_location(location=location), path)
+    signal.signal(signal.SIGTERM, lambda *_: daemon.stopping.set())
+    try:
+        daemon.serve()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        daemon.close()
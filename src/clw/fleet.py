@@ -0,0 +1,241 @@
+"""
+Fetch forecasts for a fleet of locations concurrently.
+
+WeatherSession.get_many is serial and its session retries in place, so one
+slow or failing request holds up every batch behind it. FleetFetcher runs
+batches on a bounded thread pool instead, and schedules everything else
+from the calling thread:
+
+- a shared token bucket per Open-Meteo quota, charged per grid cell
+  requested (nearby locations share one, see weather.GridCells)
+- a deadline per batch, covering its queueing, attempts and retries
+- failed attempts go back in the queue after a jittered backoff, without
+  holding a worker or the batches behind them
+
+Refreshing a fleet takes about as long as its slowest batch, not the sum.
+"""
+import heapq
+import itertools
+import logging
+import math
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+
+from astral import LocationInfo
+
+from .weather import BATCH_SIZE, Cell, WeatherProvider, WeatherSession
+
+log = logging.getLogger(__name__)
+
+CONCURRENCY = 8
+TIMEOUT = 10.0 # seconds, each attempt
+DEADLINE = 60.0 # seconds, each batch including retries
+RETRIES = 4
+BACKOFF = 0.5 # seconds, doubling each retry
+BACKOFF_MAX = 30.0
+
+# Open-Meteo non-commercial limits: (calls, seconds)
+# https://open-meteo.com/en/terms
+QUOTAS = (
+    (600, 60),
+    (5000, 3600),
+    (10000, 86400),
+)
+
+
+class TokenBucket:
+    """a token bucket that never allows more than `calls` in any `period` seconds.
+
+    Half the quota is available as a burst, the rest refills steadily."""
+    def __init__(self, calls: int, period: float, clock=time.monotonic):
+        self.capacity = calls / 2
+        self.rate = (calls - self.capacity) / period
+        self.clock = clock
+        self.tokens = self.capacity
+        self.updated = clock()
+
+
+    def _refill(self) -> None:
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+
+    def wait_time(self, cost: float) -> float:
+        """seconds until cost tokens are available, 0 if they are now"""
+        self._refill()
+        cost = min(cost, self.capacity) # a batch bigger than the burst waits for a full bucket
+        return max(0.0, (cost - self.tokens) / self.rate)
+
+
+    def take(self, cost: float) -> None:
+        """spend tokens, possibly going into debt for a batch bigger than the burst"""
+        self._refill()
+        self.tokens -= cost
+
+
+class RateLimiter:
+    """all the quotas at once, thread-safe so fetchers in a process share them"""
+    def __init__(self, quotas=QUOTAS, clock=time.monotonic):
+        self.buckets = [TokenBucket(calls, period, clock) for calls, period in quotas]
+        self.lock = threading.Lock()
+
+
+    def try_acquire(self, cost: float) -> float:
+        """take cost from every bucket and return 0, or the seconds to wait before trying again"""
+        with self.lock:
+            delay = max((bucket.wait_time(cost) for bucket in self.buckets), default=0.0)
+            if delay == 0.0:
+                for bucket in self.buckets:
+                    bucket.take(cost)
+            return delay
+
+
+@dataclass(order=True)
+class _Job:
+    """a batch waiting for its next attempt"""
+    ready: float # monotonic time of the next attempt
+    seq: int
+    batch: list = field(compare=False) # of weather.Cell
+    params: dict = field(compare=False)
+    deadline: float = field(compare=False)
+    attempts: int = field(default=0, compare=False)
+
+
+class FleetFetcher:
+    """fetch and parse forecasts for many locations with bounded parallelism"""
+
+    limiter = RateLimiter() # Open-Meteo quotas are per client, share them across fetchers
+
+    def __init__(self, provider: WeatherProvider, concurrency: int = CONCURRENCY,
+                 batch_size: int = BATCH_SIZE, timeout: float = TIMEOUT, deadline: float = DEADLINE,
+                 retries: int = RETRIES, backoff: float = BACKOFF):
+        self.provider = provider
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.deadline = deadline
+        self.retries = retries
+        self.backoff = backoff
+        self.stats = {"requests": 0, "retries": 0, "failures": 0, "throttled": 0}
+
+
+    @classmethod
+    def for_locations(cls, locations: list[LocationInfo], concurrency: int = CONCURRENCY, **kwargs):
+        """a fetcher with its own session, pooled for concurrency, that leaves retries to the fetcher"""
+        session = WeatherSession(retries=0, pool_size=concurrency)
+        return cls(WeatherProvider(session, locations[0]), concurrency, **kwargs)
+
+
+    def cost(self, batch: list[Cell], params: dict) -> float:
+        """quota calls for a batch: a call per grid cell requested, per 10 variables"""
+        return len(batch) * max(1, math.ceil(len(params["hourly"].split(",")) / 10))
+
+
+    def backoff_delay(self, attempts: int) -> float:
+        """full jitter: anywhere up to an exponentially growing cap"""
+        return random.uniform(0, min(BACKOFF_MAX, self.backoff * 2 ** attempts))
+
+
+    def fetch(self, locations: list[LocationInfo]):
+        """Yield (location, daily records) as each batch completes, in completion order.
+
+        A location whose batch failed past its retries or deadline is yielded
+        with the exception in place of its records."""
+        session = self.provider.session
+        start = time.monotonic()
+        seq = itertools.count()
+        pending = [_Job(start, next(seq), batch, params, start + self.deadline)
+                   for batch, params in session._batches(locations, self.batch_size,
+                                                         {"hourly": self.provider.HOURLY})]
+        heapq.heapify(pending)
+        running = {}
+
+        with ThreadPoolExecutor(self.concurrency, thread_name_prefix="fleet") as pool:
+            while pending or running:
+                now = time.monotonic()
+                wake = None # when to next look at the queue, None when only waiting on requests
+
+                while pending and len(running) < self.concurrency:
+                    job = pending[0]
+                    if job.deadline <= now:
+                        heapq.heappop(pending)
+                        yield from self._failed(job, TimeoutError(f"deadline passed after {job.attempts} attempts"))
+                        continue
+                    if job.ready > now:
+                        wake = job.ready
+                        break
+                    delay = self.limiter.try_acquire(self.cost(job.batch, job.params))
+                    if delay:
+                        self.stats["throttled"] += 1
+                        wake = now + delay
+                        break
+                    heapq.heappop(pending)
+                    job.attempts += 1
+                    self.stats["requests"] += 1
+                    timeout = min(self.timeout, job.deadline - now)
+                    running[pool.submit(self._attempt, job, timeout)] = job
+
+                timeout = None if wake is None else max(0.0, wake - time.monotonic())
+                if not running:
+                    if timeout:
+                        time.sleep(timeout)
+                    continue
+
+                done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job = running.pop(future)
+                    try:
+                        results = future.result()
+                    except Exception as ex: # noqa: BLE001
+                        if not self._retry(job, ex, pending):
+                            yield from self._failed(job, ex)
+                        continue
+                    yield from results
+
+        log.info("fetched %d locations in %.2fs: %s", len(locations), time.monotonic() - start, self.stats)
+
+
+    def _attempt(self, job: _Job, timeout: float) -> list:
+        """one request for a batch, parsed into (location, daily records), on a worker thread"""
+        forecasts = self.provider.session.fetch_batch(job.batch, job.params, timeout=timeout)
+        results = []
+        for location, forecast in forecasts:
+            self.provider.snapshots.save(location, forecast, latest=False) # for clw --offline
+            results.append((location, self.provider.parse_forecast(forecast, location)))
+        return results
+
+
+    def _retry(self, job: _Job, ex: Exception, pending: list) -> bool:
+        """queue the job's next attempt after a backoff, False when it has run out of chances"""
+        now = time.monotonic()
+        ready = now + self.backoff_delay(job.attempts)
+        if job.attempts > self.retries or ready >= job.deadline or not retryable(ex):
+            log.warning("batch of %d cells failed after %d attempts: %s", len(job.batch), job.attempts, ex)
+            return False
+
+        log.info("batch of %d cells failed, retry %d in %.2fs: %s", len(job.batch), job.attempts, ready - now, ex)
+        self.stats["retries"] += 1
+        job.ready = ready
+        heapq.heappush(pending, job)
+        return True
+
+
+    def _failed(self, job: _Job, ex: Exception):
+        for cell in job.batch:
+            self.stats["failures"] += len(cell.locations)
+            for location in cell.locations:
+                yield location, ex
+
+
+def retryable(ex: Exception) -> bool:
+    """connection errors, timeouts, server errors and rate limiting are worth retrying, bad requests aren't"""
+    cause = ex.__cause__
+    reason = getattr(cause, "args", [None])[0] if type(cause).__name__ == "OpenMeteoRequestsError" else None
+    if isinstance(reason, dict):
+        # the api's own error body, for a 400 or a 429
+        return "limit" in str(reason.get("reason", "")).lower()
+    return True
@@ -1,34 +1,133 @@
 """manage weather icons as a set"""
+from __future__ import annotations
+
+import datetime as dt
+import functools
+import hashlib
+import json
 import logging
-from pathlib import Path
+import mmap
+import threading
 from abc import ABC, abstractmethod
-import json
-from importlib.resources import read_text, read_binary
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from importlib.resources import read_binary, read_text
 from io import BytesIO
+from pathlib import Path
+from typing import TYPE_CHECKING
 
-from PIL import Image
-import requests
+from . import TIMEOUT, cache_dir, timing
+from .store import JsonStore, atomic_write
 
-from . import TIMEOUT
+if TYPE_CHECKING:
+    # PIL and requests load when an image does, not when the module is imported
+    from PIL.Image import Image
 
 log = logging.getLogger(__name__)
 
+# decoded images held by a CachedIconSet
+IMAGE_CACHE_BYTES = 64 * 1024 * 1024
+
+# pixel size of each icon packed in an atlas
+ATLAS_ICON_SIZE = 256
+
+
+@timing.timed("icons.decode")
+def prepare_image(image: Image, size: tuple[int, int] | None = None) -> Image:
+    """fully decode an image to RGBA, scaled to fit size (in pixels) when given"""
+    from PIL import Image as PILImage
+    from PIL import ImageOps
+
+    image = image.convert("RGBA") # forces the lazy decode
+    if size and image.size != size:
+        image = ImageOps.contain(image, size, PILImage.Resampling.LANCZOS)
+    return image
+
+
+# wmo 4677 present weather codes, what open-meteo's weather_code holds
+WMO_CODES = 100
+TODS = ("day", "night")
+
+# descriptions of each code by time of day, shared by every icon set
+DESCRIPTIONS = "resources/wmo-codes.json"
+
+
+class CodeTable:
+    """weather codes compiled once into tables indexed by integer code and day/night
+
+    entry() is two list lookups, indices() maps whole arrays of codes and
+    night flags to image and description indices in one numpy gather."""
+    def __init__(self, codes: dict):
+        self.codes = codes
+        self.images = sorted({entry["image"] for tods in codes.values() for entry in tods.values()})
+        self.descriptions = sorted({entry["description"] for tods in codes.values() for entry in tods.values()})
+        self.entries = [[None, None] for _ in range(WMO_CODES)] # [code][night] -> {"image", "description"}
+        for code, tods in codes.items():
+            self.entries[int(code)] = [tods[tod] for tod in TODS]
+        self._array = None
+
+
+    def entry(self, code: int, tod: str) -> dict:
+        """the image and description for a code and time of day, "day" or "night"."""
+        entry = self.entries[code][tod == "night"] if 0 <= code < WMO_CODES else None
+        if entry is None:
+            raise KeyError(code)
+        return entry
+
 
-# cheap in-memory cache
-_item_cache = {}
-def _get(key:str):
-    return _item_cache.get(key, None)
-def _put(key:str, value):
-    existing = _item_cache.get(key, None)
-    _item_cache[key] = value
-    return existing
+    @property
+    def array(self):
+        """int16 (code, night) -> (image, description) indices, -1 for unknown codes"""
+        if self._array is None:
+            import numpy as np
+
+            images = {name: i for i, name in enumerate(self.images)}
+            descriptions = {text: i for i, text in enumerate(self.descriptions)}
+            array = np.full((WMO_CODES + 1, 2, 2), -1, dtype=np.int16) # the last row is for codes out of range
+            for code, tods in enumerate(self.entries):
+                for night, entry in enumerate(tods):
+                    if entry is not None:
+                        array[code, night] = images[entry["image"]], descriptions[entry["description"]]
+            self._array = array
+        return self._array
+
+
+    def indices(self, codes, night):
+        """image and description index arrays for arrays of codes and night flags, -1 where unknown"""
+        import numpy as np
+
+        codes = np.asarray(codes)
+        rows = np.where((codes >= 0) & (codes < WMO_CODES), codes, WMO_CODES).astype(np.intp) # nan is out of range
+        found = self.array[rows, np.asarray(night, dtype=np.intp)]
+        return found[..., 0], found[..., 1]
+
+
+def parse_code(wmo_code: float | str) -> int:
+    """the integer code from an int, a float, or a string like "3", "3.0", "3wmo" or "3wmo code"."""
+    if isinstance(wmo_code, str):
+        wmo_code = wmo_code.removesuffix(" code").removesuffix("wmo")
+        wmo_code = float(wmo_code)
+    return int(wmo_code)
 
 
 class IconSet(ABC):
     """a set of icons for display"""
     def __init__(self):
         super().__init__()
-        self._codes = self.load_weather_codes()
+        self._table = None
+
+
+    @property
+    def table(self) -> CodeTable:
+        """the weather codes, loaded and compiled on first use"""
+        if self._table is None:
+            self._table = CodeTable(self.load_weather_codes())
+        return self._table
+
+
+    @property
+    def _codes(self) -> dict:
+        return self.table.codes
 
 
     @abstractmethod
@@ -46,33 +145,52 @@ class IconSet(ABC):
         return self._codes.get(wmo_code)
 
 
-    def _get(self, wmo_code: str, tod: str) -> dict:
-        """get a png filename for a code and hour of day"""
-        # allow "3", "3wmo" and "3wmo code"
-        if wmo_code.endswith("wmo code"):
-            wmo_code = wmo_code[:-8]
+    def _get(self, wmo_code: float | str, tod: str) -> dict:
+        """the image and description for a code and time of day"""
+        return self.table.entry(parse_code(wmo_code), tod)
+
 
-        if wmo_code.endswith("wmo"):
-            wmo_code = wmo_code[:-3]
+    def load_scaled(self, filename: str, size: tuple[int, int] | None = None) -> Image:
+        """load a decoded image, scaled to fit size (in pixels) when given"""
+        return prepare_image(self.load_image(filename), size)
 
-        return self.lookup_code(wmo_code)[tod]
 
+    def image_name(self, wmo_code: int | str, tod: str) -> str:
+        """the image file for the code, shared by codes that look alike"""
+        return self._get(wmo_code, tod)['image']
 
-    def get_image(self, wmo_code: str, tod: str) -> Image:
-        """load an image for the code"""
-        filename =  self._get(wmo_code, tod)['image']
-        return self.load_image(filename)
 
+    def get_image(self, wmo_code: int | str, tod: str, size: tuple[int, int] | None = None) -> Image:
+        """load an image for the code, scaled to fit size (in pixels) when given"""
+        return self.load_scaled(self.image_name(wmo_code, tod), size)
 
-    def get_description(self, wmo_code: str, tod: str) -> str:
+
+    def get_description(self, wmo_code: int | str, tod: str) -> str:
         """get the description for the code"""
         return self._get(wmo_code, tod)['description']
 
 
+    def prefetch(self, icons: list[tuple[str, str]]) -> None:
+        """warm up the images for (code, time of day) pairs, a no-op unless loading is slow"""
+
+
+    def fingerprint(self) -> str:
+        """a digest of what the set loads, naming files built from it. Here just the codes"""
+        codes = json.dumps(self.load_weather_codes(), sort_keys=True)
+        return hashlib.sha256(codes.encode("utf-8")).hexdigest()[:16]
+
+
 class CachedIconSet(IconSet):
-    """cache the images in the image set"""
-    def __init__(self, wrapped: IconSet):
+    """cache decoded, pre-scaled images from the wrapped set in an LRU bounded in bytes"""
+    def __init__(self, wrapped: IconSet, max_bytes: int = IMAGE_CACHE_BYTES):
         self._wrapped = wrapped
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._images = OrderedDict() # (filename, size) -> decoded image
+        self._lock = threading.Lock()
         super().__init__()
 
 
@@ -80,298 +198,59 @@ class CachedIconSet(IconSet):
         return self._wrapped.load_weather_codes()
 
 
+    def prefetch(self, icons: list[tuple[str, str]]) -> None:
+        self._wrapped.prefetch(icons)
+
+
     def load_image(self, filename:str) -> Image:
-        image = _get(filename)
-        if not image:
-            image = self._wrapped.load_image(filename)
-            _put(filename, image)
+        return self.load_scaled(filename)
+
+
+    def load_scaled(self, filename: str, size: tuple[int, int] | None = None) -> Image:
+        key = (filename, size)
+        with self._lock:
+            image = self._images.get(key)
+            if image is not None:
+                self.hits += 1
+                self._images.move_to_end(key)
+                return image
+            self.misses += 1
+
+        # decode and scale outside the lock, a racing miss just does the work twice
+        image = prepare_image(self._wrapped.load_image(filename), size)
+        self._put(key, image)
         return image
 
 
-HACK_CODE_JSON = """
-{
-  "0": {
-    "day": {
-      "description": "Sunny",
-      "image": "clear-day.png"
-    },
-    "night": {
-      "description": "Clear",
-      "image": "clear-night.png"
-    }
-  },
-  "1": {
-    "day": {
-      "description": "Mainly Sunny",
-      "image": "clear-day.png"
-    },
-    "night": {
-      "description": "Mainly Clear",
-      "image": "clear-night.png"
-    }
-  },
-  "2": {
-    "day": {
-      "description": "Partly Cloudy",
-      "image": "partly-cloudy-day.png"
-    },
-    "night": {
-      "description": "Partly Cloudy",
-      "image": "partly-cloudy-night.png"
-    }
-  },
-  "3": {
-    "day": {
-      "description": "Cloudy",
-      "image": "cloudy.png"
-    },
-    "night": {
-      "description": "Cloudy",
-      "image": "cloudy.png"
-    }
-  },
-  "45": {
-    "day": {
-      "description": "Foggy",
-      "image": "fog-day.png"
-    },
-    "night": {
-      "description": "Foggy",
-      "image": "fog-night.png"
-    }
-  },
-  "48": {
-    "day": {
-      "description": "Rime Fog",
-      "image": "extreme-day-fog.png"
-    },
-    "night": {
-      "description": "Rime Fog",
-      "image": "extreme-night-fog.png"
-    }
-  },
-  "51": {
-    "day": {
-      "description": "Light Drizzle",
-      "image": "drizzle.png"
-    },
-    "night": {
-      "description": "Light Drizzle",
-      "image": "drizzle.png"
-    }
-  },
-  "53": {
-    "day": {
-      "description": "Drizzle",
-      "image": "partly-cloudy-day-drizzle.png"
-    },
-    "night": {
-      "description": "Drizzle",
-      "image": "partly-cloudy-night-drizzle.png"
-    }
-  },
-  "55": {
-    "day": {
-      "description": "Heavy Drizzle",
-      "image": "overcast-day-drizzle.png"
-    },
-    "night": {
-      "description": "Heavy Drizzle",
-      "image": "overcast-night-drizzle.png"
-    }
-  },
-  "56": {
-    "day": {
-      "description": "Light Freezing Drizzle",
-      "image": "extreme-drizzle.png"
-    },
-    "night": {
-      "description": "Light Freezing Drizzle",
-      "image": "extreme-drizzle.png"
-    }
-  },
-  "57": {
-    "day": {
-      "description": "Freezing Drizzle",
-      "image": "extreme-day-drizzle.png"
-    },
-    "night": {
-      "description": "Freezing Drizzle",
-      "image": "extreme-night-drizzle.png"
-    }
-  },
-  "61": {
-    "day": {
-      "description": "Light Rain",
-      "image": "partly-cloudy-day-rain.png"
-    },
-    "night": {
-      "description": "Light Rain",
-      "image": "partly-cloudy-night-rain.png"
-    }
-  },
-  "63": {
-    "day": {
-      "description": "Rain",
-      "image": "overcast-day-rain.png"
-    },
-    "night": {
-      "description": "Rain",
-      "image": "overcast-night-rain.png"
-    }
-  },
-  "65": {
-    "day": {
-      "description": "Heavy Rain",
-      "image": "extreme-day-rain.png"
-    },
-    "night": {
-      "description": "Heavy Rain",
-      "image": "extreme-night-rain.png"
-    }
-  },
-  "66": {
-    "day": {
-      "description": "Light Freezing Rain",
-      "image": "partly-cloudy-day-sleet.png"
-    },
-    "night": {
-      "description": "Light Freezing Rain",
-      "image": "partly-cloudy-night-sleet.png"
-    }
-  },
-  "67": {
-    "day": {
-      "description": "Freezing Rain",
-      "image": "overcast-day-sleet.png"
-    },
-    "night": {
-      "description": "Freezing Rain",
-      "image": "overcast-night-sleet.png"
-    }
-  },
-  "71": {
-    "day": {
-      "description": "Light Snow",
-      "image": "partly-cloudy-day-snow.png"
-    },
-    "night": {
-      "description": "Light Snow",
-      "image": "partly-cloudy-night-snow.png"
-    }
-  },
-  "73": {
-    "day": {
-      "description": "Snow",
-      "image": "overcast-day-snow.png"
-    },
-    "night": {
-      "description": "Snow",
-      "image": "overcast-night-snow.png"
-    }
-  },
-  "75": {
-    "day": {
-      "description": "Heavy Snow",
-      "image": "extreme-day-snow.png"
-    },
-    "night": {
-      "description": "Heavy Snow",
-      "image": "extreme-night-snow.png"
-    }
-  },
-  "77": {
-    "day": {
-      "description": "Snow Grains",
-      "image": "snowflake.png"
-    },
-    "night": {
-      "description": "Snow Grains",
-      "image": "snowflake.png"
-    }
-  },
-  "80": {
-    "day": {
-      "description": "Light Showers",
-      "image": "partly-cloudy-day-rain.png"
-    },
-    "night": {
-      "description": "Light Showers",
-      "image": "partly-cloudy-night-rain.png"
-    }
-  },
-  "81": {
-    "day": {
-      "description": "Showers",
-      "image": "overcast-day-rain.png"
-    },
-    "night": {
-      "description": "Showers",
-      "image": "overcast-rain.png"
-    }
-  },
-  "82": {
-    "day": {
-      "description": "Heavy Showers",
-      "image": "extreme-day-rain.png"
-    },
-    "night": {
-      "description": "Heavy Showers",
-      "image": "extreme-night-rain.png"
-    }
-  },
-  "85": {
-    "day": {
-      "description": "Light Snow Showers",
-      "image": "overcast-day-snow.png"
-    },
-    "night": {
-      "description": "Light Snow Showers",
-      "image": "overcast-night-snow.png"
-    }
-  },
-  "86": {
-    "day": {
-      "description": "Snow Showers",
-      "image": "extreme-day-snow.png"
-    },
-    "night": {
-      "description": "Snow Showers",
-      "image": "extreme-night-snow.png"
-    }
-  },
-  "95": {
-    "day": {
-      "description": "Thunderstorm",
-      "image": "thunderstorms-day.png"
-    },
-    "night": {
-      "description": "Thunderstorm",
-      "image": "thunderstorms-night.png"
-    }
-  },
-  "96": {
-    "day": {
-      "description": "Light Thunderstorms With Hail",
-      "image": "thunderstorms-day-overcast-snow.png"
-    },
-    "night": {
-      "description": "Light Thunderstorms With Hail",
-      "image": "thunderstorms-night-overcast-snow.png"
-    }
-  },
-  "99": {
-    "day": {
-      "description": "Thunderstorm With Hail",
-      "image": "thunderstorms-day-extreme-snow.png"
-    },
-    "night": {
-      "description": "Thunderstorm With Hail",
-      "image": "thunderstorms-night-extreme-snow.png"
-    }
-  }
-}
-"""
+    def _put(self, key: tuple, image: Image) -> None:
+        """cache an image, evicting the least recently used past max_bytes"""
+        size = _image_bytes(image)
+        with self._lock:
+            existing = self._images.pop(key, None)
+            if existing is not None:
+                self.bytes -= _image_bytes(existing)
+            self._images[key] = image
+            self.bytes += size
+            while self.bytes > self.max_bytes and len(self._images) > 1:
+                _, evicted = self._images.popitem(last=False)
+                self.bytes -= _image_bytes(evicted)
+                self.evictions += 1
+
+
+    def stats(self) -> dict:
+        """cache counters"""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "images": len(self._images),
+            "bytes": self.bytes,
+        }
+
+
+def _image_bytes(image: Image) -> int:
+    """memory held by a decoded image"""
+    return image.width * image.height * len(image.getbands())
 
 
 class LocalIconSet(IconSet):
@@ -384,28 +263,238 @@ class LocalIconSet(IconSet):
 
     def load_weather_codes(self) -> dict:
         """load the weather codes"""
-        path = Path(self.name, "weather-codes.json")
-        return json.loads(read_text(__package__, path))
-        #return json.loads(HACK_CODE_JSON)
+        return _read_codes(self.name)
 
 
+    def fingerprint(self) -> str:
+        """a digest of the packaged codes, descriptions and images"""
+        return _fingerprint(self.name)
+
+
+    @timing.timed("icons.load.local")
     def load_image(self, filename:str) -> Image:
         """load the give image"""
+        from PIL import Image as PILImage
+
         path = Path(self.name, filename)
         data = read_binary(__package__, path)
         log.debug("loading image: %s", path)
-        return Image.open(BytesIO(data))
+        return PILImage.open(BytesIO(data))
+
+
+@functools.cache
+def _read_codes(name: str, filename: str = "weather-codes.json") -> dict:
+    """a packaged set's images per code and time of day, merged with the shared descriptions, once per process"""
+    images = json.loads(read_text(__package__, Path(name, filename)))
+    descriptions = json.loads(read_text(__package__, DESCRIPTIONS))
+    return {code: {tod: {"description": descriptions[code][tod], "image": image} for tod, image in tods.items()}
+            for code, tods in images.items()}
+
+
+@functools.cache
+def _fingerprint(name: str, filename: str = "weather-codes.json") -> str:
+    """a packaged set's digest, once per process"""
+    digest = hashlib.sha256()
+    digest.update(read_binary(__package__, Path(name, filename)))
+    digest.update(read_binary(__package__, DESCRIPTIONS))
+    images = {entry["image"] for tods in _read_codes(name, filename).values() for entry in tods.values()}
+    for image in sorted(images):
+        digest.update(image.encode("utf-8"))
+        digest.update(read_binary(__package__, Path(name, image)))
+    return digest.hexdigest()[:16]
+
+
+class AtlasIconSet(IconSet):
+    """icons from a packed atlas of decoded RGBA images, memory-mapped and sliced per icon
+
+    The atlas is built from the wrapped set on first use, see build_atlas(). By
+    default it's in the cache dir, named for the wrapped set's fingerprint, so
+    changed icons or codes build a new one and the old one is deleted."""
+    def __init__(self, wrapped: IconSet, path: Path | None = None, size: int = ATLAS_ICON_SIZE):
+        self._wrapped = wrapped
+        self._path = path
+        self._own_path = path is None # in the cache dir, named for the fingerprint
+        self.size = size
+        self._index = None
+        self._atlas = None
+        self._lock = threading.Lock()
+        super().__init__()
+
+
+    @property
+    def path(self) -> Path:
+        """the atlas file, its index alongside with a .json suffix"""
+        if self._path is None:
+            # hashing the icons waits for the first one, not the import
+            self._path = cache_dir() / f"icons-{self._wrapped.fingerprint()}-{self.size}.atlas"
+        return self._path
+
+
+    def _open(self) -> tuple[dict, mmap.mmap]:
+        """map the atlas, building it first if needed"""
+        with self._lock:
+            if self._atlas is None:
+                index_path = self.path.with_suffix(".json")
+                if not (self.path.exists() and index_path.exists()):
+                    if self._own_path:
+                        self._delete_others()
+                    build_atlas(self._wrapped, self.path, self.size)
+                self._index = json.loads(index_path.read_text(encoding="utf-8"))
+                with open(self.path, "rb") as f:
+                    self._atlas = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            return self._index, self._atlas
+
+
+    def _delete_others(self) -> None:
+        """the atlases of other icons in the cache dir, now out of date"""
+        for other in self.path.parent.glob(f"icons-*-{self.size}.*"):
+            if other.suffix in (".atlas", ".json") and other.stem != self.path.stem:
+                other.unlink(missing_ok=True)
+
+
+    def load_weather_codes(self) -> dict:
+        index, _ = self._open()
+        return index["codes"]
+
+
+    @timing.timed("icons.load.atlas")
+    def load_image(self, filename:str) -> Image:
+        """a zero-copy, read-only view of an icon in the atlas"""
+        from PIL import Image as PILImage
+
+        index, atlas = self._open()
+        offset, width, height = index["icons"][filename]
+        pixels = memoryview(atlas)[offset:offset + width * height * 4]
+        return PILImage.frombuffer("RGBA", (width, height), pixels, "raw", "RGBA", 0, 1)
+
+
+def build_atlas(source: IconSet, path: Path, size: int = ATLAS_ICON_SIZE) -> None:
+    """pack every icon of a set, decoded to RGBA and scaled to fit size, into one file
+
+    path holds the raw pixels back to back, path.json the codes and an offset index."""
+    codes = source.load_weather_codes()
+    filenames = sorted({entry["image"] for tods in codes.values() for entry in tods.values()})
+
+    icons = {}
+    offset = 0
+    # the index goes last, a reader only maps an atlas once both are there
+    with atomic_write(path) as f:
+        for filename in filenames:
+            image = prepare_image(source.load_image(filename), (size, size))
+            f.write(image.tobytes())
+            icons[filename] = [offset, image.width, image.height]
+            offset += image.width * image.height * 4
+    with atomic_write(path.with_suffix(".json"), "w", encoding="utf-8") as f:
+        json.dump({"codes": codes, "icons": icons}, f)
+    log.info("built icon atlas %s: %d icons, %d bytes", path, len(icons), offset)
 
 
 class HttpIconSet(IconSet):
-    # FIXME add init with session, use for requests
-    """load icons from the web"""
+    """load icons from the web over one pooled session, with a content-addressed disk cache
+
+    Cached icons are revalidated with ETag/Last-Modified at most once per
+    REVALIDATE_AFTER, and prefetch() fetches every distinct icon concurrently."""
+    REVALIDATE_AFTER = dt.timedelta(days=1)
+
+    def __init__(self, codes_file: str = "openweathermap-codes.json", session=None,
+                 path: Path | None = None, workers: int = 8):
+        self.codes_file = codes_file
+        self.path = path or cache_dir() / "http-icons"
+        self.workers = workers
+        self._session = session
+        self._index = JsonStore(self.path / "index.json") # url -> {"sha256", "etag", "last_modified", "checked"}
+        self._lock = threading.Lock()
+        super().__init__()
+
+
     def load_weather_codes(self) -> dict:
         """load the codes"""
-        with open("weather-codes.json", encoding="utf-8") as f:
-            return json.load(f)
+        return _read_codes("resources", self.codes_file)
+
+
+    @property
+    def session(self):
+        """a shared session, pooling a connection per worker"""
+        with self._lock:
+            if self._session is None:
+                import requests
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=self.workers)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self._session = session
+            return self._session
+
+
+    def prefetch(self, icons: list[tuple[str, str]]) -> None:
+        """fetch the distinct images for (code, time of day) pairs in parallel"""
+        urls = {self._get(code, tod)['image'] for code, tod in icons}
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            list(pool.map(self.fetch, urls))
+
 
+    @timing.timed("icons.load.http")
     def load_image(self, filename:str) -> Image:
         """load the image"""
-        log.debug("loading image url: %s", filename)
-        return Image.open(requests.get(filename, stream=True, timeout=TIMEOUT).raw)
+        from PIL import Image as PILImage
+
+        return PILImage.open(BytesIO(self.fetch(filename)))
+
+
+    @timing.timed("icons.fetch")
+    def fetch(self, url: str) -> bytes:
+        """image bytes for a url, from the disk cache when still valid"""
+        entry = self._index.get(url)
+        data = self._read_object(entry)
+        now = dt.datetime.now(dt.UTC)
+        if data is not None and now - dt.datetime.fromisoformat(entry["checked"]) < self.REVALIDATE_AFTER:
+            return data
+
+        headers = {}
+        if data is not None:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        log.debug("loading image url: %s", url)
+        response = self.session.get(url, headers=headers, timeout=TIMEOUT)
+        if response.status_code == 304 and data is not None:
+            self._update(url, dict(entry, checked=now.isoformat()))
+            return data
+
+        response.raise_for_status()
+        data = response.content
+        digest = hashlib.sha256(data).hexdigest()
+        self._write_object(digest, data)
+        self._update(url, {
+            "sha256": digest,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "checked": now.isoformat(),
+        })
+        return data
+
+
+    def _update(self, url: str, entry: dict) -> None:
+        """record an index entry and persist the index"""
+        self._index.put(url, entry)
+        self._index.save()
+
+
+    def _read_object(self, entry: dict | None) -> bytes | None:
+        """cached content for an index entry, if present"""
+        if not entry:
+            return None
+        try:
+            return (self.path / "objects" / entry["sha256"]).read_bytes()
+        except OSError:
+            return None
+
+
+    def _write_object(self, digest: str, data: bytes) -> None:
+        """store content by its hash"""
+        target = self.path / "objects" / digest
+        if not target.exists():
+            with atomic_write(target) as f:
+                f.write(data)
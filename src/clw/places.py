@@ -0,0 +1,125 @@
+"""
+Where to show the weather for, without asking the network: `clw --location`.
+
+Places come from the city database astral ships (capitals and the larger
+US, Canadian and UK cities), indexed once:
+
+    clw --location Seattle
+    clw --location "Birmingham, England"
+    clw --location 47.61,-122.33
+    clw --location 47.61,-122.33,America/Los_Angeles
+
+A name matches ignoring case and punctuation, then as the start of a name,
+then by the closest spelling. Coordinates keep their own latitude and
+longitude and take a name, and the timezone unless given, from the
+nearest place in the database, found with one vectorized pass over its
+points. Near a timezone border, give the timezone or a city.
+"""
+import dataclasses
+import difflib
+import functools
+import re
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+import numpy as np
+from astral import LocationInfo
+
+# astral's database uses some old zone names, open-meteo and the snapshots get the canonical ones
+LEGACY_ZONES = {
+    "Brazil/East": "America/Sao_Paulo",
+    "US/Alaska": "America/Anchorage",
+    "US/Central": "America/Chicago",
+    "US/Eastern": "America/New_York",
+    "US/Hawaii": "Pacific/Honolulu",
+    "US/Mountain": "America/Denver",
+    "US/Pacific": "America/Los_Angeles",
+}
+
+SUGGESTIONS = 3
+_COORDINATES = re.compile(r"^\s*(-?\d+(?:\.\d*)?)\s*,\s*(-?\d+(?:\.\d*)?)\s*(?:,\s*(\S+)\s*)?$")
+
+
+def _key(text: str) -> str:
+    """a name for matching: lower case letters and digits, single spaces"""
+    return " ".join(re.sub(r"[^\w]+", " ", text.lower()).split())
+
+
+def _unit_vectors(latitudes, longitudes) -> np.ndarray:
+    """points on the unit sphere, nearest by largest dot product"""
+    lat, lon = np.radians(latitudes), np.radians(longitudes)
+    return np.stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)], axis=-1)
+
+
+class Gazetteer:
+    """places by name and by position"""
+    def __init__(self, locations: list[LocationInfo]):
+        self.locations = [dataclasses.replace(location, timezone=LEGACY_ZONES.get(location.timezone, location.timezone))
+                          for location in locations]
+        self.names = {} # key -> indices of the places called that, "name" and "name region"
+        for i, location in enumerate(self.locations):
+            for key in (_key(location.name), _key(f"{location.name} {location.region}")):
+                self.names.setdefault(key, []).append(i)
+        self.points = _unit_vectors([location.latitude for location in self.locations],
+                                    [location.longitude for location in self.locations])
+
+
+    @classmethod
+    @functools.cache
+    def bundled(cls) -> "Gazetteer":
+        """the gazetteer of astral's city database, built on first use"""
+        from astral import geocoder
+
+        return cls(list(geocoder.all_locations(geocoder.database())))
+
+
+    def lookup(self, name: str) -> LocationInfo:
+        """the place called name, raising LookupError with suggestions when there isn't just one"""
+        key = _key(name)
+        found = self.names.get(key)
+        if found is None:
+            starting = sorted({i for other, indices in self.names.items() if other.startswith(key) for i in indices})
+            found = starting if key and len({self.locations[i].name for i in starting}) == 1 else None
+        if found is None:
+            close = difflib.get_close_matches(key, self.names, n=1, cutoff=0.8)
+            found = self.names[close[0]] if close else None
+        if found is None:
+            close = difflib.get_close_matches(key, self.names, n=SUGGESTIONS, cutoff=0.5)
+            titles = " or ".join(self._title(self.names[other][0]) for other in close)
+            hint = f", did you mean {titles}?" if close else ""
+            raise LookupError(f"no place called {name!r}{hint}")
+        if len(found) > 1:
+            raise LookupError(f"{name!r} is ambiguous: {' or '.join(self._title(i) for i in found)}")
+        return self.locations[found[0]]
+
+
+    def nearest(self, latitude: float, longitude: float) -> LocationInfo:
+        """the place nearest a point"""
+        return self.locations[int(np.argmax(self.points @ _unit_vectors(latitude, longitude)))]
+
+
+    def resolve(self, text: str) -> LocationInfo:
+        """a location from a place name, or latitude,longitude[,timezone]"""
+        match = _COORDINATES.match(text)
+        if match is None:
+            return self.lookup(text)
+
+        latitude, longitude, timezone = float(match[1]), float(match[2]), match[3]
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            raise LookupError(f"{text!r} is not a latitude,longitude")
+        if timezone:
+            try:
+                ZoneInfo(timezone)
+            except (ZoneInfoNotFoundError, ValueError) as ex:
+                raise LookupError(f"unknown timezone {timezone!r}") from ex
+        near = self.nearest(latitude, longitude)
+        return LocationInfo(near.name, near.region, timezone or near.timezone, latitude, longitude)
+
+
+    def _title(self, index: int) -> str:
+        location = self.locations[index]
+        return f"{location.name}, {location.region}"
+
+
+def resolve(text: str) -> LocationInfo:
+    """a location for --location, from the bundled gazetteer. Raises LookupError"""
+    return Gazetteer.bundled().resolve(text)
@@ -0,0 +1,211 @@
+"""
+Vectorized solar events: dawn, sunrise, noon, sunset and dusk for arrays of
+latitude, longitude and date in one pass.
+
+This is the NOAA solar calculation used by astral.sun, with the same
+two-pass transit refinement, refraction and elevation adjustments and
+next/previous day search, written over numpy arrays. Results match
+astral.sun.sun() to within a second (TOLERANCE), except on a DST change
+day, where an event within the changed hour of local midnight may be found
+on the neighbouring day. Where the sun never reaches an event's elevation
+(polar day or night) the time is NaT.
+"""
+import numpy as np
+
+EVENTS = ("dawn", "sunrise", "noon", "sunset", "dusk")
+
+# astral matches to the microsecond except for float rounding, allow a second
+TOLERANCE = np.timedelta64(1, "s")
+
+SUN_APPARENT_RADIUS = 32.0 / (60.0 * 2.0)
+CIVIL_DEPRESSION = 6.0
+EARTH_RADIUS = 6356900 # metres, as astral
+
+_UNIX_EPOCH_JULIANDAY = 2440587.5
+_J2000 = 2451545.0
+_RISING = 1
+_SETTING = -1
+
+
+def sun_times(latitude, longitude, dates, utc_offsets=0, elevation=0.0,
+              depression: float = CIVIL_DEPRESSION) -> dict[str, np.ndarray]:
+    """Calculate solar events for each (latitude, longitude, date).
+
+    Args:
+        latitude, longitude: degrees, broadcast against dates
+        dates: local calendar dates, anything np.asarray can make datetime64[D]
+        utc_offsets: seconds east of UTC on each date, used to find the event
+                     on the local calendar day as astral does
+        elevation: observer elevation in metres
+        depression: degrees below the horizon for dawn and dusk
+
+    Returns:
+        event name -> datetime64[us] UTC array, NaT where the event doesn't happen
+    """
+    latitude, longitude, days, utc_offsets, elevation = np.broadcast_arrays(
+        np.asarray(latitude, dtype=float),
+        np.asarray(longitude, dtype=float),
+        np.asarray(dates, dtype="datetime64[D]"),
+        np.asarray(utc_offsets, dtype=float),
+        np.asarray(elevation, dtype=float))
+
+    latitude = np.clip(latitude, -89.8, 89.8)
+    horizon = _adjust_to_horizon(elevation)
+
+    # dawn, sunrise, sunset and dusk, stacked on a leading axis so each step runs once
+    zenith = np.stack([
+        90.0 + depression + horizon,
+        90.0 + SUN_APPARENT_RADIUS + horizon,
+        90.0 + SUN_APPARENT_RADIUS + horizon,
+        90.0 + depression + horizon,
+    ])
+    direction = np.array([_RISING, _RISING, _SETTING, _SETTING]).reshape((4,) + (1,) * days.ndim)
+    stacked = (np.broadcast_to(a, zenith.shape) for a in (latitude, longitude, days, utc_offsets))
+    dawn, sunrise, sunset, dusk = _event(*stacked, zenith, direction)
+
+    return {
+        "dawn": dawn,
+        "sunrise": sunrise,
+        "noon": _noon(longitude, days),
+        "sunset": sunset,
+        "dusk": dusk,
+    }
+
+
+def _julianday(days: np.ndarray) -> np.ndarray:
+    """julian day at the start of each date"""
+    return days.astype(np.int64) + _UNIX_EPOCH_JULIANDAY
+
+
+def _to_datetime(days: np.ndarray, minutes: np.ndarray) -> np.ndarray:
+    """minutes past UTC midnight of each date as datetime64[us], NaT for nan"""
+    micros = np.floor(minutes * 60_000_000)
+    valid = np.isfinite(micros)
+    result = days.astype("datetime64[us]") + np.where(valid, micros, 0).astype("timedelta64[us]")
+    result[~valid] = np.datetime64("NaT", "us")
+    return result
+
+
+def _noon(longitude: np.ndarray, days: np.ndarray) -> np.ndarray:
+    """solar noon, evaluated once at the start of the day as astral does"""
+    jc = (_julianday(days) - _J2000) / 36525.0
+    minutes = 720.0 - 4.0 * longitude - _eq_of_time(jc)
+    # astral truncates to whole seconds
+    return _to_datetime(days, np.floor(minutes * 60.0) / 60.0)
+
+
+def _event(latitude, longitude, days, utc_offsets, zenith, direction) -> np.ndarray:
+    """transit times for a zenith, moved to the adjacent day when they fall off the local date"""
+    zenith = zenith + _refraction_at_zenith(zenith)
+    minutes = _transit(_julianday(days), latitude, longitude, zenith, direction)
+
+    # local calendar offset of the result from the requested date: -1, 0 or +1
+    shift = np.floor((minutes * 60.0 + utc_offsets) / 86400.0)
+    retry = np.isfinite(shift) & (shift != 0)
+    if retry.any():
+        # search the day before when the result landed after, and vice versa
+        retry_days = days[retry] - shift[retry].astype("timedelta64[D]")
+        retry_minutes = _transit(_julianday(retry_days), latitude[retry], longitude[retry],
+                                 zenith[retry], np.broadcast_to(direction, zenith.shape)[retry])
+        # express relative to the requested date
+        retry_minutes = retry_minutes - shift[retry] * 1440.0
+        retry_shift = np.floor((retry_minutes * 60.0 + utc_offsets[retry]) / 86400.0)
+        minutes = minutes.copy()
+        minutes[retry] = np.where(retry_shift == 0, retry_minutes, np.nan)
+
+    return _to_datetime(days, minutes)
+
+
+def _transit(julianday, latitude, longitude, zenith, direction) -> np.ndarray:
+    """minutes past UTC midnight when the sun crosses zenith, nan if it never does"""
+    adjustment = 0.0
+    minutes = np.zeros_like(julianday)
+    for _ in range(2):
+        jc = (julianday + adjustment - _J2000) / 36525.0
+        hour_angle = direction * _hour_angle(latitude, _declination(jc), zenith)
+        offset = (-longitude - np.degrees(hour_angle)) * 4.0 - _eq_of_time(jc)
+        offset = np.where(offset < -720.0, offset + 1440.0, offset)
+        minutes = 720.0 + offset
+        adjustment = minutes / 1440.0
+    return minutes
+
+
+def _hour_angle(latitude, declination, zenith) -> np.ndarray:
+    latitude = np.radians(latitude)
+    declination = np.radians(declination)
+    h = (np.cos(np.radians(zenith)) - np.sin(latitude) * np.sin(declination)) / (
+        np.cos(latitude) * np.cos(declination))
+    with np.errstate(invalid="ignore"):
+        return np.arccos(h) # nan outside [-1, 1]: the sun never gets there
+
+
+def _adjust_to_horizon(elevation: np.ndarray) -> np.ndarray:
+    """extra degrees of depression visible from above sea level"""
+    elevation = np.maximum(elevation, 0.0)
+    return np.degrees(np.arccos(EARTH_RADIUS / (EARTH_RADIUS + elevation)))
+
+
+def _refraction_at_zenith(zenith: np.ndarray) -> np.ndarray:
+    """degrees of atmospheric refraction at a zenith angle"""
+    elevation = 90.0 - zenith
+    te = np.tan(np.radians(elevation))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        high = 58.1 / te - 0.07 / te**3 + 0.000086 / te**5
+        low = 1735.0 + elevation * (-518.2 + elevation * (103.4 + elevation * (-12.79 + elevation * 0.711)))
+        below = -20.774 / te
+    correction = np.select(
+        [elevation >= 85.0, elevation > 5.0, elevation > -0.575],
+        [0.0, high, low],
+        below)
+    return correction / 3600.0
+
+
+def _geom_mean_long_sun(jc):
+    return (280.46646 + jc * (36000.76983 + 0.0003032 * jc)) % 360.0
+
+
+def _geom_mean_anomaly_sun(jc):
+    return 357.52911 + jc * (35999.05029 - 0.0001537 * jc)
+
+
+def _eccentric_location_earth_orbit(jc):
+    return 0.016708634 - jc * (0.000042037 + 0.0000001267 * jc)
+
+
+def _sun_eq_of_center(jc):
+    m = np.radians(_geom_mean_anomaly_sun(jc))
+    return (np.sin(m) * (1.914602 - jc * (0.004817 + 0.000014 * jc))
+            + np.sin(2 * m) * (0.019993 - 0.000101 * jc)
+            + np.sin(3 * m) * 0.000289)
+
+
+def _sun_apparent_long(jc):
+    true_long = _geom_mean_long_sun(jc) + _sun_eq_of_center(jc)
+    omega = 125.04 - 1934.136 * jc
+    return true_long - 0.00569 - 0.00478 * np.sin(np.radians(omega))
+
+
+def _obliquity_correction(jc):
+    seconds = 21.448 - jc * (46.815 + jc * (0.00059 - jc * 0.001813))
+    e0 = 23.0 + (26.0 + seconds / 60.0) / 60.0
+    omega = 125.04 - 1934.136 * jc
+    return e0 + 0.00256 * np.cos(np.radians(omega))
+
+
+def _declination(jc):
+    sint = np.sin(np.radians(_obliquity_correction(jc))) * np.sin(np.radians(_sun_apparent_long(jc)))
+    return np.degrees(np.arcsin(sint))
+
+
+def _eq_of_time(jc):
+    """equation of time, in minutes"""
+    l0 = np.radians(_geom_mean_long_sun(jc))
+    e = _eccentric_location_earth_orbit(jc)
+    m = np.radians(_geom_mean_anomaly_sun(jc))
+    y = np.tan(np.radians(_obliquity_correction(jc)) / 2.0) ** 2
+    etime = (y * np.sin(2.0 * l0)
+             - 2.0 * e * np.sin(m)
+             + 4.0 * e * y * np.sin(m) * np.cos(2.0 * l0)
+             - 0.5 * y * y * np.sin(4.0 * l0)
+             - 1.25 * e * e * np.sin(2.0 * m))
+    return np.degrees(etime) * 4.0
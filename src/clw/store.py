@@ -0,0 +1,81 @@
+"""
+Files in the cache dir that other processes, and threads, read while they're written.
+
+Every write goes to a temp file named for the process and thread beside
+the target and is renamed over it, so a reader sees the old file or the
+new one, never part of either.
+"""
+import contextlib
+import json
+import os
+import threading
+from collections.abc import Callable
+from pathlib import Path
+
+
+@contextlib.contextmanager
+def atomic_write(path: Path, mode: str = "wb", **kwargs):
+    """open a temp file to write path's new content, replacing path with it on success"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with open(tmp, mode, **kwargs) as file:
+            yield file
+        os.replace(tmp, path)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+class JsonStore:
+    """a json object in a file, read on first use and written back by save() when it has changed
+
+    path may be a function returning it, called on each use, so a store made
+    at import follows the cache dir to wherever it is by then."""
+    def __init__(self, path: Path | Callable[[], Path]):
+        self._path = path
+        self._loaded = None # the path _data was read from
+        self._data = None
+        self._dirty = False
+        self._lock = threading.Lock()
+
+
+    @property
+    def path(self) -> Path:
+        return Path(self._path() if callable(self._path) else self._path)
+
+
+    def _load(self) -> dict:
+        path = self.path
+        if path != self._loaded:
+            try:
+                self._data = json.loads(path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                self._data = {}
+            self._loaded = path
+            self._dirty = False
+        return self._data
+
+
+    def get(self, key: str, default=None):
+        with self._lock:
+            return self._load().get(key, default)
+
+
+    def put(self, key: str, value) -> None:
+        """set key, marking the store changed if its value did"""
+        with self._lock:
+            data = self._load()
+            if data.get(key) != value:
+                data[key] = value
+                self._dirty = True
+
+
+    def save(self) -> None:
+        """write the file, if anything changed"""
+        with self._lock:
+            if not self._dirty:
+                return
+            with atomic_write(self._loaded, "w", encoding="utf-8") as file:
+                json.dump(self._data, file)
+            self._dirty = False
@@ -0,0 +1,169 @@
+"""
+Lightweight hot-path instrumentation: timed spans and counters.
+
+Disabled (the default) a span is a flag check returning a shared no-op
+context manager, so instrumentation stays in place in production:
+
+    with timing.span("weather.fetch"):
+        ...
+
+    @timing.timed("icons.load")
+    def load(...): ...
+
+    timing.count("http.cache_hit")
+
+When enabled, every span is kept (up to MAX_EVENTS) for a Chrome trace
+(chrome://tracing, ui.perfetto.dev) and aggregated per name for summary()
+and the app's timing overlay.
+"""
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+
+MAX_EVENTS = 100_000
+
+_NULL = contextlib.nullcontext()
+
+
+class Stat:
+    """aggregate timing for one span name, in nanoseconds"""
+    __slots__ = ("count", "last", "max", "total")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.max = 0
+        self.last = 0
+
+
+    def add(self, duration: int) -> None:
+        self.count += 1
+        self.total += duration
+        self.last = duration
+        self.max = max(self.max, duration)
+
+
+class Recorder:
+    """collects spans and counters from any thread"""
+    def __init__(self, max_events: int = MAX_EVENTS):
+        self.enabled = False
+        self.origin = time.perf_counter_ns()
+        self.events = deque(maxlen=max_events) # (name, start, duration, thread id)
+        self.stats: dict[str, Stat] = {}
+        self.counters: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+
+    def record(self, name: str, start: int, duration: int) -> None:
+        with self._lock:
+            self.events.append((name, start, duration, threading.get_ident()))
+            stat = self.stats.get(name)
+            if stat is None:
+                stat = self.stats[name] = Stat()
+            stat.add(duration)
+
+
+    def count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+
+    def clear(self) -> None:
+        with self._lock:
+            self.events.clear()
+            self.stats.clear()
+            self.counters.clear()
+
+
+class _Span:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+
+    def __exit__(self, *exc):
+        recorder.record(self.name, self.start, time.perf_counter_ns() - self.start)
+
+
+recorder = Recorder()
+
+
+def enable(on: bool = True) -> None:
+    """start (or stop) recording"""
+    recorder.enabled = on
+
+
+def enabled() -> bool:
+    return recorder.enabled
+
+
+def span(name: str):
+    """context manager timing a block, a shared no-op when disabled"""
+    if not recorder.enabled:
+        return _NULL
+    return _Span(name)
+
+
+def timed(name: str):
+    """decorator timing every call of a function as a span"""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not recorder.enabled:
+                return fn(*args, **kwargs)
+            with _Span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def count(name: str, n: int = 1) -> None:
+    """add to a counter, a no-op when disabled"""
+    if recorder.enabled:
+        recorder.count(name, n)
+
+
+def summary() -> str:
+    """a table of span timings by total time, then the counters"""
+    with recorder._lock:
+        stats = sorted(recorder.stats.items(), key=lambda item: item[1].total, reverse=True)
+        counters = sorted(recorder.counters.items())
+
+    lines = [f"{'span':<28} {'count':>7} {'total ms':>10} {'mean ms':>9} {'max ms':>9}"]
+    for name, stat in stats:
+        lines.append(f"{name:<28} {stat.count:>7} {stat.total / 1e6:>10.2f} "
+                     f"{stat.total / stat.count / 1e6:>9.3f} {stat.max / 1e6:>9.3f}")
+    for name, value in counters:
+        lines.append(f"{name:<28} {value:>7}")
+    return "\n".join(lines)
+
+
+def write_chrome_trace(path: str) -> None:
+    """write recorded spans and final counter values as Chrome trace event json"""
+    pid = os.getpid()
+    with recorder._lock:
+        events = [{
+            "name": name,
+            "cat": name.split(".", 1)[0],
+            "ph": "X",
+            "ts": (start - recorder.origin) / 1000, # microseconds
+            "dur": duration / 1000,
+            "pid": pid,
+            "tid": tid,
+        } for name, start, duration, tid in recorder.events]
+        end = (time.perf_counter_ns() - recorder.origin) / 1000
+        events.extend({"name": name, "ph": "C", "ts": end, "pid": pid, "args": {"value": value}}
+                      for name, value in recorder.counters.items())
+
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, file)
@@ -2,23 +2,57 @@
 """
 Experiments with dawn, sunset and weather
 """
-import logging
 import datetime as dt
-
-import openmeteo_requests
-
-import requests_cache
-import pandas as pd
-from retry_requests import retry
-
+import functools
+import json
+import logging
+import math
+import sys
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping
+from pathlib import Path
+from typing import NamedTuple
+from urllib.parse import parse_qsl, urlsplit
+
+import numpy as np
 from astral import LocationInfo
-from astral.sun import sun
+
+from . import cache_dir, solar, timing
+from .store import JsonStore, atomic_write
 
 log = logging.getLogger(__name__)
 
 # CONSTANTS
 TIMEOUT = 2 #seconds
 
+# persistent HTTP cache, stored as sqlite under the XDG user cache dir
+CACHE_NAME = "clw"
+LOCATION_EXPIRY = dt.timedelta(days=1)
+MODEL_UPDATE_INTERVAL = dt.timedelta(hours=1) # open-meteo refreshes forecasts hourly
+MODEL_UPDATE_LAG = dt.timedelta(minutes=5)    # ... and publishes a few minutes later
+
+# locations sent per multi-location forecast request
+BATCH_SIZE = 100
+
+# memoized sun records, keyed on location rounded to ~1km (sun times move ~2s per 0.01°)
+SUN_CACHE_SIZE = 4096
+SUN_CACHE_PRECISION = 2
+
+# last forecast fetched per location, as .npz under the user cache dir
+SNAPSHOT_DIR = "snapshots"
+
+# the model grid cell each requested coordinate snaps to, learned per ~100m
+# and kept under the user cache dir
+GRID_CELL_PRECISION = 3
+GRID_CELLS_FILE = "grid-cells.json"
+
+# ground elevation per ~1km tile, as the sun records are rounded, kept under the user cache dir
+ELEVATION_TILE_PRECISION = SUN_CACHE_PRECISION
+ELEVATION_FILE = "elevation.json"
+
+_EPOCH = dt.datetime(1970, 1, 1, tzinfo=dt.UTC)
+
 
 DATE_FORMAT = "%a %b %d"
 TIME_FORMAT = "%H:%M"
@@ -31,71 +65,362 @@ EMOJI = {
     "dusk": "🌃",
 }
 
+# flatbuffers unit names, spelled as in the json api's "hourly_units"
+UNITS = {
+    "celsius": "°C",
+    "fahrenheit": "°F",
+    "kelvin": "K",
+    "percentage": "%",
+    "wmo_code": "wmo code",
+    "millimetre": "mm",
+    "centimetre": "cm",
+    "inch": "inch",
+    "metre": "m",
+    "feet": "ft",
+    "kilometres_per_hour": "km/h",
+    "miles_per_hour": "mp/h",
+    "metre_per_second": "m/s",
+    "knots": "kn",
+    "degree_direction": "°",
+    "hectopascal": "hPa",
+    "watt_per_square_metre": "W/m²",
+    "seconds": "s",
+    "hours": "h",
+    "dimensionless": "",
+    "dimensionless_integer": "",
+}
+
 ## SEE https://open-meteo.com/en/docs for weather API details
 
+def next_model_update(now: dt.datetime | None = None) -> dt.datetime:
+    """when the next forecast model update is expected to be published"""
+    now = now or dt.datetime.now(dt.UTC)
+    last = _EPOCH + ((now - _EPOCH - MODEL_UPDATE_LAG) // MODEL_UPDATE_INTERVAL) * MODEL_UPDATE_INTERVAL
+    return last + MODEL_UPDATE_INTERVAL + MODEL_UPDATE_LAG
+
+
+def is_expired(fetched: dt.datetime, now: dt.datetime | None = None) -> bool:
+    """whether a newer forecast model should be out than the one fetched then"""
+    return next_model_update(fetched) <= (now or dt.datetime.now(dt.UTC))
+
+
+class Cell(NamedTuple):
+    """locations sharing a forecast, requested once at latitude, longitude for them all"""
+    latitude: float
+    longitude: float
+    timezone: str
+    locations: list[LocationInfo]
+
+
+class GridCells:
+    """the model grid cell each requested coordinate snaps to, learned from responses
+
+    The api answers for the grid cell a coordinate falls in, so locations in a
+    known cell are requested once, at the cell's own coordinates: the request,
+    its http cache entry and the parsed Forecast are shared by all of them."""
+    def __init__(self, path: Path | None = None):
+        # rounded "lat,lon" -> [lat, lon] of the cell, under the cache dir as it is when used
+        self.cells = JsonStore(path or (lambda: cache_dir() / GRID_CELLS_FILE))
+
+
+    @staticmethod
+    def key(latitude: float, longitude: float) -> str:
+        return f"{latitude:.{GRID_CELL_PRECISION}f},{longitude:.{GRID_CELL_PRECISION}f}"
+
+
+    def group(self, locations: list[LocationInfo]) -> list[Cell]:
+        """locations grouped by known cell and timezone, in the order first seen.
+
+        Until its cell is learned, a location is grouped with those within
+        GRID_CELL_PRECISION and requested at its own coordinates."""
+        groups = {}
+        for location in locations:
+            key = self.key(location.latitude, location.longitude)
+            cell = self.cells.get(key)
+            group_key = (key if cell is None else tuple(cell), location.timezone)
+            if group_key not in groups:
+                latitude, longitude = cell or (location.latitude, location.longitude)
+                groups[group_key] = Cell(latitude, longitude, location.timezone, [])
+            groups[group_key].locations.append(location)
+        return list(groups.values())
+
+
+    def learn(self, cell: Cell, latitude: float, longitude: float) -> None:
+        """record the cell the api snapped a request to, for every location in it"""
+        snapped = [round(float(latitude), 5), round(float(longitude), 5)]
+        for location in cell.locations:
+            self.cells.put(self.key(location.latitude, location.longitude), snapped)
+
+
+    def save(self) -> None:
+        """write the cells to disk, if any were learned"""
+        self.cells.save()
+
+
+class ElevationTiles:
+    """ground elevation in metres per tile of ELEVATION_TILE_PRECISION degrees, learned and kept between runs
+
+    Every forecast response says the elevation it was made for, so a tile is
+    learned for free from the first fetch at a location's own coordinates
+    (later ones are snapped to its grid cell), and WeatherSession.elevation
+    only asks open-elevation for a tile no forecast has been fetched in."""
+    def __init__(self, path: Path | None = None):
+        # rounded "lat,lon" -> metres, under the cache dir as it is when used
+        self.tiles = JsonStore(path or (lambda: cache_dir() / ELEVATION_FILE))
+
+
+    @staticmethod
+    def key(latitude: float, longitude: float) -> str:
+        return f"{latitude:.{ELEVATION_TILE_PRECISION}f},{longitude:.{ELEVATION_TILE_PRECISION}f}"
+
+
+    def get(self, latitude: float, longitude: float) -> float | None:
+        """the elevation of the tile a point is in, None when it hasn't been learned"""
+        return self.tiles.get(self.key(latitude, longitude))
+
+
+    def learn(self, locations: list[LocationInfo], elevation: float) -> None:
+        """record the elevation of the tiles locations are in"""
+        if math.isnan(elevation): # the api didn't say
+            return
+        elevation = round(float(elevation), 1)
+        for location in locations:
+            self.tiles.put(self.key(location.latitude, location.longitude), elevation)
+
+
+    def save(self) -> None:
+        """write the tiles to disk, if any were learned"""
+        self.tiles.save()
+
+
 class WeatherSession:
     """encapsulate a session"""
     URL = "https://api.open-meteo.com/v1/forecast"
-    def __init__(self):
-        # Setup the Open-Meteo API client with cache and retry on error
-        cache_session = requests_cache.CachedSession(backend="memory", expire_after=3600)
-        self.session = retry(cache_session, retries = 5, backoff_factor = 0.2)
+    LOCATION_URL = "https://ipinfo.io"
+    ELEVATION_URL = "https://api.open-elevation.com/api/v1/lookup"
+
+    cells = GridCells() # shared by every session, like the http cache
+    elevations = ElevationTiles()
+
+    def __init__(self, backend: str = "sqlite", retries: int = 5, pool_size: int = 10, session=None):
+        """retries: blocking retries per request, 0 leaves retrying to the caller (see fleet.FleetFetcher)
+        pool_size: connections kept per host without retries, for sharing the session across threads
+        session: an http session to use instead of the cached one, ie a stub serving recorded responses"""
+        # the http stack is slow to import, so only load it once a session is needed
+        import openmeteo_requests
+
+        self._served = threading.local() # the last response on each thread, cached or not
+        self.session = self._cached_session(backend, retries, pool_size) if session is None else session
+        hooks = getattr(self.session, "hooks", None)
+        if hooks is not None:
+            hooks["response"].append(self._remember)
         self.openmeteo = openmeteo_requests.Client(session = self.session)
 
-    def get(self, location: LocationInfo, **params):
-        """use the openmeteo client"""
-        params.update({
-	        "latitude": location.latitude,
-	        "longitude": location.longitude,
-        })
-        responses = self.openmeteo.weather_api(self.URL, params=params)
-        response = responses[0]
-        print(f"Coordinates {response.Latitude()}°N {response.Longitude()}°E")
-        print(f"Elevation {response.Elevation()} m asl")
-        print(f"Timezone {response.Timezone()} {response.TimezoneAbbreviation()}")
-        print(f"Timezone difference to GMT+0 {response.UtcOffsetSeconds()} s")
-
-        # Process hourly data. The order of variables needs to be the same as requested.
-        hourly = response.Hourly() # should be hourly.Variables(i) in order of params['hourly']
-        hourly_temperature_2m = hourly.Variables(0).ValuesAsNumpy()
-        # data is:
-        # rows of ?? date
-        # cols of values
-        # broken out by Current Daily Hourly Minutely15 SixHourly,
-        # each with per-segment value.
-
-        hourly_data = {"date": pd.date_range(
-            start = pd.to_datetime(hourly.Time(), unit = "s", utc = True),
-            end = pd.to_datetime(hourly.TimeEnd(), unit = "s", utc = True),
-            freq = pd.Timedelta(seconds = hourly.Interval()),
-            inclusive = "left"
-        )}
-
-        hourly_data["temperature_2m"] = hourly_temperature_2m
-
-        hourly_dataframe = pd.DataFrame(data = hourly_data)
-        print(hourly_dataframe)
-        return hourly_dataframe
 
+    @staticmethod
+    def _cached_session(backend: str, retries: int, pool_size: int):
+        import requests_cache
+        from requests.adapters import HTTPAdapter
+        from retry_requests import retry
+
+        # Setup the Open-Meteo API client with a persistent cache and retry on error.
+        # Entries expired by less than a model update are served immediately and
+        # refreshed in the background, older ones are fetched again.
+        cache_session = requests_cache.CachedSession(
+            CACHE_NAME,
+            backend=backend,
+            use_cache_dir=True,
+            stale_while_revalidate=MODEL_UPDATE_INTERVAL,
+            urls_expire_after={
+                "ipinfo.io": LOCATION_EXPIRY,
+                "api.open-elevation.com": requests_cache.NEVER_EXPIRE,
+            })
+        if retries:
+            return retry(cache_session, retries = retries, backoff_factor = 0.2)
+        adapter = HTTPAdapter(max_retries=0, pool_maxsize=pool_size)
+        for prefix in ("http://", "https://"):
+            cache_session.mount(prefix, adapter)
+        return cache_session
+
+
+    def _remember(self, response, *_args, **kwargs) -> None:
+        self._served.response = response
+        self._served.kwargs = kwargs # as sent, the cache key depends on some
+
+
+    def _fetched(self) -> dt.datetime:
+        """when the last response on this thread came from the api, before now when it was served from the cache"""
+        created = getattr(getattr(self._served, "response", None), "created_at", None)
+        if created is None:
+            return dt.datetime.now(dt.UTC)
+        return created if created.tzinfo else created.replace(tzinfo=dt.UTC)
 
+
+    def get(self, location: LocationInfo, **params):
+        """Given a location, get the weather as a Forecast, using the openmeteo flatbuffers client"""
+        _, forecast = next(self.get_many([location], **params))
+        return forecast
+
+
+    def get_many(self, locations: list[LocationInfo], batch_size: int = BATCH_SIZE, **params):
+        """Given many locations, get the weather with one flatbuffers request per batch.
+
+        Yields (location, Forecast) pairs a batch at a time, in the order given
+        except that locations sharing a grid cell come together, with one Forecast."""
+        for batch, batch_params in self._batches(locations, batch_size, params):
+            yield from self.fetch_batch(batch, batch_params)
+
+
+    @timing.timed("weather.fetch")
+    def fetch_batch(self, batch: list[Cell], batch_params: dict, **kwargs) -> list[tuple]:
+        """one flatbuffers request for a batch of cells from _batches, returning (location, Forecast) pairs.
+
+        kwargs are passed on to the http session, ie timeout."""
+        variables = batch_params["hourly"].split(",")
+        responses = self.openmeteo.weather_api(
+            self.URL, params=batch_params, expire_after=next_model_update(), **kwargs)
+        fetched = self._fetched()
+        forecasts = []
+        for response in responses:
+            cell = batch[response.LocationId()]
+            log.debug("%d locations snapped to %s,%s", len(cell.locations), response.Latitude(), response.Longitude())
+            self.cells.learn(cell, response.Latitude(), response.Longitude())
+            self._learn_elevation(cell, response.Elevation())
+            forecast = Forecast.from_flatbuffers(response, variables, cell.locations[0].tzinfo, fetched)
+            forecasts.extend((location, forecast) for location in cell.locations)
+        self.cells.save()
+        self.elevations.save()
+        self._cache_as_learned(batch)
+        return forecasts
+
+
+    @timing.timed("weather.get_json")
     def get_json(self, location: LocationInfo, **params) -> dict:
         """Given a location, get the weather for the next 7 days"""
-
-        params.update({
-	        "latitude": location.latitude,
-	        "longitude": location.longitude,
-            "timezone": location.timezone,
+        cell = self.cells.group([location])[0]
+        params.update(self._cell_params([cell]))
+
+        response = self.session.get(self.URL, params, expire_after=next_model_update())
+        _count_cache(response)
+        data = self._api_json(response)
+        if "latitude" in data:
+            self.cells.learn(cell, data["latitude"], data["longitude"])
+            self.cells.save()
+        if "elevation" in data:
+            self._learn_elevation(cell, data["elevation"])
+            self.elevations.save()
+        self._cache_as_learned([cell])
+        return data
+
+
+    def get_json_many(self, locations: list[LocationInfo], batch_size: int = BATCH_SIZE, **params):
+        """Given many locations, get the weather with one request per batch.
+
+        Yields (location, data) pairs a batch at a time, locations sharing a grid cell together."""
+        for batch, batch_params in self._batches(locations, batch_size, params):
+            data = self._api_json(self.session.get(self.URL, batch_params, expire_after=next_model_update()))
+            if isinstance(data, dict):
+                data = [data] # a single location is not wrapped in a list
+
+            located = []
+            for i, entry in enumerate(data):
+                # multi-location responses are in request order, with an optional location_id
+                cell = batch[entry.get("location_id", i)]
+                self.cells.learn(cell, entry["latitude"], entry["longitude"])
+                self._learn_elevation(cell, entry.get("elevation", float("nan")))
+                located.extend((location, entry) for location in cell.locations)
+            self.cells.save()
+            self.elevations.save()
+            self._cache_as_learned(batch) # before the caller can send anything else on this thread
+            yield from located
+
+
+    def _api_json(self, response):
+        """a forecast response's json, raising OpenMeteoRequestsError for an error.
+
+        Raised as the flatbuffers client does, wrapping one carrying the
+        api's {"error": true, "reason": ...} body (see fleet.retryable)."""
+        from openmeteo_requests.Client import OpenMeteoRequestsError
+
+        try:
+            data = response.json()
+        except ValueError: # not the api answering, ie a proxy's error page
+            response.raise_for_status()
+            raise
+        if isinstance(data, dict) and data.get("error"):
+            try:
+                raise OpenMeteoRequestsError(data)
+            except OpenMeteoRequestsError as ex:
+                raise OpenMeteoRequestsError(f"failed to request {self.URL!r}: {data.get('reason')}") from ex
+        response.raise_for_status()
+        return data
+
+
+    def _learn_elevation(self, cell: Cell, elevation: float) -> None:
+        """learn the elevation the api gave for a request, for the locations it was made at.
+
+        Those in a known grid cell were requested at the cell's coordinates, the
+        elevation is the cell's, not theirs."""
+        here = [location for location in cell.locations
+                if (location.latitude, location.longitude) == (cell.latitude, cell.longitude)]
+        if here:
+            self.elevations.learn(here, elevation)
+
+
+    def _batches(self, locations: list[LocationInfo], batch_size: int, params: dict):
+        """group locations into grid cells and split those into batches, yielding (batch of cells, request params)"""
+        cells = self.cells.group(locations)
+        for start in range(0, len(cells), batch_size):
+            batch = cells[start:start + batch_size]
+            batch_params = dict(params)
+            batch_params.update(self._cell_params(batch))
+            yield batch, batch_params
+
+
+    @staticmethod
+    def _cell_params(cells: list[Cell]) -> dict:
+        """the request params placing a forecast at each of cells"""
+        return {
+            "latitude": ",".join(str(cell.latitude) for cell in cells),
+            "longitude": ",".join(str(cell.longitude) for cell in cells),
+            "timezone": ",".join(cell.timezone for cell in cells),
             "temperature_unit": "fahrenheit",
-        })
-
-        return self.session.get(self.URL, params).json()
+        }
 
 
+    def _cache_as_learned(self, batch: list[Cell]) -> None:
+        """cache the last response on this thread again, as the request for batch now its cells are known.
+
+        A location is requested at its own coordinates until its cell is
+        learned, then at the cell's: without a copy under that request's key,
+        the next run would miss the http cache the first one filled."""
+        response = getattr(self._served, "response", None)
+        cache = getattr(self.session, "cache", None)
+        if response is None or cache is None or getattr(response, "from_cache", False):
+            return
+        cells = self.cells.group([location for cell in batch for location in cell.locations])
+        if len(cells) != len(batch): # cells merged, the next request has fewer locations than this response
+            return
+
+        url = urlsplit(response.request.url)
+        sent = dict(parse_qsl(url.query))
+        learned = sent | {name: value for name, value in self._cell_params(cells).items() if name in sent}
+        if learned == sent:
+            return
+        request = response.request.copy()
+        request.prepare_url(url._replace(query="").geturl(), learned)
+        key = cache.create_key(request, **getattr(self._served, "kwargs", {}))
+        cache.save_response(response, key, getattr(response, "expires", None))
+
+
+    @timing.timed("weather.location")
     def location(self) -> LocationInfo:
         """Call ipinfo.io service to resolve external IP address and geoloc data"""
         # Could also use ipinfo.io
         # Get the public IP address of the caller
-        response = self.session.get('https://ipinfo.io', timeout=TIMEOUT).json()
+        response = self.session.get(self.LOCATION_URL, timeout=TIMEOUT)
+        _count_cache(response)
+        response = response.json()
         loc_strs = response.get("loc").split(',') # "loc": "47.6062,-122.3321"
         latitude = float(loc_strs[0])
         longitude = float(loc_strs[1])
@@ -109,22 +434,92 @@ class WeatherSession:
         return location
 
 
+    @timing.timed("weather.elevation")
     def elevation(self, loc:LocationInfo) -> float:
-        """elevation for a give location"""
+        """elevation for a give location, from its tile when known"""
+        elevation = self.elevations.get(loc.latitude, loc.longitude)
+        if elevation is not None:
+            return elevation
+
         #https://api.open-elevation.com/api/v1/lookup?locations=41.161758,-8.583933
-        url = "https://api.open-elevation.com/api/v1/lookup"
         params = {
             "locations": f"{loc.latitude},{loc.longitude}"
         }
 
-        response = self.session.get(url, params, timeout=TIMEOUT).json()
+        response = self.session.get(self.ELEVATION_URL, params, timeout=TIMEOUT).json()
 
         #{"results":[{"latitude":41.161758,"longitude":-8.583933,"elevation":117.0}]}
-        return response['results'][0]['elevation']
+        elevation = response['results'][0]['elevation']
+        self.elevations.learn([loc], elevation)
+        self.elevations.save()
+        return elevation
+
+
+def _count_cache(response) -> None:
+    """count http cache hits and misses"""
+    timing.count("http.cache_hit" if getattr(response, "from_cache", False) else "http.cache_miss")
+
+
+class SunCache:
+    """bounded LRU of SunRecords keyed on (rounded lat, rounded lon, date, timezone)"""
+    def __init__(self, maxsize: int = SUN_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._records = OrderedDict()
+        self._lock = threading.Lock()
+
+
+    @staticmethod
+    def key(location: LocationInfo, day: dt.date, elevation: float = 0.0) -> tuple:
+        """the cache key for a location, day and elevation"""
+        return (round(location.latitude, SUN_CACHE_PRECISION),
+                round(location.longitude, SUN_CACHE_PRECISION),
+                day,
+                location.timezone,
+                round(elevation))
+
+
+    def get(self, key: tuple):
+        """a cached record, or None"""
+        with self._lock:
+            record = self._records.get(key)
+            if record is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._records.move_to_end(key)
+            return record
+
+
+    def put(self, key: tuple, record) -> None:
+        """cache a record, evicting the least recently used past maxsize"""
+        with self._lock:
+            self._records[key] = record
+            self._records.move_to_end(key)
+            while len(self._records) > self.maxsize:
+                self._records.popitem(last=False)
+
+
+    def clear(self) -> None:
+        """drop all records and reset counters"""
+        with self._lock:
+            self._records.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+
+    def __repr__(self) -> str:
+        return f"SunCache(hits={self.hits}, misses={self.misses}, size={len(self)}/{self.maxsize})"
 
 
 class SunRecord:
     """sun-related times"""
+    __slots__ = solar.EVENTS
     dawn: dt.datetime
     sunrise: dt.datetime
     noon: dt.datetime
@@ -133,19 +528,52 @@ class SunRecord:
 
     # TODO: moon rise,zenith,set and phase.
 
-    """times of sunrise and sunset"""
-    def __init__(self, location: LocationInfo, day: dt.date):
-        #elevation = session.get_elevation(location)
-        #observer = Observer(location.latitude, location.longitude, elevation)
-        #log.debug(f"observer: {observer}")
-        for key, timestamp in sun(location.observer, day).items():
-            setattr(self, key, timestamp.astimezone(location.tzinfo))
+    """times of sunrise and sunset, None when the sun doesn't get there (polar day or night)"""
+    def __init__(self, location: LocationInfo, day: dt.date, times: dict[str, dt.datetime] | None = None,
+                 elevation: float = 0.0):
+        """elevation: of the observer in metres, the sun rises earlier and sets later higher up"""
+        if times is None:
+            times = _sun_times(location, [day], elevation)[0]
+        for key, timestamp in times.items():
+            setattr(self, key, timestamp)
+
+
+    cache = SunCache()
+
+    @classmethod
+    @timing.timed("sun.for_days")
+    def for_days(cls, location: LocationInfo, days: list[dt.date]) -> list["SunRecord"]:
+        """memoized sun records for many days, with a single vectorized solar calculation for misses.
+
+        The observer is at the elevation of the location's tile, once a forecast has said what it is."""
+        elevation = WeatherSession.elevations.get(location.latitude, location.longitude) or 0.0
+        keys = [cls.cache.key(location, day, elevation) for day in days]
+        records = [cls.cache.get(key) for key in keys]
+        missing = [i for i, record in enumerate(records) if record is None]
+        if missing:
+            # compute from the rounded location, so a record doesn't depend on who asked first
+            latitude, longitude = keys[missing[0]][:2]
+            rounded = LocationInfo(location.name, location.region, location.timezone, latitude, longitude)
+            missing_days = [days[i] for i in missing]
+            for i, times in zip(missing, _sun_times(rounded, missing_days, elevation)):
+                records[i] = cls(rounded, days[i], times)
+                cls.cache.put(keys[i], records[i])
+        return records
+
+
+    @classmethod
+    def for_day(cls, location: LocationInfo, day: dt.date) -> "SunRecord":
+        """a memoized sun record"""
+        return cls.for_days(location, [day])[0]
 
 
     def hours(self) -> dict[int,(str,dt.datetime)]:
         """an hour-indexed map of sun time"""
         values = {}
-        for name, timestamp in self.__dict__.items():
+        for name in self.__slots__:
+            timestamp = getattr(self, name)
+            if timestamp is None:
+                continue
             hour = timestamp.hour
             if timestamp.hour in values:
                 hour += 1
@@ -155,92 +583,375 @@ class SunRecord:
 
     def time_of_day(self, hour:int):
         """Day or night?"""
+        if self.dawn is None or self.dusk is None: # polar, guess from whether the sun rises
+            return "night" if self.sunrise is None else "day"
         if hour <= self.dawn.hour or hour >= self.dusk.hour:
             return "night"
         else:
             return "day"
 
 
+def _sun_times(location: LocationInfo, days: list[dt.date], elevation: float = 0.0) -> list[dict[str, dt.datetime]]:
+    """solar events for each day in the location's timezone, as datetimes, seen from elevation metres"""
+    tz = location.tzinfo
+    offsets = [tz.utcoffset(dt.datetime.combine(day, dt.time(12))).total_seconds() for day in days]
+    events = solar.sun_times(location.latitude, location.longitude, days, offsets, elevation)
+
+    results = [{} for _ in days]
+    for name in solar.EVENTS:
+        micros = events[name].astype("datetime64[us]").astype(np.int64).tolist()
+        for result, value, valid in zip(results, micros, (~np.isnat(events[name])).tolist()):
+            result[name] = (_EPOCH + dt.timedelta(microseconds=value)).astimezone(tz) if valid else None
+    return results
+
+
+class Forecast:
+    """columnar hourly forecast: one numpy array per variable along a local datetime64 time axis"""
+    __slots__ = ("_matrix", "columns", "fetched", "times", "units", "values")
+    times: np.ndarray # datetime64[m], local wall-clock time
+    values: dict[str, np.ndarray] # variable name -> values, aligned with times
+    units: dict[str, str] # variable name -> units
+    columns: dict[str, int] # variable name -> column in the per-day arrays
+    fetched: dt.datetime | None # when the api sent it, None when not known
+
+    def __init__(self, times: np.ndarray, values: dict[str, np.ndarray], units: dict[str, str],
+                 fetched: dt.datetime | None = None):
+        # variable names are interned once here and shared by every DailyRecord
+        self.times = times
+        self.fetched = fetched
+        self.values = {sys.intern(name): column for name, column in values.items()}
+        self.units = {sys.intern(name): units[name] for name in values}
+        self.columns = {name: i for i, name in enumerate(self.values)}
+        self._matrix = None
+
+
+    @classmethod
+    def from_json(cls, data: dict):
+        """build from an open-meteo json response with an 'hourly' section"""
+        hourly = data['hourly']
+        units = {key: unit for key, unit in data['hourly_units'].items() if key != 'time'}
+        times = np.array(hourly['time'], dtype="datetime64[m]")
+        values = {key: _column(hourly[key]) for key in units}
+        return cls(times, values, units)
+
+
+    @classmethod
+    def from_flatbuffers(cls, response, variables: list[str], tzinfo: dt.tzinfo, fetched: dt.datetime | None = None):
+        """build from an open-meteo flatbuffers response, variables in the order requested.
+
+        Values are zero-copy views into the response buffer."""
+        hourly = response.Hourly()
+        times = _local_times(hourly.Time(), hourly.TimeEnd(), hourly.Interval(), tzinfo)
+        values = {}
+        units = {}
+        for i, name in enumerate(variables):
+            variable = hourly.Variables(i)
+            values[name] = variable.ValuesAsNumpy()
+            units[name] = UNITS.get(_unit_names().get(variable.Unit()), "")
+        return cls(times, values, units, fetched)
+
+
+    def days(self):
+        """split the time axis into local calendar days, yielding (date, rows) slices"""
+        dates = self.times.astype("datetime64[D]")
+        bounds = np.flatnonzero(dates[1:] != dates[:-1]) + 1
+        starts = np.concatenate(([0], bounds))
+        ends = np.concatenate((bounds, [len(dates)]))
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            yield dates[start].item(), slice(start, end)
+
+
+    def matrix(self) -> np.ndarray:
+        """all variables as one float32 (times, variables) array, built once for every location sharing it"""
+        if self._matrix is None:
+            if not self.values:
+                self._matrix = np.empty((len(self.times), 0), dtype=np.float32)
+            else:
+                self._matrix = np.column_stack(list(self.values.values())).astype(np.float32, copy=False)
+        return self._matrix
+
+
+@functools.cache
+def _unit_names() -> dict[int, str]:
+    """flatbuffers unit enum -> name"""
+    from openmeteo_sdk.Unit import Unit
+    return {value: name for name, value in vars(Unit).items() if not name.startswith("_")}
+
+
+def _local_times(start: int, end: int, interval: int, tzinfo: dt.tzinfo) -> np.ndarray:
+    """a local wall-clock datetime64 axis for unix times [start, end)"""
+    utc = np.arange(start, end, interval, dtype=np.int64)
+    if len(utc) == 0:
+        return utc.astype("datetime64[m]")
+
+    def offset(timestamp: int) -> int:
+        return int(dt.datetime.fromtimestamp(timestamp, tzinfo).utcoffset().total_seconds())
+
+    first, last = offset(int(utc[0])), offset(int(utc[-1]))
+    if first == last:
+        offsets = first
+    else: # crosses a DST change
+        offsets = np.array([offset(timestamp) for timestamp in utc.tolist()])
+    return (utc + offsets).astype("datetime64[s]").astype("datetime64[m]")
+
+
+def _column(values: list) -> np.ndarray:
+    """a json value list as a numeric array, with missing values as nan"""
+    column = np.asarray(values)
+    if column.dtype == object: # nulls in the list
+        column = np.array([np.nan if value is None else value for value in values], dtype=float)
+    return column
+
+
+class Conditions(Mapping):
+    """conditions for one hour, keyed on variable name, formatted with units on access"""
+    __slots__ = ("_hour", "_record")
+
+    def __init__(self, record, hour: int):
+        self._record = record
+        self._hour = hour
+
+
+    def __getitem__(self, name: str) -> str:
+        if name not in self._record.columns:
+            raise KeyError(name)
+        return self._record.format(self._hour, name)
+
+
+    def __iter__(self):
+        return iter(self._record.columns)
+
+
+    def __len__(self) -> int:
+        return len(self._record.columns)
+
+
+class HourlyConditions(Mapping):
+    """a day of conditions, indexed on 24-hour"""
+    __slots__ = ("_record",)
+
+    def __init__(self, record):
+        self._record = record
+
+
+    def __getitem__(self, hour: int) -> Conditions:
+        if not 0 <= hour < 24 or not self._record.present[hour]:
+            raise KeyError(hour)
+        return Conditions(self._record, hour)
+
+
+    def __iter__(self):
+        return iter(np.flatnonzero(self._record.present).tolist())
+
+
+    def __len__(self) -> int:
+        return int(self._record.present.sum())
+
+
+class Snapshot(NamedTuple):
+    """a saved forecast and when it was fetched"""
+    location: LocationInfo
+    forecast: Forecast
+    fetched: dt.datetime
+
+
+class SnapshotStore:
+    """the latest forecast per location on disk, columnar .npz, for offline use and a fast start"""
+    LATEST = "latest"
+
+    def __init__(self, path: Path | None = None):
+        self._path = Path(path) if path else None
+
+
+    @property
+    def path(self) -> Path:
+        """the snapshot dir, under the cache dir as it is now unless given"""
+        return self._path or cache_dir() / SNAPSHOT_DIR
+
+
+    def file(self, location: LocationInfo) -> Path:
+        """the snapshot file for a location, rounded as for the sun cache"""
+        latitude = round(location.latitude, SUN_CACHE_PRECISION)
+        longitude = round(location.longitude, SUN_CACHE_PRECISION)
+        return self.path / f"{latitude:.{SUN_CACHE_PRECISION}f},{longitude:.{SUN_CACHE_PRECISION}f}.npz"
+
+
+    @timing.timed("snapshot.save")
+    def save(self, location: LocationInfo, forecast: Forecast, fetched: dt.datetime | None = None,
+             latest: bool = True) -> Path:
+        """save a forecast as the latest for its location, and unless latest is False, the latest overall"""
+        fetched = fetched or forecast.fetched or dt.datetime.now(dt.UTC)
+        meta = {
+            "location": [location.name, location.region, location.timezone, location.latitude, location.longitude],
+            "units": forecast.units,
+            "variables": list(forecast.values),
+            "fetched": fetched.isoformat(),
+        }
+        arrays = {f"v{i}": values for i, values in enumerate(forecast.values.values())}
+
+        path = self.file(location)
+        with atomic_write(path) as file:
+            np.savez(file, meta=np.array(json.dumps(meta)), times=forecast.times, **arrays)
+
+        if latest:
+            with atomic_write(self.path / self.LATEST, "w", encoding="utf-8") as file:
+                file.write(path.name)
+        return path
+
+
+    @timing.timed("snapshot.load")
+    def load(self, location: LocationInfo = None) -> Snapshot | None:
+        """the saved forecast for a location, or the latest saved for any, None when there isn't one"""
+        try:
+            if location is None:
+                path = self.path / (self.path / self.LATEST).read_text(encoding="utf-8").strip()
+            else:
+                path = self.file(location)
+            with np.load(path, allow_pickle=False) as data:
+                meta = json.loads(data["meta"].item())
+                values = {name: data[f"v{i}"] for i, name in enumerate(meta["variables"])}
+                times = data["times"]
+        except (OSError, KeyError, ValueError) as ex: # missing, or from an older version
+            log.debug("no snapshot for %s: %s", location.name if location else "latest", ex)
+            return None
+
+        saved = LocationInfo(*meta["location"])
+        fetched = dt.datetime.fromisoformat(meta["fetched"])
+        return Snapshot(location or saved, Forecast(times, values, meta["units"], fetched), fetched)
+
 
 # daily note:
 # contains data associated with a full day
 # current conditions will contain records
 class DailyRecord:
     """daily record of interesting weather conditions"""
+    __slots__ = ("columns", "data", "date", "location", "present", "sun", "units")
     date: dt.date # represents a local calendar day
-    conditions: dict[int, dict] # indexed on 24-hour
+    data: np.ndarray # float32 (24, variables), indexed on 24-hour, nan when missing
+    present: np.ndarray # bool (24,), hours in this day
+    columns: dict[str, int] # variable name -> column in data, shared across the forecast
+    units: dict[str, str] # shared across the forecast
 
-    def __init__(self, date: dt.date, location: LocationInfo):
+    def __init__(self, date: dt.date, location: LocationInfo, forecast: Forecast = None, rows: slice | None = None,
+                 sun: SunRecord = None, matrix: np.ndarray = None):
         self.date = date
         self.location = location
-        self.sun = SunRecord(self.location, self.date)
-        self.conditions = {}
-
+        self.sun = sun or SunRecord.for_day(self.location, self.date)
+        self.columns = {}
+        self.units = {}
+        self.data = np.full((24, 0), np.nan, dtype=np.float32)
+        self.present = np.zeros(24, dtype=bool)
+        if forecast is not None:
+            self.columns = forecast.columns
+            self.units = forecast.units
+            if matrix is None:
+                matrix = forecast.matrix()
+            times = forecast.times[rows]
+            hours = (times - times.astype("datetime64[D]")).astype("timedelta64[h]").astype(int)
+            self.data = np.full((24, len(self.columns)), np.nan, dtype=np.float32)
+            self.data[hours] = matrix[rows]
+            self.present[hours] = True
+
+
+    @property
+    def conditions(self) -> HourlyConditions:
+        """the day's conditions, indexed on 24-hour"""
+        return HourlyConditions(self)
+
+
+    @property
+    def values(self) -> dict[str, np.ndarray]:
+        """variable name -> the day's 24 hourly values"""
+        return {name: self.data[:, column] for name, column in self.columns.items()}
+
+
+    def value(self, hour: int, name: str):
+        """the raw value of a condition"""
+        if not self.present[hour]:
+            raise KeyError(hour)
+        return self.data[hour, self.columns[name]].item()
+
+
+    def format(self, hour: int, name: str) -> str:
+        """a condition formatted with its units"""
+        value = self.value(hour, name)
+        if math.isnan(value): # missing
+            return "-"
+        return f"{value:g}{self.units[name]}" # :g drops float32 noise past 6 digits
+
+
+    def add(self, time: dt.datetime, name: str, value, units: str = "") -> None:
+        """add a condition's raw value, None when missing, at time's hour.
+
+        A new variable gets a column, in units, without changing the
+        columns shared with the rest of the forecast."""
+        if name not in self.columns:
+            name = sys.intern(name)
+            self.columns = self.columns | {name: len(self.columns)}
+            self.units = self.units | {name: units}
+            self.data = np.column_stack((self.data, np.full(24, np.nan, dtype=np.float32)))
+        self.data[time.hour, self.columns[name]] = np.nan if value is None else value
+        self.present[time.hour] = True
 
-    def add(self, time: dt.datetime, name: str, value):
-        """add condition"""
-        # assert time.day == self.date.day
-        #     and time.month == self.date.month
-        #     and time.year == self.date.year
 
-        existing = self.conditions.get(time.hour, None)
-        if not existing:
-            existing = {}
-            self.conditions[time.hour] = existing
-
-        existing[name] = value
+class WeatherProvider:
+    """wrapper for parsing weather json into DailyRecords"""
 
+    snapshots = SnapshotStore()
 
+    def __init__(self, session: WeatherSession, location: LocationInfo = None, offline: bool = False):
+        """offline: never touch the network, serve forecasts from saved snapshots (session may be None)"""
+        self.session = session
+        self.offline = offline
+        self.fetched = None # when the forecast last returned was fetched
+        self.from_snapshot = False # ... and whether it came from a snapshot
+        self.location = location or self._my_location()
 
 
-class WeatherProvider:
-    """wrapper for parsing weather json into DailyRecords"""
-    def __init__(self, session: WeatherSession, location: LocationInfo = None):
-        self.session = WeatherSession()
-        if not location:
-            self.location = session.location()
+    def _my_location(self) -> LocationInfo:
+        """where the session says we are, or where the latest snapshot was when offline or that fails"""
+        if not self.offline:
+            try:
+                return self.session.location()
+            except Exception as ex: # noqa: BLE001
+                log.warning("location lookup failed, trying the latest snapshot: %s", ex)
+        snapshot = self.snapshots.load()
+        if snapshot is None:
+            raise LookupError("no location, and no saved forecast")
+        return snapshot.location
 
 
     @classmethod
-    def for_my_location(cls):
-        """construct a provider for my current location"""
-        return cls(WeatherSession())
+    def for_my_location(cls, offline: bool = False, location: LocationInfo = None):
+        """construct a provider for my current location, or the location configured (see places.py)"""
+        return cls(None if offline else WeatherSession(), location, offline=offline)
 
 
     @classmethod
-    def for_location(cls, location: LocationInfo):
-        """construct a provider for my current location"""
-        return cls(WeatherSession(), location)
+    def for_location(cls, location: LocationInfo, offline: bool = False):
+        """construct a provider for a location"""
+        return cls(None if offline else WeatherSession(), location, offline=offline)
 
 
-    def parse_weather(self, data:dict) -> dict[int,DailyRecord]:
-        """parse the weather data"""
+    def parse_weather(self, data:dict, location: LocationInfo = None) -> dict[int,DailyRecord]:
+        """parse the weather data, for the provider's location by default"""
+        location = location or self.location
         #--- this assumes 'hourly' key
-        # response is 7 days with 24 hours each in a flat array
-        result: dict[int,DailyRecord] = {}
-
-        # need to break out 7 DailyRecords, 0-indexed by offset from *first* date in
-        #for key, units in response['hourly_units'].items():
-        # use the first record for start
-        start_date = dt.datetime.fromisoformat(data['hourly']['time'][0]).date()
-
-        for i, time_str in enumerate(data['hourly']['time']):
-            hourstamp = dt.datetime.fromisoformat(time_str)
-            #hour = hourstamp.hour # assumes 24-hour TZ-based local time
-            date = hourstamp.date()
-            day_index = date.day - start_date.day
-            day_rec = result.get(day_index, None)
-            if not day_rec:
-                day_rec = DailyRecord(hourstamp.date(), self.location)
-                result[day_index] = day_rec
-
-            for key, units in data['hourly_units'].items():
-                if key != 'time':
-                    value = data['hourly'][key][i]
-                    value_str = f"{value}{units}"
-                    day_rec.add(hourstamp, key, value_str)
-
-        return result
+        return self.parse_forecast(Forecast.from_json(data), location)
+
+
+    @timing.timed("weather.parse_forecast")
+    def parse_forecast(self, forecast: Forecast, location: LocationInfo = None) -> dict[int,DailyRecord]:
+        """slice a columnar forecast into DailyRecords, for the provider's location by default"""
+        location = location or self.location
+        # 7 days with 24 hours each in flat arrays, 0-indexed by offset from the *first* date
+        days = list(forecast.days())
+        suns = SunRecord.for_days(location, [date for date, _ in days])
+        matrix = forecast.matrix()
+        return {
+            day_index: DailyRecord(date, location, forecast, rows, sun, matrix)
+            for day_index, ((date, rows), sun) in enumerate(zip(days, suns))
+        }
 
 
     # Weather notes
@@ -250,35 +961,59 @@ class WeatherProvider:
     # - cloud_cover: cloudy
     # - wind_speed_10m: windy
     # - precipitation (inches): rainy
-    def get_daily(self) -> list[DailyRecord]:
-        """Given a location, get the weather for the next 7 days"""
-        hourly = "temperature_2m,relative_humidity_2m,apparent_temperature,weather_code"
-
-        data = self.session.get_json(self.location, hourly=hourly)
-        return self.parse_weather(data)
+    HOURLY = "temperature_2m,relative_humidity_2m,apparent_temperature,weather_code"
+    FORECAST_DAYS = 16 # the most open-meteo forecasts, for the app to scroll through
+
+    def get_daily(self) -> dict[int,DailyRecord]:
+        """Given a location, get the weather for the next FORECAST_DAYS days.
+
+        The forecast is saved as a snapshot. When offline, or the fetch fails,
+        the latest snapshot for the location is used instead."""
+        if not self.offline:
+            try:
+                forecast = self.session.get(self.location, hourly=self.HOURLY, forecast_days=self.FORECAST_DAYS)
+            except Exception as ex:
+                log.warning("forecast fetch failed, trying the saved snapshot: %s", ex)
+                days = self.get_snapshot()
+                if days is None:
+                    raise
+                return days
+
+            # an expired forecast is served from the cache while a newer one downloads
+            self.fetched = forecast.fetched or dt.datetime.now(dt.UTC)
+            self.from_snapshot = False
+            self.snapshots.save(self.location, forecast, self.fetched)
+            return self.parse_forecast(forecast)
+
+        days = self.get_snapshot()
+        if days is None:
+            raise LookupError(f"offline, and no saved forecast for {self.location.name}")
+        return days
+
+
+    def get_snapshot(self, location: LocationInfo = None) -> dict[int,DailyRecord] | None:
+        """the saved forecast for a location, the provider's by default, None if there isn't one"""
+        location = location or self.location
+        snapshot = self.snapshots.load(location)
+        if snapshot is None:
+            return None
+        self.fetched = snapshot.fetched
+        self.from_snapshot = True
+        return self.parse_forecast(snapshot.forecast, location)
+
+
+    def get_daily_many(self, locations: list[LocationInfo]):
+        """Given many locations, get the weather for the next 7 days in batched requests.
+
+        Yields (location, daily records) pairs as each batch arrives."""
+        for location, forecast in self.session.get_many(locations, hourly=self.HOURLY):
+            yield location, self.parse_forecast(forecast, location)
 
 
 def cli():
-    """cli testing without fance graphics"""
-    session = WeatherSession()
-    city = session.location()
-    weather = session.get(city, hourly="temperature_2m")
-
-    for day in weather:
-        print(day.date)
-        for hour, attrs in day.conditions.items():
-            print(f"{hour}: {attrs}")
-
-    # really want to convert to time:conditions,
-    # where conditions is a human-readable map.
-    # hourly records are converted into an array of hour [24] in a day.
-
-
-    #for k,v in weather.items():
-    #    buffer += f"> {k}: {v}\n"
-
-    # parse timestamp into 24-hours timeslot
-    #dt.datetime.fromisoformat('2019-01-04T16:41:24+02:00')
+    """cli testing without fance graphics: a text report for my location"""
+    from .cli import report
+    report(None, "text")
 
 
 if __name__ == "__main__":
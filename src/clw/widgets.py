@@ -1,36 +1,481 @@
 """widgets"""
+import atexit
+import functools
+import hashlib
 import logging
+import os
+import threading
+from collections import OrderedDict, deque
+from collections.abc import Callable
+from pathlib import Path
+from typing import ClassVar
 
-from textual.app import App
-from textual.widgets import Log
+from textual.widgets import Log, Static
+from textual_image._geometry import ImageSize
+from textual_image._pixeldata import PixelData, PixelMeta
+from textual_image._terminal import get_cell_size
+from textual_image.renderable import HalfcellImage as HalfcellRenderable
+from textual_image.renderable import Image as AutoRenderable
+from textual_image.renderable import SixelImage as SixelRenderable
+from textual_image.renderable import TGPImage as TGPRenderable
+from textual_image.renderable import UnicodeImage as UnicodeRenderable
+from textual_image.renderable.tgp import _send_tgp_message
+from textual_image.widget import SixelImage
+from textual_image.widget._base import Image as BaseImage
+from textual_image.widget.sixel import _ImageSixelImpl
 
+from . import cache_dir, timing
+from .__about__ import __version__
+from .store import atomic_write
 
-#log = logging.getLogger(__name__)
+log = logging.getLogger(__name__)
 
 
 LOG_FORMAT = "{asctime} {levelname:<8s} {name:<16} {message}"
 
 
 class LogHandlerWidget(Log):
-    """wrap the log widget to install the handler"""
-    def __init__(self, app:App, level:int, **kwargs):
+    """a log panel, fed by a TextualLogHandler while mounted"""
+
+    DEFAULT_CSS = """
+    LogHandlerWidget {
+        dock: bottom;
+        height: 12;
+        border-top: solid gray;
+    }
+    """
+
+    FLUSH_INTERVAL = 0.1 # seconds
+
+    def __init__(self, level: int, **kwargs):
         super().__init__(**kwargs)
-        # create handler
-        handler = TextualLogHandler(app)
+        self.level = level
+        self.handler = TextualLogHandler(self, level)
+        self.handler.setFormatter(logging.Formatter(LOG_FORMAT, style='{'))
+
 
-        # install handler
-        logging.basicConfig(handlers=[handler], format=LOG_FORMAT, style='{')
-        logging.getLogger("clw").setLevel(level) # FIXME derive from module name
+    def on_mount(self) -> None:
+        """install the handler and start flushing it"""
+        logging.getLogger().addHandler(self.handler)
+        logging.getLogger(__package__).setLevel(self.level)
+        self.set_interval(self.FLUSH_INTERVAL, self.handler.write_batch)
+
+
+    def on_unmount(self) -> None:
+        logging.getLogger().removeHandler(self.handler)
 
 
 class TextualLogHandler(logging.Handler):
-    """Route logs to internal log panel"""
-    def __init__(self, app: App) -> None:
-        super().__init__()
-        self.app = app
+    """Route logs to a log panel, from any thread.
+
+    emit() only appends the record to a queue; the panel formats and writes
+    queued records in batches from a UI timer (write_batch). Past capacity, records
+    are dropped and counted, so a flood of debug logging can't back up."""
+
+    CAPACITY = 10_000 # queued records
+    BATCH = 1_000 # records written per flush
+
+    def __init__(self, widget: Log, level: int = logging.NOTSET, capacity: int = CAPACITY) -> None:
+        super().__init__(level)
+        self.widget = widget
+        self.capacity = capacity
+        self.records = deque() # appends and pops are thread-safe
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()
+
+
+    def handle(self, record: logging.LogRecord) -> bool:
+        # skip the handler lock logging takes around emit(), the queue doesn't need it
+        rv = self.filter(record)
+        if rv:
+            self.emit(record)
+        return rv
 
 
     def emit(self, record: logging.LogRecord) -> None:
-        log_widget = self.app.query_one(LogHandlerWidget)
-        log_entry = self.format(record)
-        log_widget.write_line(log_entry)
+        if len(self.records) >= self.capacity:
+            with self._dropped_lock:
+                self.dropped += 1
+            return
+        self.records.append(record)
+
+
+    def write_batch(self) -> None:
+        """write a batch of queued records to the panel, on the UI thread"""
+        lines = []
+        for _ in range(min(self.BATCH, len(self.records))):
+            record = self.records.popleft()
+            try:
+                lines.append(self.format(record))
+            except Exception: # noqa: BLE001
+                self.handleError(record)
+
+        with self._dropped_lock:
+            dropped, self.dropped = self.dropped, 0
+        if dropped:
+            lines.append(f"... {dropped} log records dropped")
+
+        if lines:
+            self.widget.write_lines(lines)
+
+
+class TimingOverlay(Static):
+    """latest span timings and cache hit rates, toggled on top of the app"""
+
+    DEFAULT_CSS = """
+    TimingOverlay {
+        overlay: screen;
+        position: absolute;
+        width: 100%;
+        height: auto;
+        padding: 0 1;
+        background: $panel 90%;
+        display: none;
+    }
+    """
+
+    INTERVAL = 1.0 # seconds
+
+    def __init__(self, caches: Callable[[], dict[str, tuple[int, int]]] = dict, **kwargs):
+        """caches: returns name -> (hits, misses) of caches to show"""
+        super().__init__(**kwargs)
+        self.caches = caches
+        self.recording = False # whether timings were already recorded when shown, ie --profile
+
+
+    def on_mount(self) -> None:
+        self.set_interval(self.INTERVAL, self.update_timings)
+
+
+    def toggle(self) -> None:
+        """show or hide, recording timings while shown"""
+        self.display = not self.display
+        if self.display:
+            self.recording = timing.enabled()
+            timing.enable()
+            self.update_timings()
+        else:
+            timing.enable(self.recording)
+
+
+    def update_timings(self) -> None:
+        """redraw from the recorder, only while shown"""
+        if not self.display:
+            return
+
+        with timing.recorder._lock:
+            stats = [(name, stat.count, stat.last, stat.total / stat.count)
+                     for name, stat in sorted(timing.recorder.stats.items())]
+            counters = dict(timing.recorder.counters)
+
+        lines = [f"{'span':<24} {'count':>6} {'last ms':>9} {'mean ms':>9}"]
+        lines.extend(f"{name:<24} {count:>6} {last / 1e6:>9.2f} {mean / 1e6:>9.2f}"
+                     for name, count, last, mean in stats)
+
+        caches = dict(self.caches())
+        caches["http"] = (counters.get("http.cache_hit", 0), counters.get("http.cache_miss", 0))
+        rates = []
+        for name, (hits, misses) in caches.items():
+            total = hits + misses
+            rates.append(f"{name} {hits / total:.0%} of {total}" if total else f"{name} -")
+        lines.append("cache hits: " + ", ".join(rates))
+        self.update("\n".join(lines))
+
+
+# terminal-encoded icons held in memory, each a few kB
+PAYLOAD_CACHE_ENTRIES = 512
+# ... and on disk, the least recently used beyond it are deleted
+PAYLOAD_CACHE_FILES = 2048
+
+
+@functools.cache
+def _payload_version() -> str:
+    """encodings on disk are only good for the versions that wrote them"""
+    from importlib.metadata import version
+
+    return f"{__version__}/{version('textual-image')}"
+
+
+class PayloadCache:
+    """Icons as encoded for the terminal, so redrawing one is a copy rather than a resample and encode.
+
+    Keyed by (icon, size, background, protocol, cell width, cell height, ...) in an
+    LRU. Text payloads, sixel data and TGP's base64 png, are kept on disk under
+    path between runs too: the half cell and unicode segments are quicker to
+    redo than to read back. Files are touched when read, and past max_files
+    the least recently used go, along with those of older versions."""
+    def __init__(self, path: Path | None = None, max_entries: int = PAYLOAD_CACHE_ENTRIES,
+                 max_files: int = PAYLOAD_CACHE_FILES):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_files = max_files
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0 # misses found on disk
+        self._payloads = OrderedDict()
+        self._files = None # on disk, counted when first written to
+        self._lock = threading.Lock()
+
+
+    def get(self, key: tuple, encode: Callable, persist: bool = False):
+        """the payload for key, from encode() the first time. persist: a str to keep on disk"""
+        with self._lock:
+            payload = self._payloads.get(key)
+            if payload is not None:
+                self.hits += 1
+                self._payloads.move_to_end(key)
+                return payload
+            self.misses += 1
+
+        payload = self._read(key) if persist else None
+        if payload is None:
+            with timing.span("icons.encode"):
+                payload = encode()
+            if persist:
+                self._write(key, payload)
+
+        with self._lock:
+            self._payloads[key] = payload
+            while len(self._payloads) > self.max_entries:
+                self._payloads.popitem(last=False)
+        return payload
+
+
+    def _file(self, key: tuple) -> Path:
+        digest = hashlib.sha256(repr((_payload_version(), key)).encode("utf-8")).hexdigest()
+        return self.path / digest
+
+
+    def _read(self, key: tuple) -> str | None:
+        if self.path is None:
+            return None
+        file = self._file(key)
+        try:
+            payload = file.read_text(encoding="ascii")
+            os.utime(file) # recently used
+        except OSError:
+            return None
+        self.loads += 1
+        return payload
+
+
+    def _write(self, key: tuple, payload: str) -> None:
+        if self.path is None:
+            return
+        try:
+            with atomic_write(self._file(key), "w", encoding="ascii") as file:
+                file.write(payload)
+        except OSError as ex:
+            log.debug("payload not saved: %s", ex)
+            return
+        with self._lock:
+            if self._files is not None:
+                self._files += 1
+            prune = self._files is None or self._files > self.max_files
+        if prune:
+            self._prune()
+
+
+    def _prune(self) -> None:
+        """delete the least recently used files down to 3/4 of max_files, for room before the next prune"""
+        files = []
+        try:
+            with os.scandir(self.path) as entries:
+                for entry in entries:
+                    try:
+                        files.append((entry.stat().st_mtime, entry.path))
+                    except OSError: # deleted by another process
+                        pass
+        except OSError as ex:
+            log.debug("payloads not pruned: %s", ex)
+            return
+        keep = self.max_files * 3 // 4 if len(files) > self.max_files else len(files)
+        files.sort(reverse=True)
+        for _, path in files[keep:]:
+            Path(path).unlink(missing_ok=True)
+        with self._lock:
+            self._files = keep
+
+
+    def stats(self) -> dict:
+        """cache counters"""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "loads": self.loads,
+            "payloads": len(self._payloads),
+        }
+
+
+class _CachedRenderable:
+    """A textual_image renderable replaying its segments from a PayloadCache.
+
+    The image is only copied and converted on a miss. key and payloads are
+    set by IconImage, without a key it renders as the library does."""
+
+    key: tuple | None = None
+    payloads: PayloadCache | None = None
+
+    def __init__(self, image, width=None, height=None):
+        self._args = (image, width, height)
+        meta = PixelMeta(image)
+        self._render_size = ImageSize(meta.width, meta.height, width, height)
+
+
+    def _prepare(self) -> None:
+        """the renderable's own set up, copying the image"""
+        super().__init__(*self._args)
+
+
+    def __rich_console__(self, console, options):
+        if self.key is None:
+            self._prepare()
+            yield from super().__rich_console__(console, options)
+            return
+        cells = self._render_size.get_cell_size(options.max_width, options.max_height, get_cell_size())
+        key = (*self.key, type(self).__name__, *cells, *get_cell_size())
+        yield from self.payloads.get(key, functools.partial(self._encode, console, options))
+
+
+    def _encode(self, console, options) -> list:
+        self._prepare()
+        return list(super().__rich_console__(console, options))
+
+
+class _HalfcellIcon(_CachedRenderable, HalfcellRenderable):
+    """half cell icons from the payload cache"""
+
+
+class _UnicodeIcon(_CachedRenderable, UnicodeRenderable):
+    """unicode icons from the payload cache"""
+
+
+class _TGPIcon(_CachedRenderable, TGPRenderable):
+    """TGP icons sent to the terminal once per payload key and left there.
+
+    The library sends an image and deletes it again on every repaint, here a
+    repaint only writes the placeholder cells of the image already sent."""
+
+    MAX_IMAGES = 256 # kept in the terminal, the oldest are deleted
+    images: ClassVar[OrderedDict] = OrderedDict() # payload key -> terminal image id
+
+    terminal_image_id = None
+
+    def __rich_console__(self, console, options):
+        if self.key is None:
+            yield from super().__rich_console__(console, options)
+            return
+        terminal_sizes = get_cell_size()
+        cells = self._render_size.get_cell_size(options.max_width, options.max_height, terminal_sizes)
+        pixels = self._render_size.get_pixel_size(options.max_width, options.max_height, terminal_sizes)
+        key = (*self.key, "tgp", *cells, *terminal_sizes)
+
+        image_id = self.images.get(key)
+        if image_id is None:
+            data = self.payloads.get(key, functools.partial(self._encode_png, pixels), persist=True)
+            image_id = self._send(key, data)
+            self._create_virtual_placement(*cells)
+        self.images.move_to_end(key)
+        self.terminal_image_id = image_id
+        yield from self._render_diacritics(*cells)
+
+
+    def _encode_png(self, pixels: tuple[int, int]) -> str:
+        return PixelData(self._args[0]).scaled(*pixels).to_base64()
+
+
+    def _send(self, key: tuple, data: str) -> int:
+        """send base64 png data to the terminal as a new image, deleting the oldest past MAX_IMAGES"""
+        if not self.images:
+            atexit.register(_TGPIcon.delete_all)
+        image_id = self.terminal_image_id = next(TGPRenderable._image_id_counter)
+        self.images[key] = image_id
+        while data:
+            chunk, data = data[:4096], data[4096:]
+            _send_tgp_message(i=image_id, m=1 if data else 0, f=100, payload=chunk, q=2)
+        while len(self.images) > self.MAX_IMAGES:
+            _, old = self.images.popitem(last=False)
+            _send_tgp_message(a="d", I=old)
+        return image_id
+
+
+    def cleanup(self) -> None:
+        """shared images stay in the terminal, see delete_all"""
+        if self.key is None:
+            super().cleanup()
+
+
+    @classmethod
+    def delete_all(cls) -> None:
+        """free every image sent, on exit"""
+        while cls.images:
+            _, image_id = cls.images.popitem()
+            _send_tgp_message(a="d", I=image_id)
+
+
+class _SixelIconImpl(_ImageSixelImpl):
+    """sixel data from the payload cache, shared between widgets and runs"""
+    _crop = None
+
+    def render_lines(self, crop):
+        self._crop = crop
+        return super().render_lines(crop)
+
+
+    def _image_to_sixels(self, image, sixel_options=None, background=None) -> str:
+        key = self.parent.key
+        encode = functools.partial(super()._image_to_sixels, image, sixel_options, background)
+        if key is None:
+            return encode()
+        key = (*key, "sixel", *self._crop, *self.content_size, *get_cell_size(), repr(sixel_options), background)
+        return self.parent.payloads.get(key, encode, persist=True)
+
+
+class _IconPayloads:
+    """what an icon widget needs to draw from the payload cache"""
+
+    payloads = PayloadCache(cache_dir() / "payloads")
+
+    icon: tuple | None = None # (image name, pixel size) shown, None draws uncached
+
+    @property
+    def key(self) -> tuple | None:
+        """payload key of the icon shown on this background"""
+        if self.icon is None:
+            return None
+        _, color = self.background_colors
+        return (*self.icon, color.hex)
+
+
+    def show(self, image, icon: tuple | None = None) -> None:
+        """show an image, icon identifies it across columns and runs"""
+        self.icon = icon
+        self.image = image
+
+
+class _SixelIcon(_IconPayloads, SixelImage, Renderable=SixelImage._Renderable):
+    """sixel icon, its data from the payload cache"""
+
+    def compose(self):
+        yield _SixelIconImpl(self.image, self._sixel_options)
+
+
+_RENDERABLES = {
+    HalfcellRenderable: _HalfcellIcon,
+    UnicodeRenderable: _UnicodeIcon,
+    TGPRenderable: _TGPIcon,
+}
+
+
+class _RenderedIcon(_IconPayloads, BaseImage, Renderable=_RENDERABLES.get(AutoRenderable, UnicodeRenderable)):
+    """icon drawn by a renderable, its segments or image from the payload cache"""
+
+    def render(self):
+        renderable = super().render()
+        if isinstance(renderable, _CachedRenderable):
+            renderable.key = self.key
+            renderable.payloads = self.payloads
+        return renderable
+
+
+IconImage = _SixelIcon if AutoRenderable is SixelRenderable else _RenderedIcon
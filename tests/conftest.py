@@ -0,0 +1,11 @@
+"""shared fixtures: every test gets its own cache dir, nothing touches ~/.cache/clw"""
+import pytest
+
+from clw import cache_dir
+
+
+@pytest.fixture(autouse=True)
+def cache(tmp_path, monkeypatch):
+    """point $XDG_CACHE_HOME at a fresh directory, the stores follow it"""
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    return cache_dir()
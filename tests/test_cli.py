@@ -0,0 +1,24 @@
+"""clw report failing as a cron job wants: an error logged and a non-zero exit, no traceback"""
+import pytest
+from openmeteo_requests.Client import OpenMeteoRequestsError
+
+from clw.cli import main
+from clw.weather import WeatherSession
+
+
+def test_offline_without_a_saved_forecast_fails_cleanly(caplog):
+    with pytest.raises(SystemExit) as exit:
+        main(["--offline", "report"])
+    assert exit.value.code == "1 of 1 locations failed"
+    assert "no location, and no saved forecast" in caplog.text
+
+
+def test_a_failed_fetch_fails_cleanly(monkeypatch, caplog, capsys):
+    def unreachable(self, location, **params):
+        raise OpenMeteoRequestsError("failed to request: no network")
+    monkeypatch.setattr(WeatherSession, "get", unreachable)
+    with pytest.raises(SystemExit) as exit:
+        main(["report", "--location", "Seattle"])
+    assert exit.value.code == "1 of 1 locations failed"
+    assert "no forecast for Seattle: failed to request: no network" in caplog.text
+    assert capsys.readouterr().out == ""
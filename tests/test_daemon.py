@@ -0,0 +1,73 @@
+"""the forecast daemon and its clients, over a socket in a tmp dir, fetching from a stub session"""
+import datetime as dt
+import threading
+import time
+
+import numpy as np
+import pytest
+from astral import LocationInfo
+
+from clw.daemon import DaemonClient, DaemonProvider, ForecastDaemon
+from clw.weather import Forecast, WeatherProvider
+
+SEATTLE = LocationInfo("Seattle", "WA", "America/Los_Angeles", 47.61, -122.33)
+
+
+class Forecasts:
+    """a WeatherSession answering with a fresh forecast, numbered by the fetch"""
+    def __init__(self):
+        self.fetches = 0
+
+    def get(self, location, **params):
+        self.fetches += 1
+        times = np.arange(np.datetime64("2025-06-01T00:00"), np.datetime64("2025-06-03T00:00"), np.timedelta64(1, "h"))
+        temperatures = np.full(len(times), self.fetches, dtype=np.float32)
+        return Forecast(times, {"temperature_2m": temperatures}, {"temperature_2m": "°F"}, dt.datetime.now(dt.UTC))
+
+
+@pytest.fixture
+def daemon(tmp_path):
+    daemon = ForecastDaemon(WeatherProvider(Forecasts(), SEATTLE), tmp_path / "clw.sock")
+    daemon.listen()
+    yield daemon
+    daemon.close()
+
+
+def test_a_client_gets_the_current_forecast_then_each_new_one(daemon):
+    daemon.refresh()
+    client = DaemonClient.connect(daemon.path)
+    provider = DaemonProvider(client, timeout=5)
+    assert provider.location.name == "Seattle"
+    assert provider.get_daily()[0].format(12, "temperature_2m") == "1°F"
+    assert not provider.from_snapshot
+
+    daemon.refresh()
+    provider.update(client.receive(5))
+    assert provider.get_daily()[0].format(12, "temperature_2m") == "2°F"
+
+    daemon.close()
+    with pytest.raises(ConnectionError):
+        client.receive(5)
+
+
+def test_a_second_daemon_on_the_socket_is_refused(daemon):
+    with pytest.raises(RuntimeError, match="already running"):
+        ForecastDaemon(daemon.provider, daemon.path).listen()
+
+
+def test_a_client_attaching_during_a_broadcast_gets_the_notices_in_order(daemon, monkeypatch):
+    daemon.broadcast({"fetched": "0"})
+    send, attaching = daemon._send, threading.Event()
+
+    def slow_send(client, line):
+        if threading.current_thread().name == "clw-daemon": # the new client's first notice
+            attaching.set()
+            time.sleep(0.2)
+        return send(client, line)
+
+    monkeypatch.setattr(daemon, "_send", slow_send)
+    client = DaemonClient.connect(daemon.path)
+    assert attaching.wait(5)
+    daemon.broadcast({"fetched": "1"})
+    assert [client.receive(5)["fetched"] for _ in range(2)] == ["0", "1"]
+    client.close()
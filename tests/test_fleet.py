@@ -0,0 +1,177 @@
+"""FleetFetcher scheduling, against a fake clock and a stub session"""
+import threading
+
+import numpy as np
+import pytest
+import requests
+from astral import LocationInfo
+from openmeteo_requests.Client import OpenMeteoRequestsError
+
+from clw.fleet import FleetFetcher, RateLimiter, TokenBucket, retryable
+from clw.weather import Forecast, WeatherProvider, WeatherSession
+
+SEATTLE = LocationInfo("Seattle", "WA", "America/Los_Angeles", 47.61, -122.33)
+PORTLAND = LocationInfo("Portland", "OR", "America/Los_Angeles", 45.52, -122.68)
+BOISE = LocationInfo("Boise", "ID", "America/Boise", 43.62, -116.2)
+
+# the api's error bodies, https://open-meteo.com/en/docs
+BAD_REQUEST = {"error": True, "reason": "Cannot initialize WeatherVariable from invalid String value tempeture_2m"}
+TOO_MANY = {"error": True, "reason": "Minutely API request limit exceeded. Please try again in one minute."}
+
+
+class FakeClock:
+    """a monotonic clock that only moves when told to"""
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float) -> None:
+        self.now += seconds
+
+
+def api_error(body) -> OpenMeteoRequestsError:
+    """an error as openmeteo_requests raises it: wrapping the one carrying the response body"""
+    try:
+        try:
+            raise OpenMeteoRequestsError(body)
+        except OpenMeteoRequestsError as ex:
+            raise OpenMeteoRequestsError("failed to request") from ex
+    except OpenMeteoRequestsError as ex:
+        return ex
+
+
+def forecast() -> Forecast:
+    times = np.arange(np.datetime64("2025-06-01T00:00"), np.datetime64("2025-06-03T00:00"), np.timedelta64(1, "h"))
+    return Forecast(times, {"temperature_2m": np.arange(len(times), dtype=np.float32)}, {"temperature_2m": "°F"})
+
+
+class StubSession(WeatherSession):
+    """a session without http: each batch answers from failures, then a forecast"""
+    def __init__(self, failures: list[Exception] = (), delay: float = 0.0):
+        super().__init__(session=requests.Session()) # never sent anything, fetch_batch answers
+        self.failures = list(failures)
+        self.delay = delay
+        self.timeouts = []
+        self.lock = threading.Lock()
+
+
+    def fetch_batch(self, batch, batch_params, **kwargs):
+        with self.lock:
+            self.timeouts.append(kwargs["timeout"])
+            failure = self.failures.pop(0) if self.failures else None
+        if self.delay:
+            threading.Event().wait(self.delay)
+        if failure:
+            raise failure
+        shared = forecast()
+        return [(location, shared) for cell in batch for location in cell.locations]
+
+
+def by_name(results) -> dict:
+    return {location.name: days for location, days in results}
+
+
+def fetcher(session: StubSession, **kwargs) -> FleetFetcher:
+    """a fetcher for the stub, unthrottled, retrying at once"""
+    kwargs = {"concurrency": 2, "batch_size": 1, "backoff": 0.0} | kwargs
+    fleet = FleetFetcher(WeatherProvider(session, SEATTLE), **kwargs)
+    fleet.limiter = RateLimiter(quotas=())
+    return fleet
+
+
+def test_bucket_bursts_half_the_quota():
+    clock = FakeClock()
+    bucket = TokenBucket(10, 10, clock)
+    assert bucket.wait_time(5) == 0
+    bucket.take(5)
+    assert bucket.wait_time(1) == pytest.approx(2.0) # 5 more tokens over 10s
+    clock.advance(2.0)
+    assert bucket.wait_time(1) == 0
+
+
+def test_bucket_waits_for_a_full_bucket_for_a_big_batch():
+    clock = FakeClock()
+    bucket = TokenBucket(10, 10, clock)
+    bucket.take(5)
+    assert bucket.wait_time(50) == pytest.approx(10.0)
+    clock.advance(10.0)
+    bucket.take(50)
+    assert bucket.wait_time(1) == pytest.approx(92.0) # paying off the debt first
+
+
+def test_limiter_never_exceeds_any_quota():
+    clock = FakeClock()
+    limiter = RateLimiter(((10, 10), (30, 60)), clock)
+    calls = []
+    while clock.now < 1000.0 + 300:
+        delay = limiter.try_acquire(1)
+        if delay:
+            clock.advance(delay)
+        else:
+            calls.append(clock.now)
+    for calls_allowed, period in ((10, 10), (30, 60)):
+        for i, start in enumerate(calls):
+            assert sum(1 for call in calls[i:] if call < start + period) <= calls_allowed
+
+
+def test_limiter_takes_nothing_while_waiting():
+    clock = FakeClock()
+    limiter = RateLimiter(((10, 10), (100, 10)), clock)
+    assert limiter.try_acquire(5) == 0
+    assert limiter.try_acquire(5) > 0
+    assert [bucket.tokens for bucket in limiter.buckets] == [0, 45]
+
+
+def test_retryable():
+    assert not retryable(api_error(BAD_REQUEST))
+    assert retryable(api_error(TOO_MANY))
+    assert retryable(api_error("failed to request: 502 Server Error"))
+    assert retryable(ConnectionError("reset by peer"))
+
+
+def test_fetch_every_location():
+    session = StubSession()
+    fleet = fetcher(session)
+    results = by_name(fleet.fetch([SEATTLE, PORTLAND, BOISE]))
+    assert set(results) == {"Seattle", "Portland", "Boise"}
+    assert [record.date.isoformat() for record in results["Boise"].values()] == ["2025-06-01", "2025-06-02"]
+    assert fleet.stats == {"requests": 3, "retries": 0, "failures": 0, "throttled": 0}
+    assert WeatherProvider.snapshots.load(PORTLAND) is not None # saved for --offline
+
+
+def test_fetch_retries_a_failed_batch():
+    session = StubSession([ConnectionError("reset by peer"), api_error(TOO_MANY)])
+    fleet = fetcher(session, concurrency=1)
+    results = by_name(fleet.fetch([SEATTLE]))
+    assert isinstance(results["Seattle"], dict)
+    assert fleet.stats["requests"] == 3
+    assert fleet.stats["retries"] == 2
+
+
+def test_fetch_gives_up_on_a_bad_request():
+    session = StubSession([api_error(BAD_REQUEST)])
+    fleet = fetcher(session)
+    results = by_name(fleet.fetch([SEATTLE, PORTLAND]))
+    failed = [name for name, days in results.items() if isinstance(days, Exception)]
+    assert len(failed) == 1
+    assert fleet.stats["requests"] == 2
+    assert fleet.stats["failures"] == 1
+
+
+def test_fetch_gives_up_after_its_retries():
+    session = StubSession([ConnectionError("reset by peer")] * 10)
+    fleet = fetcher(session, retries=2)
+    results = by_name(fleet.fetch([SEATTLE]))
+    assert isinstance(results["Seattle"], ConnectionError)
+    assert fleet.stats["requests"] == 3
+
+
+def test_fetch_deadline():
+    session = StubSession([TimeoutError("read timed out")] * 1000, delay=0.05)
+    fleet = fetcher(session, retries=1000, timeout=1.0, deadline=0.2)
+    results = by_name(fleet.fetch([SEATTLE]))
+    assert isinstance(results["Seattle"], TimeoutError)
+    assert all(timeout <= 0.2 for timeout in session.timeouts) # no attempt outlives the deadline
+    assert min(session.timeouts) < 0.2
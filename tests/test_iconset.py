@@ -0,0 +1,175 @@
+"""HttpIconSet's revalidating, content-addressed cache, against a server on localhost, and the icon atlas"""
+import datetime as dt
+import hashlib
+import io
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from importlib.resources import read_binary
+
+import pytest
+from PIL import Image
+from requests import HTTPError
+
+from clw import iconset
+from clw.iconset import AtlasIconSet, HttpIconSet, LocalIconSet
+
+LAST_MODIFIED = "Sun, 01 Jun 2025 00:00:00 GMT"
+
+
+def png(color: str) -> bytes:
+    out = io.BytesIO()
+    Image.new("RGBA", (4, 4), color).save(out, "PNG")
+    return out.getvalue()
+
+
+class IconServer(ThreadingHTTPServer):
+    """serves self.files by path, with an ETag of their hash, answering conditional requests with 304"""
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), IconHandler)
+        self.files = {}
+        self.requests = [] # (path, status, request headers)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class IconHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        data = self.server.files.get(self.path)
+        etag = f'"{hashlib.sha256(data).hexdigest()[:16]}"' if data else None
+        if data is None:
+            status = 404
+        elif self.headers.get("If-None-Match") == etag:
+            status = 304
+        else:
+            status = 200
+        self.server.requests.append((self.path, status, dict(self.headers)))
+        self.send_response(status)
+        if data is not None:
+            self.send_header("ETag", etag)
+            self.send_header("Last-Modified", LAST_MODIFIED)
+        self.send_header("Content-Length", str(len(data) if status == 200 else 0))
+        self.end_headers()
+        if status == 200:
+            self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass # quiet
+
+
+@pytest.fixture
+def server():
+    httpd = IconServer()
+    thread = threading.Thread(target=httpd.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def icons(cache):
+    return HttpIconSet(path=cache / "http-icons")
+
+
+def test_fetch_stores_content_by_hash(server, icons):
+    server.files["/sun.png"] = png("yellow")
+    data = icons.fetch(f"{server.url}/sun.png")
+    assert data == server.files["/sun.png"]
+    digest = hashlib.sha256(data).hexdigest()
+    assert (icons.path / "objects" / digest).read_bytes() == data
+    entry = icons._index.get(f"{server.url}/sun.png")
+    assert entry["sha256"] == digest
+    assert entry["etag"] and entry["last_modified"] == LAST_MODIFIED
+
+
+def test_fresh_icons_are_not_requested_again(server, icons):
+    server.files["/sun.png"] = png("yellow")
+    icons.fetch(f"{server.url}/sun.png")
+    assert icons.fetch(f"{server.url}/sun.png") == server.files["/sun.png"]
+    assert len(server.requests) == 1
+
+    # a new set reads the index and objects back from disk
+    again = HttpIconSet(path=icons.path)
+    assert again.fetch(f"{server.url}/sun.png") == server.files["/sun.png"]
+    assert len(server.requests) == 1
+
+
+def test_stale_icons_are_revalidated(server, icons, monkeypatch):
+    server.files["/sun.png"] = png("yellow")
+    url = f"{server.url}/sun.png"
+    icons.fetch(url)
+    checked = icons._index.get(url)["checked"]
+
+    monkeypatch.setattr(HttpIconSet, "REVALIDATE_AFTER", dt.timedelta(0))
+    assert icons.fetch(url) == server.files["/sun.png"]
+    path, status, headers = server.requests[-1]
+    assert (path, status) == ("/sun.png", 304)
+    assert headers["If-None-Match"] == icons._index.get(url)["etag"]
+    assert headers["If-Modified-Since"] == LAST_MODIFIED
+    assert icons._index.get(url)["checked"] > checked
+
+
+def test_changed_icons_are_replaced(server, icons, monkeypatch):
+    url = f"{server.url}/sun.png"
+    server.files["/sun.png"] = png("yellow")
+    icons.fetch(url)
+
+    monkeypatch.setattr(HttpIconSet, "REVALIDATE_AFTER", dt.timedelta(0))
+    server.files["/sun.png"] = png("orange")
+    assert icons.fetch(url) == png("orange")
+    assert server.requests[-1][1] == 200
+    assert len(list((icons.path / "objects").iterdir())) == 2
+
+
+def test_identical_icons_are_stored_once(server, icons):
+    server.files["/day.png"] = server.files["/night.png"] = png("gray")
+    icons.fetch(f"{server.url}/day.png")
+    icons.fetch(f"{server.url}/night.png")
+    assert len(list((icons.path / "objects").iterdir())) == 1
+
+
+def test_missing_icons_raise(server, icons):
+    with pytest.raises(HTTPError):
+        icons.fetch(f"{server.url}/missing.png")
+
+
+def test_load_image(server, icons):
+    server.files["/sun.png"] = png("yellow")
+    image = icons.load_image(f"{server.url}/sun.png")
+    assert image.size == (4, 4)
+    assert image.convert("RGBA").getpixel((0, 0)) == (255, 255, 0, 255)
+
+
+@pytest.fixture
+def packaged(monkeypatch):
+    """the packaged resources, edited by setting edits[path]"""
+    edits = {}
+    monkeypatch.setattr(iconset, "read_binary", lambda package, path: edits.get(str(path)) or read_binary(package, path))
+    iconset._fingerprint.cache_clear()
+    yield edits
+    iconset._fingerprint.cache_clear()
+
+
+def test_the_atlas_is_named_for_its_icons(packaged, cache):
+    atlas = AtlasIconSet(LocalIconSet("resources/png"))
+    assert atlas.path.parent == cache
+    assert atlas.path.name == f"icons-{LocalIconSet('resources/png').fingerprint()}-256.atlas"
+
+    fingerprints = {LocalIconSet("resources/png").fingerprint()}
+    for path in ("resources/png/clear-day.png", "resources/png/weather-codes.json", "resources/wmo-codes.json"):
+        packaged[path] = read_binary("clw", path) + b" "
+        iconset._fingerprint.cache_clear()
+        fingerprints.add(LocalIconSet("resources/png").fingerprint())
+    assert len(fingerprints) == 4 # a new one for each edit
+
+
+def test_a_new_atlas_deletes_the_old_ones(cache):
+    cache.mkdir(parents=True)
+    for name in ("icons-0123456789abcdef-16.atlas", "icons-0123456789abcdef-16.json", "icons-0123456789abcdef-32.atlas"):
+        (cache / name).write_bytes(b"")
+    atlas = AtlasIconSet(LocalIconSet("resources/png"), size=16)
+    assert atlas.get_image(0, "day").size == (16, 16)
+    assert sorted(path.name for path in cache.iterdir()) == sorted(
+        [atlas.path.name, atlas.path.with_suffix(".json").name, "icons-0123456789abcdef-32.atlas"])
@@ -0,0 +1,29 @@
+"""heavy modules load on the code path needing them, not when clw's modules are imported
+
+The import-time budgets, which depend on the machine, are in scripts/import-budget.py."""
+import subprocess
+import sys
+
+import pytest
+
+# module: modules it must not import
+LAZY = {
+    "clw.app": ["clw.weather", "requests", "requests_cache", "openmeteo_requests", "niquests", "pandas"],
+    "clw.weather": ["requests", "requests_cache", "retry_requests", "openmeteo_requests",
+                    "niquests", "pandas", "PIL", "textual"],
+    "clw.cli": ["clw.weather", "clw.app", "textual", "PIL", "requests", "numpy"],
+    "clw.iconset": ["PIL", "requests", "numpy", "textual"],
+}
+
+
+def imported(module: str) -> set[str]:
+    """every module loaded by importing module in a fresh interpreter"""
+    result = subprocess.run(
+        [sys.executable, "-c", f"import sys, {module}; print(*sys.modules, sep='\\n')"],
+        capture_output=True, text=True, check=True)
+    return set(result.stdout.split())
+
+
+@pytest.mark.parametrize("module", LAZY)
+def test_heavy_modules_load_lazily(module):
+    assert sorted(imported(module) & set(LAZY[module])) == []
@@ -0,0 +1,82 @@
+"""the vectorized solar events against astral.sun, which they replace"""
+import datetime as dt
+
+import astral.sun
+import numpy as np
+import pytest
+from astral import LocationInfo, Observer
+
+from clw import solar
+from clw.weather import _sun_times
+
+PLACES = [
+    LocationInfo("Seattle", "USA", "America/Los_Angeles", 47.61, -122.33),
+    LocationInfo("Quito", "Ecuador", "America/Guayaquil", -0.18, -78.47),
+    LocationInfo("Kolkata", "India", "Asia/Kolkata", 22.57, 88.36),
+    LocationInfo("Auckland", "New Zealand", "Pacific/Auckland", -36.85, 174.76),
+    LocationInfo("Reykjavik", "Iceland", "Atlantic/Reykjavik", 64.15, -21.94),
+    LocationInfo("Tromsø", "Norway", "Europe/Oslo", 69.65, 18.96),
+]
+# solstices, equinoxes and a leap day, away from DST changes (see solar's docstring)
+DATES = [dt.date(2025, 1, 15), dt.date(2024, 2, 29), dt.date(2025, 3, 20), dt.date(2025, 6, 21),
+         dt.date(2025, 9, 22), dt.date(2025, 12, 21)]
+TOLERANCE = solar.TOLERANCE.item()
+
+
+def astral_times(place: LocationInfo, day: dt.date, elevation: float = 0.0) -> dict:
+    """astral's events for a day, None where it finds none"""
+    observer = Observer(place.latitude, place.longitude, elevation)
+    times = {}
+    for name in solar.EVENTS:
+        try:
+            times[name] = getattr(astral.sun, name)(observer, day, tzinfo=place.tzinfo)
+        except ValueError: # the sun doesn't get there
+            times[name] = None
+    return times
+
+
+def assert_matches(times: dict, expected: dict, where: str) -> None:
+    for name in solar.EVENTS:
+        if expected[name] is None:
+            assert times[name] is None, f"{where} {name}: {times[name]}, astral has none"
+        else:
+            assert times[name] is not None, f"{where} {name}: none, astral has {expected[name]}"
+            assert abs(times[name] - expected[name]) <= TOLERANCE, f"{where} {name}"
+
+
+@pytest.mark.parametrize("place", PLACES, ids=lambda place: place.name)
+def test_sun_times_match_astral(place):
+    for day, times in zip(DATES, _sun_times(place, DATES)):
+        assert_matches(times, astral_times(place, day), f"{place.name} {day}")
+
+
+def test_sun_times_match_astral_above_sea_level():
+    denver = LocationInfo("Denver", "USA", "America/Denver", 39.74, -104.99)
+    for day, times in zip(DATES, _sun_times(denver, DATES, elevation=1609.0)):
+        assert_matches(times, astral_times(denver, day, 1609.0), f"Denver {day}")
+
+
+def test_one_call_covers_every_place_and_date():
+    latitudes = np.array([[place.latitude] for place in PLACES])
+    longitudes = np.array([[place.longitude] for place in PLACES])
+    offsets = np.array([[place.tzinfo.utcoffset(dt.datetime.combine(day, dt.time(12))).total_seconds()
+                         for day in DATES] for place in PLACES])
+    events = solar.sun_times(latitudes, longitudes, [DATES], offsets)
+
+    for i, place in enumerate(PLACES):
+        for j, day in enumerate(DATES):
+            times = {name: None if np.isnat(events[name][i, j])
+                     else events[name][i, j].item().replace(tzinfo=dt.UTC) for name in solar.EVENTS}
+            assert_matches(times, astral_times(place, day), f"{place.name} {day}")
+
+
+def test_polar_day_and_night_have_no_sunrise_or_sunset():
+    tromso = PLACES[-1]
+    summer, winter = _sun_times(tromso, [dt.date(2025, 6, 21), dt.date(2025, 12, 21)])
+    assert [summer[name] for name in ("dawn", "sunrise", "sunset", "dusk")] == [None] * 4
+    assert winter["sunrise"] is None and winter["sunset"] is None
+    assert winter["dawn"] < winter["noon"] < winter["dusk"] # civil twilight around midday
+
+    events = solar.sun_times(tromso.latitude, tromso.longitude, ["2025-06-21", "2025-12-21"])
+    assert np.isnat(events["sunrise"]).all() and np.isnat(events["sunset"]).all()
+    assert not np.isnat(events["noon"]).any()
@@ -0,0 +1,274 @@
+"""weather.py: grid cells and elevations learned from responses against stub http sessions, and the parse"""
+import datetime as dt
+import io
+import json
+
+import numpy as np
+import pytest
+import requests_cache
+import urllib3
+from astral import LocationInfo
+from openmeteo_requests.Client import OpenMeteoRequestsError
+from requests import HTTPError
+from requests.adapters import BaseAdapter, HTTPAdapter
+
+from clw.fleet import retryable
+from clw.weather import (
+    Forecast,
+    SnapshotStore,
+    SunRecord,
+    WeatherProvider,
+    WeatherSession,
+)
+
+SEATTLE = LocationInfo("Seattle", "WA", "America/Los_Angeles", 47.6062, -122.3321)
+NEARBY = LocationInfo("Pike Place", "WA", "America/Los_Angeles", 47.6097, -122.3422)
+PORTLAND = LocationInfo("Portland", "OR", "America/Los_Angeles", 45.52, -122.68)
+
+
+class StubResponse:
+    def __init__(self, data, status_code: int = 200):
+        self.data = data
+        self.status_code = status_code
+
+    def json(self):
+        return self.data
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise HTTPError(f"{self.status_code} error")
+
+
+class StubHttp:
+    """answers every forecast request from one grid cell, at elevation"""
+    def __init__(self, latitude: float, longitude: float, elevation: float):
+        self.cell = {"latitude": latitude, "longitude": longitude, "elevation": elevation}
+        self.requests = []
+        self.error = None # the api's error body, answered with a 400 when set
+
+    def get(self, url, params, **kwargs):
+        self.requests.append(params)
+        if self.error:
+            return StubResponse(self.error, 400)
+        count = len(params["latitude"].split(","))
+        return StubResponse([dict(self.cell, location_id=i) for i in range(count)])
+
+
+class Network(BaseAdapter):
+    """the api behind a real http cache, answering as StubHttp does and counting what gets this far"""
+    def __init__(self, http: StubHttp):
+        super().__init__()
+        self.http = http
+
+    def send(self, request, **kwargs):
+        self.http.requests.append(request.url)
+        body = json.dumps(self.http.cell).encode()
+        raw = urllib3.HTTPResponse(body=io.BytesIO(body), headers={"Content-Type": "application/json"},
+                                   status=200, preload_content=False, request_url=request.url)
+        return HTTPAdapter().build_response(request, raw)
+
+    def close(self):
+        pass
+
+
+def test_locations_in_a_known_cell_are_requested_once_at_the_cell():
+    http = StubHttp(47.6, -122.33, 60.0)
+    weather = WeatherSession(session=http)
+    list(weather.get_json_many([SEATTLE, NEARBY], hourly="temperature_2m"))
+    assert http.requests[-1]["latitude"] == f"{SEATTLE.latitude},{NEARBY.latitude}"
+
+    located = list(weather.get_json_many([SEATTLE, NEARBY], hourly="temperature_2m"))
+    assert (http.requests[-1]["latitude"], http.requests[-1]["longitude"]) == ("47.6", "-122.33")
+    assert [location.name for location, _ in located] == ["Seattle", "Pike Place"]
+
+
+def test_elevation_is_learned_only_at_a_location_own_coordinates():
+    http = StubHttp(47.6, -122.33, 60.0)
+    weather = WeatherSession(session=http)
+    list(weather.get_json_many([SEATTLE], hourly="temperature_2m"))
+    assert weather.elevations.get(SEATTLE.latitude, SEATTLE.longitude) == 60.0
+
+    # now requested at the cell, whose elevation isn't Seattle's
+    http.cell["elevation"] = 120.0
+    list(weather.get_json_many([SEATTLE], hourly="temperature_2m"))
+    assert weather.elevations.get(SEATTLE.latitude, SEATTLE.longitude) == 60.0
+
+
+def test_a_request_made_before_the_cell_was_known_is_cached_for_the_next_run(cache):
+    http = StubHttp(47.6, -122.33, 60.0)
+    cached = requests_cache.CachedSession(backend="memory")
+    cached.mount("https://", Network(http))
+    for _ in range(2): # a run, then the next, which asks at the cell
+        WeatherSession(session=cached).get_json(NEARBY, hourly="temperature_2m")
+    assert len(http.requests) == 1
+    assert json.loads((cache / "grid-cells.json").read_text()) == {"47.610,-122.342": [47.6, -122.33]}
+
+
+def test_an_error_body_is_raised_with_the_api_reason():
+    http = StubHttp(47.6, -122.33, 60.0)
+    http.error = {"error": True, "reason": "Latitude must be in range of -90 to 90°. Given: 147.6."}
+    with pytest.raises(OpenMeteoRequestsError, match="Latitude must be in range") as raised:
+        list(WeatherSession(session=http).get_json_many([SEATTLE, NEARBY], hourly="temperature_2m"))
+    assert not retryable(raised.value)
+
+
+def forecast_json(times: list[str], **hourly) -> dict:
+    """an open-meteo json forecast, in the units the app asks for"""
+    units = {"temperature_2m": "°F", "relative_humidity_2m": "%", "weather_code": "wmo code"}
+    return {
+        "latitude": SEATTLE.latitude, "longitude": SEATTLE.longitude, "timezone": SEATTLE.timezone,
+        "hourly_units": {"time": "iso8601"} | {name: units[name] for name in hourly},
+        "hourly": {"time": times} | hourly,
+    }
+
+
+def hours(start: str, count: int) -> list[str]:
+    first = dt.datetime.fromisoformat(start)
+    return [(first + dt.timedelta(hours=i)).strftime("%Y-%m-%dT%H:%M") for i in range(count)]
+
+
+def test_parse_weather_formats_values_with_units():
+    times = hours("2025-06-01T00:00", 24)
+    data = forecast_json(times, temperature_2m=[52.3] * 24, weather_code=[3] * 24)
+    day = WeatherProvider(None, SEATTLE).parse_weather(data)[0]
+    assert day.conditions[13]["weather_code"] == "3wmo code"
+    assert day.conditions[13]["temperature_2m"] == "52.3°F" # float32, without its noise
+
+
+def test_parse_weather_shows_nulls_as_dashes():
+    times = hours("2025-06-01T00:00", 24)
+    data = forecast_json(times, temperature_2m=[None] + [60.0] * 23, weather_code=[1] * 23 + [None])
+    day = WeatherProvider(None, SEATTLE).parse_weather(data)[0]
+    assert day.conditions[0]["temperature_2m"] == "-"
+    assert day.conditions[23]["weather_code"] == "-"
+    assert day.conditions[1]["temperature_2m"] == "60°F"
+
+
+def test_parse_weather_indexes_days_across_a_month_boundary():
+    times = hours("2025-03-30T00:00", 24 * 4)
+    data = forecast_json(times, temperature_2m=list(range(24 * 4)))
+    days = WeatherProvider(None, SEATTLE).parse_weather(data)
+    assert list(days) == [0, 1, 2, 3]
+    assert [day.date for day in days.values()] == [dt.date(2025, 3, 30), dt.date(2025, 3, 31),
+                                                   dt.date(2025, 4, 1), dt.date(2025, 4, 2)]
+    assert days[2].value(5, "temperature_2m") == 48 + 5
+
+
+def test_parse_weather_leaves_out_the_hour_skipped_for_dst():
+    # 2025-03-09 in Seattle has no 02:00, the api's local times skip it
+    times = [time for time in hours("2025-03-09T00:00", 24) if not time.endswith("T02:00")]
+    data = forecast_json(times, temperature_2m=[40.0] * 23)
+    day = WeatherProvider(None, SEATTLE).parse_weather(data)[0]
+    assert not day.present[2]
+    assert day.present.sum() == 23
+    assert 2 not in day.conditions and list(day.conditions)[:3] == [0, 1, 3]
+    with pytest.raises(KeyError):
+        day.conditions[2]
+
+
+def test_records_keep_the_accessors_of_the_dict_records():
+    times = hours("2025-06-01T00:00", 48)
+    data = forecast_json(times, temperature_2m=[50.5] * 48, relative_humidity_2m=[80] * 48, weather_code=[61] * 48)
+    day = WeatherProvider(None, SEATTLE).parse_weather(data)[0]
+    assert list(day.conditions) == list(range(24)) and len(day.conditions) == 24
+    assert dict(day.conditions[9]) == {"temperature_2m": "50.5°F", "relative_humidity_2m": "80%",
+                                       "weather_code": "61wmo code"}
+    assert day.value(9, "weather_code") == 61.0 and isinstance(day.value(9, "weather_code"), float)
+    assert day.format(9, "relative_humidity_2m") == "80%"
+    with pytest.raises(KeyError):
+        day.conditions[9]["wind_speed_10m"]
+    with pytest.raises(KeyError):
+        day.conditions[24]
+
+
+def test_add_sets_one_record_value_leaving_the_rest_of_the_forecast():
+    times = hours("2025-06-01T00:00", 48)
+    data = forecast_json(times, temperature_2m=[50.0] * 48, weather_code=[61] * 48)
+    day, tomorrow = WeatherProvider(None, SEATTLE).parse_weather(data).values()
+    day.add(dt.datetime(2025, 6, 1, 9), "weather_code", 3)
+    day.add(dt.datetime(2025, 6, 1, 9), "wind_speed_10m", 12.5, "mp/h")
+    day.add(dt.datetime(2025, 6, 1, 10), "temperature_2m", None)
+    assert dict(day.conditions[9]) == {"temperature_2m": "50°F", "weather_code": "3wmo code",
+                                       "wind_speed_10m": "12.5mp/h"}
+    assert day.conditions[10]["temperature_2m"] == "-"
+    assert day.conditions[10]["wind_speed_10m"] == "-"
+    assert dict(tomorrow.conditions[9]) == {"temperature_2m": "50°F", "weather_code": "61wmo code"}
+
+
+def test_sun_hours_index_each_event_on_its_hour():
+    sun = SunRecord.for_day(SEATTLE, dt.date(2025, 6, 21))
+    events = sun.hours()
+    assert {hour: name for hour, (name, _) in events.items()} == {
+        4: "dawn", 5: "sunrise", 13: "noon", 21: "sunset", 22: "dusk"} # dusk, 21:52, is moved past sunset
+    assert all(timestamp == getattr(sun, name) for name, timestamp in events.values())
+
+    tromso = LocationInfo("Tromsø", "Norway", "Europe/Oslo", 69.65, 18.96)
+    assert [name for name, _ in SunRecord.for_day(tromso, dt.date(2025, 6, 21)).hours().values()] == ["noon"]
+
+
+def forecast(fetched: dt.datetime | None = None) -> Forecast:
+    data = forecast_json(hours("2025-06-01T00:00", 48), temperature_2m=[50.5] * 47 + [None], weather_code=[3] * 48)
+    parsed = Forecast.from_json(data)
+    parsed.fetched = fetched
+    return parsed
+
+
+class Forecasts:
+    """a WeatherSession answering with a forecast, or failing as without a network"""
+    def __init__(self, forecast: Forecast | None):
+        self.forecast = forecast
+
+    def get(self, location, **params):
+        if self.forecast is None:
+            raise ConnectionError("no network")
+        return self.forecast
+
+
+def test_a_snapshot_loads_as_saved():
+    fetched = dt.datetime(2025, 6, 1, 8, 5, tzinfo=dt.UTC)
+    saved = forecast(fetched)
+    store = SnapshotStore()
+    store.save(SEATTLE, saved)
+
+    snapshot = store.load(SEATTLE)
+    assert snapshot.fetched == fetched and snapshot.forecast.fetched == fetched
+    assert (snapshot.forecast.times == saved.times).all()
+    assert snapshot.forecast.units == saved.units
+    for name, values in saved.values.items():
+        assert np.array_equal(snapshot.forecast.values[name], values, equal_nan=True)
+    assert store.load(PORTLAND) is None
+
+
+def test_latest_points_at_the_last_snapshot_saved_as_latest():
+    store = SnapshotStore()
+    store.save(SEATTLE, forecast())
+    store.save(PORTLAND, forecast(), latest=False) # as the fleet saves
+    assert store.load().location.name == "Seattle"
+    store.save(PORTLAND, forecast())
+    assert store.load().location == PORTLAND
+
+
+def test_an_unreadable_snapshot_is_none():
+    store = SnapshotStore()
+    store.file(SEATTLE).parent.mkdir(parents=True)
+    store.file(SEATTLE).write_bytes(b"not an npz")
+    assert store.load(SEATTLE) is None
+
+
+def test_get_daily_falls_back_to_the_snapshot_when_the_fetch_fails():
+    fetched = dt.datetime(2025, 6, 1, 8, 5, tzinfo=dt.UTC)
+    online = WeatherProvider(Forecasts(forecast(fetched)), SEATTLE)
+    assert online.get_daily()[0].format(13, "weather_code") == "3wmo code"
+    assert not online.from_snapshot
+
+    offline = WeatherProvider(Forecasts(None), SEATTLE)
+    days = offline.get_daily()
+    assert offline.from_snapshot and offline.fetched == fetched
+    assert days[1].format(23, "temperature_2m") == "-"
+
+
+def test_get_daily_raises_the_fetch_error_without_a_snapshot():
+    with pytest.raises(ConnectionError):
+        WeatherProvider(Forecasts(None), SEATTLE).get_daily()
+    with pytest.raises(LookupError):
+        WeatherProvider(None, SEATTLE, offline=True).get_daily()
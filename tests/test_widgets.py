@@ -0,0 +1,144 @@
+"""the terminal payload cache, in memory and on disk, and the icons drawn from it"""
+import asyncio
+import io
+import os
+from collections import OrderedDict
+
+import pytest
+from PIL import Image
+from rich.console import Console
+from textual.app import App
+from textual_image.renderable import HalfcellImage, UnicodeImage, tgp
+
+from clw import widgets
+from clw.widgets import (
+    PayloadCache,
+    _HalfcellIcon,
+    _SixelIcon,
+    _SixelIconImpl,
+    _TGPIcon,
+    _UnicodeIcon,
+)
+
+KEY = ("sun.png", (40, 40), "#000000")
+
+
+def sun() -> Image.Image:
+    image = Image.new("RGBA", (40, 40), (255, 200, 0, 255))
+    image.putpixel((5, 5), (0, 0, 255, 255))
+    return image
+
+
+def render(renderable) -> list:
+    console = Console(file=io.StringIO(), width=10, color_system="truecolor", force_terminal=True)
+    return list(console.render(renderable))
+
+
+def keyed(cls, payloads: PayloadCache, key: tuple = KEY):
+    """a renderable as IconImage sets one up, for an icon 4 cells wide"""
+    renderable = cls(sun(), 4, 2)
+    renderable.key, renderable.payloads = key, payloads
+    return renderable
+
+
+def test_payloads_are_encoded_once(cache):
+    payloads = PayloadCache(cache / "payloads")
+    encoded = []
+    def encode():
+        encoded.append(1)
+        return "payload"
+    assert payloads.get(("sun.png", 1), encode, persist=True) == "payload"
+    assert payloads.get(("sun.png", 1), encode, persist=True) == "payload"
+    assert PayloadCache(cache / "payloads").get(("sun.png", 1), encode, persist=True) == "payload"
+    assert len(encoded) == 1
+
+
+def test_only_persisted_payloads_are_written(cache):
+    payloads = PayloadCache(cache / "payloads")
+    payloads.get(("sun.png", 1), lambda: ["segments"])
+    assert not (cache / "payloads").exists()
+
+
+def test_least_recently_used_files_are_pruned(cache):
+    payloads = PayloadCache(cache / "payloads", max_entries=1, max_files=8)
+    for i in range(8):
+        payloads.get(("icon", i), lambda i=i: f"payload {i}", persist=True)
+        os.utime(payloads._file(("icon", i)), (i, i))
+    payloads.get(("icon", 0), lambda: "encoded again", persist=True) # read back, and touched
+    assert payloads.loads == 1
+
+    payloads.get(("icon", 8), lambda: "payload 8", persist=True) # one past the limit
+    kept = {path.read_text(encoding="ascii") for path in (cache / "payloads").iterdir()}
+    assert len(kept) == 6
+    assert {"payload 0", "payload 8"} <= kept
+    assert "payload 1" not in kept
+
+
+@pytest.mark.parametrize(("cls", "library"), [(_HalfcellIcon, HalfcellImage), (_UnicodeIcon, UnicodeImage)])
+def test_cached_renderables_draw_as_the_library_does(cls, library):
+    payloads = PayloadCache()
+    expected = render(library(sun(), 4, 2))
+    assert render(keyed(cls, payloads)) == expected
+    assert render(keyed(cls, payloads)) == expected
+    assert payloads.stats()["misses"] == 1 and payloads.stats()["hits"] == 1
+    assert render(cls(sun(), 4, 2)) == expected # without a key, as the library
+
+
+@pytest.fixture
+def terminal(monkeypatch):
+    """the TGP messages sent, instead of writing them to the terminal"""
+    sent = []
+    def send(*, payload=None, **kwargs):
+        sent.append(kwargs)
+    monkeypatch.setattr(widgets, "_send_tgp_message", send)
+    monkeypatch.setattr(tgp, "_send_tgp_message", send)
+    monkeypatch.setattr(_TGPIcon, "images", OrderedDict())
+    return sent
+
+
+def test_tgp_icons_are_sent_once_then_redrawn_as_placeholders(terminal, cache):
+    payloads = PayloadCache(cache / "payloads")
+    first = render(keyed(_TGPIcon, payloads))
+    image_id = _TGPIcon.images[next(iter(_TGPIcon.images))]
+    assert [message["i"] for message in terminal if message.get("f") == 100] == [image_id]
+    assert any(message.get("U") == 1 for message in terminal) # the virtual placement
+
+    terminal.clear()
+    assert render(keyed(_TGPIcon, payloads)) == first
+    assert terminal == []
+
+    _TGPIcon.delete_all()
+    assert terminal == [{"a": "d", "I": image_id}]
+
+
+def test_tgp_icons_past_max_images_delete_the_oldest(terminal, monkeypatch):
+    monkeypatch.setattr(_TGPIcon, "MAX_IMAGES", 1)
+    payloads = PayloadCache()
+    render(keyed(_TGPIcon, payloads))
+    oldest = next(iter(_TGPIcon.images.values()))
+    render(keyed(_TGPIcon, payloads, ("moon.png", (40, 40), "#000000")))
+    assert {"a": "d", "I": oldest} in terminal
+    assert oldest not in _TGPIcon.images.values() and len(_TGPIcon.images) == 1
+
+
+def test_sixel_icons_share_their_data(cache, monkeypatch):
+    payloads = PayloadCache(cache / "payloads")
+    monkeypatch.setattr(_SixelIcon, "payloads", payloads)
+
+    class Icons(App):
+        CSS = "_SixelIcon { width: 4; height: 2; }"
+
+    async def show():
+        app = Icons()
+        async with app.run_test(size=(20, 8)) as pilot:
+            icons = [_SixelIcon(sun()) for _ in range(3)]
+            await app.mount_all(icons)
+            for icon in icons[:2]:
+                icon.show(sun(), KEY[:2])
+            await pilot.pause()
+            return [icon.query_one(_SixelIconImpl)._cached_sixels.sixel_data for icon in icons]
+
+    cached, shared, uncached = asyncio.run(show())
+    assert cached == shared == uncached # drawn by the library
+    assert payloads.stats()["misses"] == 1 and payloads.stats()["hits"] >= 1 # once per repaint
+    assert len(list((cache / "payloads").iterdir())) == 1